@@ -8,6 +8,7 @@ const API_PROXY_URL = '';
 class ContextHandler {
     constructor() {
         this.loadedSessions = [];
+        this.sessionTurns = new Map();
         this.selectedContextSessions = [];
         this.elements = {};
         this.triggerButton = null;
@@ -85,16 +86,17 @@ class ContextHandler {
         }
 
         try {
-            const response = await fetch(`${API_PROXY_URL}/api/sessions`, {
+            const response = await fetch(`${API_PROXY_URL}/api/sessions?limit=50`, {
                 headers: { 'Authorization': `Bearer ${session.access_token}` }
             });
 
             if (!response.ok) {
-                const errorText = await response.text();
                 throw new Error(`Failed to load sessions. Server responded with status ${response.status}.`);
             }
 
-            const sessions = await response.json();
+            // The listing only carries summaries; turns are fetched when a session is opened or used.
+            const page = await response.json();
+            const sessions = page.sessions || [];
             this.loadedSessions = sessions;
             this.showSessionList(sessions);
         } catch (err) {
@@ -146,26 +148,11 @@ class ContextHandler {
         sessionItem.className = 'session-item';
         sessionItem.dataset.sessionId = session.session_id;
 
-        let sessionName = `Session ${session.session_id.substring(0, 8)}...`;
-        if (session.memory?.runs?.length > 0) {
-            const firstUserRun = session.memory.runs.find(run => run.role === 'user' && run.content && run.content.trim() !== '');
-            if (firstUserRun) {
-                let rawTitle = firstUserRun.content;
-                const marker = 'Current message:';
-                const index = rawTitle.lastIndexOf(marker);
-                if (index !== -1) {
-                    rawTitle = rawTitle.substring(index + marker.length).trim();
-                }
-                sessionName = rawTitle.split('\n')[0].trim();
-                if (sessionName.length > 45) {
-                    sessionName = sessionName.substring(0, 45) + '...';
-                }
-            }
-        }
+        const sessionName = this.getSessionName(session);
 
         const creationDate = new Date(session.created_at * 1000);
         const formattedDate = creationDate.toLocaleDateString() + ' ' + creationDate.toLocaleTimeString();
-        const messageCount = session.memory?.runs?.length || 0;
+        const messageCount = session.turn_count || 0;
 
         sessionItem.innerHTML = this.getSessionItemHTML(session, sessionName, formattedDate, messageCount);
 
@@ -179,6 +166,38 @@ class ContextHandler {
         return sessionItem;
     }
 
+    getSessionName(session) {
+        let sessionName = session.title || `Session ${session.session_id.substring(0, 8)}...`;
+        if (sessionName.length > 45) {
+            sessionName = sessionName.substring(0, 45) + '...';
+        }
+        return sessionName;
+    }
+
+    async fetchSessionTurns(session) {
+        const cacheKey = `${session.session_id}:${session.updated_at}`;
+        if (this.sessionTurns.has(cacheKey)) return this.sessionTurns.get(cacheKey);
+
+        const { data: { session: authSession } } = await supabase.auth.getSession();
+        if (!authSession) throw new Error('Please log in to view chat history.');
+
+        const turns = [];
+        let offset = 0;
+        while (offset !== null && offset !== undefined) {
+            const response = await fetch(`${API_PROXY_URL}/api/sessions/${encodeURIComponent(session.session_id)}/turns?offset=${offset}&limit=200`, {
+                headers: { 'Authorization': `Bearer ${authSession.access_token}` }
+            });
+            if (!response.ok) {
+                throw new Error(`Failed to load session. Server responded with status ${response.status}.`);
+            }
+            const page = await response.json();
+            turns.push(...page.turns);
+            offset = page.next_offset;
+        }
+        this.sessionTurns.set(cacheKey, turns);
+        return turns;
+    }
+
     getSessionItemHTML(session, sessionName, formattedDate, messageCount) {
         const checkboxId = `session-check-${session.session_id}`;
         return `
@@ -206,8 +225,14 @@ class ContextHandler {
         const useSelectedBtn = this.elements.listView.querySelector('.use-selected-btn');
         const clearBtn = this.elements.listView.querySelector('.clear-selection-btn');
 
-        useSelectedBtn?.addEventListener('click', () => {
-            const selectedData = this.getSelectedSessionsData();
+        useSelectedBtn?.addEventListener('click', async () => {
+            let selectedData;
+            try {
+                selectedData = await this.getSelectedSessionsData();
+            } catch (err) {
+                this.showNotification(err.message, 'error');
+                return;
+            }
             if (selectedData.length > 0) {
                 this.selectedContextSessions = selectedData;
                 this.toggleWindow(false);
@@ -230,7 +255,7 @@ class ContextHandler {
         }
     }
 
-    getSelectedSessionsData() {
+    async getSelectedSessionsData() {
         const selectedIds = new Set();
         this.elements.listView.querySelectorAll('.session-checkbox:checked').forEach(cb => {
             const sessionItem = cb.closest('.session-item');
@@ -239,23 +264,31 @@ class ContextHandler {
             }
         });
 
-        return this.loadedSessions
-            .filter(session => selectedIds.has(session.session_id))
-            .map(session => ({
-                interactions: session.memory.runs.map(run => ({
-                    user_input: run.role === 'user' ? run.content : '',
-                    llm_output: run.role === 'assistant' ? run.content : ''
-                }))
-            }));
+        const selectedSessions = this.loadedSessions.filter(session => selectedIds.has(session.session_id));
+        const turnsPerSession = await Promise.all(selectedSessions.map(session => this.fetchSessionTurns(session)));
+        return turnsPerSession.map(runs => ({
+            interactions: runs.map(run => ({
+                user_input: run.role === 'user' ? run.content : '',
+                llm_output: run.role === 'assistant' ? run.content : ''
+            }))
+        }));
     }
 
-    showSessionDetails(sessionId) {
+    async showSessionDetails(sessionId) {
         const session = this.loadedSessions.find(s => s.session_id === sessionId);
         if (!session || !this.elements.detailView) {
             this.showNotification('Could not find session details.', 'error');
             return;
         }
 
+        let runs;
+        try {
+            runs = await this.fetchSessionTurns(session);
+        } catch (err) {
+            this.showNotification(err.message, 'error');
+            return;
+        }
+
         const template = document.getElementById('session-detail-template');
         if (!template) return;
 
@@ -263,27 +296,13 @@ class ContextHandler {
 
         const titleElement = view.querySelector('.session-header h3');
         if (titleElement) {
-            const firstUserRun = session.memory.runs.find(run => run.role === 'user' && run.content && run.content.trim() !== '');
-            let sessionName = `Session ${session.session_id.substring(0, 8)}...`;
-            if (firstUserRun) {
-                let rawTitle = firstUserRun.content;
-                const marker = 'Current message:';
-                const index = rawTitle.lastIndexOf(marker);
-                if (index !== -1) {
-                    rawTitle = rawTitle.substring(index + marker.length).trim();
-                }
-                sessionName = rawTitle.split('\n')[0].trim();
-                if (sessionName.length > 45) {
-                    sessionName = sessionName.substring(0, 45) + '...';
-                }
-            }
-            titleElement.textContent = sessionName;
+            titleElement.textContent = this.getSessionName(session);
         }
 
         const conversationContainer = view.querySelector('.conversation-messages');
         if (!conversationContainer) return;
 
-        session.memory.runs.forEach(run => {
+        runs.forEach(run => {
             const isUser = run.role === 'user';
             const content = isUser ? run.content : run.content;
             
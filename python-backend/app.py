@@ -4,21 +4,40 @@ import os
 import logging
 import json
 import uuid
+import hmac
 import traceback
 import asyncio
+import inspect
+import functools
 import httpx  # Replaces the 'requests' library for async HTTP calls
 from pathlib import Path
-from quart import Quart, request, jsonify, redirect, url_for, session, websocket
+from quart import Quart, Response, request, jsonify, redirect, url_for, session, websocket
 from quart_cors import cors
 from dotenv import load_dotenv
 import datetime
-from typing import Union, Dict, Any, List, Tuple
+from typing import Union, Dict, Any, List, Optional, Set, Tuple
 
 from authlib.integrations.starlette_client import OAuth # Changed from flask_client to quart_client
 
 from assistant import get_llm_os
 from deepsearch import get_deepsearch
-from supabase_client import supabase_client
+from supabase_client import supabase_client, close_supabase_clients
+from auth_tokens import token_verifier
+from db_engines import pool_metrics, dispose_all
+from browser_pool import browser_pool
+from browser_tools import BrowserTools
+from stream_encoder import StreamEncoder, negotiate_encoding, stream_metrics
+from run_scheduler import RunHandle, SessionRunScheduler, STATUS_QUEUED, STATUS_REJECTED
+from attachments import AttachmentCache, TurnAttachment, new_attachment_cache
+from conversation_journal import conversation_journal
+from usage_metrics import usage_aggregator, daily_usage
+from session_summaries import list_summaries, get_turns, etag_for, etag_matches
+from context_assembler import context_assembler, SessionContextState
+from gemini_cache import gemini_context_cache
+from tool_cache import tool_result_cache
+from sandbox_client import sandbox_client
+from gmail_metadata import gmail_metadata_cache
+from gmail_index import gmail_indexes
 
 # Import all necessary event and response types
 from agno.agent import Agent
@@ -79,15 +98,47 @@ oauth.register(
     }
 )
 
+def _browser_tools_of(agent) -> List[BrowserTools]:
+    """The BrowserTools attached to a session's top-level team, if any."""
+    return [tool for tool in getattr(agent, 'tools', None) or [] if isinstance(tool, BrowserTools)]
+
+@functools.lru_cache(maxsize=None)
+def _arun_parameters(agent_cls) -> frozenset:
+    """The keyword arguments accepted by `arun`, resolved once per agent class."""
+    return frozenset(inspect.signature(agent_cls.arun).parameters)
+
 class IsolatedAssistant:
     """
-    This class is now fully asynchronous. It requires a reference to the active
-    websocket connection to send data back to the client.
+    This class is now fully asynchronous. It requires the connection's stream encoder
+    to send data back to the client.
     """
-    def __init__(self, ws):
-        self.websocket = ws
+    def __init__(self, stream: StreamEncoder, sid: str):
+        self.stream = stream
+        self.sid = sid
         self.message_id = None
         self.final_assistant_response = ""
+        self.current_run: Optional[RunHandle] = None
+        self.loop = asyncio.get_running_loop()
+        # Sends of live sandbox output; referenced here so they aren't collected mid-send.
+        self._relay_tasks: Set[asyncio.Task] = set()
+
+    def relay_sandbox_output(self, stream_name: str, data: str):
+        """
+        Forwards live sandbox output of the current message to the client. SandboxTools
+        calls this on the event loop, already batched; sending is scheduled, not awaited.
+        """
+        if self.message_id is None:
+            return
+        payload = {
+            "type": "tool_output",
+            "name": "execute_shell_command",
+            "stream": stream_name,
+            "data": data,
+            "id": self.message_id,
+        }
+        task = self.loop.create_task(self.stream.send_event(payload))
+        self._relay_tasks.add(task)
+        task.add_done_callback(self._relay_tasks.discard)
 
     async def _process_and_emit_response(self, response: Union[RunResponse, TeamRunResponse], is_top_level: bool = True):
         """
@@ -100,31 +151,38 @@ class IsolatedAssistant:
         is_final_content = is_top_level and owner_name == "Aetheria_AI"
 
         if response.content:
-            await self.websocket.send_json({
-                "content": response.content,
-                "streaming": True,
-                "id": self.message_id,
-                "agent_name": owner_name,
-                "team_name": owner_name,
-                "is_log": not is_final_content,
-            })
+            if self.current_run is not None:
+                self.current_run.output_chars += len(response.content)
+            # Deltas are coalesced by the stream encoder before they hit the socket.
+            await self.stream.send_content(self.message_id, owner_name, not is_final_content, response.content)
 
         if hasattr(response, 'member_responses') and response.member_responses:
             for member_response in response.member_responses:
                 await self._process_and_emit_response(member_response, is_top_level=False)
 
-    async def arun_safely(self, agent: Union[Agent, Team], message: str, user, context=None, images=None, audio=None, videos=None, files=None):
+    async def arun_safely(self, agent: Union[Agent, Team], message: str, user, context=None, images=None, audio=None, videos=None, files=None, run: Optional[RunHandle] = None):
         """
         This is the main async execution method, replacing the eventlet-spawned function.
+        When `run` is given, streamed output and token usage are recorded on it.
+        Returns True if the run completed, False if it failed; a cancelled run raises.
         """
+        self.current_run = run
+        metrics_before = getattr(agent, 'session_metrics', None)
+        input_tokens_before = metrics_before.input_tokens if metrics_before else 0
+        output_tokens_before = metrics_before.output_tokens if metrics_before else 0
         try:
             if context:
                 complete_message = f"Previous conversation context:\n{context}\n\nCurrent message: {message}"
             else:
                 complete_message = message
-
-            import inspect
-            params = inspect.signature(agent.arun).parameters
+            if gemini_context_cache.enabled:
+                # The team's instructions are context-cached and carry no timestamp, so the
+                # time travels with the message (ahead of the marker display_text strips to).
+                if not context:
+                    complete_message = f"Current message: {message}"
+                complete_message = f"The current time is {datetime.datetime.now()}\n\n{complete_message}"
+
+            params = _arun_parameters(type(agent))
             supported_params = {
                 'message': complete_message,
                 'stream': True,
@@ -145,8 +203,6 @@ class IsolatedAssistant:
                 if not chunk or not hasattr(chunk, 'event'):
                     continue
 
-                await asyncio.sleep(0) # Yield control to the event loop
-                
                 if (chunk.event == RunEvent.run_response_content.value or
                     chunk.event == TeamRunEvent.run_response_content.value):
                     await self._process_and_emit_response(chunk, is_top_level=True)
@@ -159,7 +215,7 @@ class IsolatedAssistant:
 
                 elif (chunk.event == RunEvent.tool_call_started.value or
                       chunk.event == TeamRunEvent.tool_call_started.value) and hasattr(chunk, 'tool'):
-                    await self.websocket.send_json({
+                    await self.stream.send_event({
                         "type": "tool_start",
                         "name": chunk.tool.tool_name,
                         "agent_name": getattr(chunk, 'agent_name', None),
@@ -169,9 +225,15 @@ class IsolatedAssistant:
 
                 elif (chunk.event == RunEvent.tool_call_completed.value or
                       chunk.event == TeamRunEvent.tool_call_completed.value) and hasattr(chunk, 'tool'):
+                    # Screenshots in binary delivery mode go out as binary frames
+                    # ahead of the tool_end event that references them.
+                    for browser in _browser_tools_of(agent):
+                        for frame in browser.screenshots.drain_frames(self.message_id):
+                            await self.stream.send_bytes(frame)
+
                     # *** CRITICAL FIX IMPLEMENTED HERE ***
                     # The full `tool` object is now included in the payload.
-                    await self.websocket.send_json({
+                    await self.stream.send_event({
                         "type": "tool_end",
                         "name": chunk.tool.tool_name,
                         "agent_name": getattr(chunk, 'agent_name', None),
@@ -180,7 +242,7 @@ class IsolatedAssistant:
                         "tool": chunk.tool.to_dict() # Serialize the tool object
                     })
 
-            await self.websocket.send_json({
+            await self.stream.send_event({
                 "content": "",
                 "done": True,
                 "id": self.message_id,
@@ -188,30 +250,51 @@ class IsolatedAssistant:
 
             if hasattr(agent, 'session_metrics') and agent.session_metrics:
                 logger.info(
-                    f"Run complete. Cumulative session tokens for SID {self.websocket.sid}: "
+                    f"Run complete. Cumulative session tokens for SID {self.sid}: "
                     f"{agent.session_metrics.input_tokens} in, "
                     f"{agent.session_metrics.output_tokens} out."
                 )
+                if run is not None:
+                    run.output_tokens = agent.session_metrics.output_tokens - output_tokens_before
             
             # This method is now synchronous as it doesn't perform I/O
-            self._save_conversation_turn(complete_message)
-
+            # Saved without the context block, so picking this session as context later
+            # does not nest it again.
+            self._save_conversation_turn(message)
+            return True
+
+        except asyncio.CancelledError:
+            # Cancelled by the client or because the session ended. Close the message
+            # for the client and let the scheduler account for the run.
+            logger.info(f"Run {self.message_id} for SID {self.sid} was cancelled.")
+            await self.stream.send_event({"content": "", "done": True, "cancelled": True, "id": self.message_id})
+            raise
         except Exception as e:
             error_msg = f"Tool error: {str(e)}\n{traceback.format_exc()}"
             logger.error(error_msg)
-            await self.websocket.send_json({
+            await self.stream.send_event({
                 "content": "An error occurred while processing your request. Starting a new session...",
                 "error": True, "done": True, "id": self.message_id,
             })
-            await self.websocket.send_json({"message": "Session reset required", "reset": True})
+            await self.stream.send_event({"message": "Session reset required", "reset": True})
+            return False
+        finally:
+            # Whatever the run consumed, including cancelled and failed runs, is billed to the user.
+            metrics_after = getattr(agent, 'session_metrics', None)
+            if metrics_after:
+                usage_aggregator.record(
+                    str(user.id),
+                    metrics_after.input_tokens - input_tokens_before,
+                    metrics_after.output_tokens - output_tokens_before,
+                )
 
     def _save_conversation_turn(self, user_message):
         # This method remains synchronous as it's just manipulating in-memory dictionaries.
         try:
             # We need a way to get the session info. Let's assume the websocket SID is used.
-            session_info = connection_manager.sessions.get(self.websocket.sid)
+            session_info = connection_manager.sessions.get(self.sid)
             if not session_info:
-                logger.warning(f"Cannot save conversation turn: no session found for SID {self.websocket.sid}")
+                logger.warning(f"Cannot save conversation turn: no session found for SID {self.sid}")
                 return
                 
             turn_data = {
@@ -230,8 +313,11 @@ class IsolatedAssistant:
                 "timestamp": datetime.datetime.now().isoformat()
             }
             session_info['history'].append(assistant_turn)
+
+            # Durable copy; the journal's flusher writes it to ai_os_sessions in the background.
+            conversation_journal.append_turns(self.sid, [turn_data, assistant_turn])
             
-            logger.info(f"Added conversation turn to history for SID {self.websocket.sid}. History length: {len(session_info['history'])}")
+            logger.info(f"Added conversation turn to history for SID {self.sid}. History length: {len(session_info['history'])}")
         except Exception as e:
             logger.error(f"Error saving conversation turn: {e}")
 
@@ -243,7 +329,7 @@ class ConnectionManager:
         self.sessions = {}
         self.isolated_assistants = {}
 
-    def create_session(self, sid: str, user_id: str, config: dict, ws, is_deepsearch: bool = False) -> Union[Agent, Team]:
+    def create_session(self, sid: str, user_id: str, config: dict, stream: StreamEncoder, is_deepsearch: bool = False) -> Union[Agent, Team]:
         if sid in self.sessions:
             # This should be awaited now
             asyncio.create_task(self.terminate_session(sid))
@@ -260,7 +346,10 @@ class ConnectionManager:
             "user_id": user_id,
             "created_at": datetime.datetime.now().isoformat(),
             "sandbox_ids": set(),
-            "active_sandbox_id": None
+            "active_sandbox_id": None,
+            "scheduler": SessionRunScheduler(sid),
+            "context_state": SessionContextState(),
+            "attachments": new_attachment_cache(),
         }
         
         if is_deepsearch:
@@ -270,9 +359,11 @@ class ConnectionManager:
 
         session_info["agent"] = agent
         self.sessions[sid] = session_info
+        conversation_journal.open_session(sid, user_id)
         
-        # Pass the websocket object to the assistant
-        self.isolated_assistants[sid] = IsolatedAssistant(ws)
+        # Pass the connection's stream encoder to the assistant
+        self.isolated_assistants[sid] = IsolatedAssistant(stream, sid)
+        session_info["sandbox_output"] = self.isolated_assistants[sid].relay_sandbox_output
         logger.info(f"Created session {sid} for user {user_id} with config {config}")
         return agent
 
@@ -280,54 +371,52 @@ class ConnectionManager:
         if sid in self.sessions:
             session_info = self.sessions.pop(sid)
             if not session_info: return
+
+            # Stop any generation in flight so we do not pay for output nobody reads.
+            scheduler = session_info.get("scheduler")
+            if scheduler:
+                await scheduler.cancel_all()
+            
+            # Delete the session's spooled attachment files.
+            attachments = session_info.get("attachments")
+            if attachments:
+                attachments.close()
             
             agent = session_info.get("agent")
-            history = session_info.get("history", [])
-            user_id = session_info.get("user_id")
 
             sandbox_ids_to_clean = session_info.get("sandbox_ids", set())
             if sandbox_ids_to_clean:
                 logger.info(f"Cleaning up {len(sandbox_ids_to_clean)} sandbox sessions for SID {sid}.")
-                sandbox_api_url = os.getenv("SANDBOX_API_URL")
-                # Use httpx for async requests
-                async with httpx.AsyncClient() as client:
-                    for sandbox_id in sandbox_ids_to_clean:
-                        try:
-                            await client.delete(f"{sandbox_api_url}/sessions/{sandbox_id}", timeout=10)
-                            logger.info(f"Successfully terminated sandbox {sandbox_id}.")
-                        except httpx.RequestError as e:
-                            logger.error(f"Failed to clean up sandbox {sandbox_id}: {e}")
-
-            if agent and hasattr(agent, 'session_metrics') and agent.session_metrics:
+                for sandbox_id in list(sandbox_ids_to_clean):
+                    try:
+                        await sandbox_client.delete_session(sandbox_id)
+                        logger.info(f"Successfully terminated sandbox {sandbox_id}.")
+                    except httpx.HTTPError as e:
+                        logger.error(f"Failed to clean up sandbox {sandbox_id}: {e}")
+
+            # Hand the session's browser server back to the warm pool.
+            for browser in _browser_tools_of(agent):
                 try:
-                    final_metrics = agent.session_metrics
-                    input_tokens, output_tokens = final_metrics.input_tokens, final_metrics.output_tokens
-                    if input_tokens > 0 or output_tokens > 0:
-                        user_id_str = str(agent.user_id) if hasattr(agent, 'user_id') else user_id
-                        # Supabase calls must be awaited
-                        await supabase_client.from_('request_logs').insert({
-                            'user_id': user_id_str, 'input_tokens': input_tokens, 'output_tokens': output_tokens
-                        }).execute()
+                    await browser.release()
                 except Exception as e:
-                    logger.error(f"Failed to log usage metrics for session {sid} on termination: {e}\n{traceback.format_exc()}")
-            
-            if history and len(history) > 0:
-                try:
-                    now = int(datetime.datetime.now().timestamp())
-                    payload = {
-                        "session_id": sid, "user_id": user_id, "agent_id": "AI_OS",
-                        "created_at": now, "updated_at": now, "memory": { "runs": history }, "session_data": {}
+                    logger.error(f"Failed to release browser for SID {sid}: {e}")
+
+            # The turns are already journaled; attach the final metrics and let the
+            # journal's flusher write the session and then drop it from the spool.
+            try:
+                session_data = {}
+                if agent and hasattr(agent, 'session_metrics') and agent.session_metrics:
+                    session_data["metrics"] = {
+                        "input_tokens": agent.session_metrics.input_tokens,
+                        "output_tokens": agent.session_metrics.output_tokens,
+                        "total_tokens": agent.session_metrics.input_tokens + agent.session_metrics.output_tokens
                     }
-                    if agent and hasattr(agent, 'session_metrics') and agent.session_metrics:
-                        payload["session_data"]["metrics"] = {
-                            "input_tokens": agent.session_metrics.input_tokens,
-                            "output_tokens": agent.session_metrics.output_tokens,
-                            "total_tokens": agent.session_metrics.input_tokens + agent.session_metrics.output_tokens
-                        }
-                    # Supabase calls must be awaited
-                    await supabase_client.from_('ai_os_sessions').upsert(payload).execute()
-                except Exception as e:
-                    logger.error(f"Failed to save conversation history for SID {sid}: {e}\n{traceback.format_exc()}")
+                if scheduler:
+                    session_data.setdefault("metrics", {})["runs"] = dict(scheduler.metrics)
+                conversation_journal.update_session_data(sid, session_data)
+                conversation_journal.close_session(sid)
+            except Exception as e:
+                logger.error(f"Failed to finalize conversation history for SID {sid}: {e}\n{traceback.format_exc()}")
             
             if sid in self.isolated_assistants:
                 self.isolated_assistants[sid].terminate()
@@ -373,11 +462,7 @@ async def auth_callback(provider):
             return "Your session has expired. Please try connecting again.", 400
         
         try:
-            # Supabase calls must be awaited
-            user_response = await supabase_client.auth.get_user(jwt=supabase_token)
-            user = user_response.user
-            if not user:
-                raise AuthApiError("User not found for the provided token.", 401)
+            user = await token_verifier.get_user(supabase_token)
         except AuthApiError as e:
             logger.error(f"Invalid token during {provider} auth callback: {e.message}")
             return "Your session is invalid. Please log in and try again.", 401
@@ -418,11 +503,8 @@ async def get_user_from_token(request):
     
     jwt = auth_header.split(' ')[1]
     try:
-        # Supabase calls must be awaited
-        user_response = await supabase_client.auth.get_user(jwt=jwt)
-        if not user_response.user:
-            raise AuthApiError("User not found for token.", 401)
-        return user_response.user, None
+        user = await token_verifier.get_user(jwt)
+        return user, None
     except AuthApiError as e:
         logger.error(f"API authentication error: {e.message}")
         return None, ('Invalid or expired token', 401)
@@ -462,24 +544,81 @@ async def disconnect_integration():
         logger.error(f"Failed to disconnect {service_to_disconnect} for user {user.id}: {e}")
         return jsonify({"error": "Failed to disconnect integration"}), 500
 
+def _conditional_json(payload, status=200):
+    """A JSON response with a weak ETag, or an empty 304 when the client's copy is current."""
+    etag = etag_for(payload)
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        response = Response("", status=304)
+    else:
+        response = jsonify(payload)
+        response.status_code = status
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _int_arg(name: str, default: int, minimum: int, maximum: int) -> int:
+    try:
+        value = int(request.args.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    return max(minimum, min(maximum, value))
+
 @app.route('/api/sessions', methods=['GET'])
 async def get_user_sessions():
     user, error = await get_user_from_token(request)
     if error:
         return jsonify({"error": error[0]}), error[1]
 
+    # Served from the compact summary rows; pages are chained with `next_cursor`.
+    limit = _int_arg('limit', 20, 1, 100)
     try:
-        # Supabase calls must be awaited
-        response = await supabase_client.from_('ai_os_sessions') \
-            .select('session_id, created_at, memory') \
-            .eq('user_id', str(user.id)) \
-            .order('created_at', desc=True) \
-            .limit(50) \
-            .execute()
-        return jsonify(response.data), 200
+        page = await list_summaries(supabase_client, str(user.id), limit, request.args.get('cursor'))
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
     except Exception as e:
         logger.error(f"Failed to get sessions for user {user.id}: {e}")
         return jsonify({"error": "Failed to retrieve session history"}), 500
+    return _conditional_json(page)
+
+@app.route('/api/sessions/<session_id>/turns', methods=['GET'])
+async def get_session_turns(session_id):
+    user, error = await get_user_from_token(request)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+
+    offset = _int_arg('offset', 0, 0, 1_000_000)
+    limit = _int_arg('limit', 50, 1, 200)
+    try:
+        page = await get_turns(supabase_client, str(user.id), session_id, offset, limit)
+    except Exception as e:
+        logger.error(f"Failed to get turns of session {session_id} for user {user.id}: {e}")
+        return jsonify({"error": "Failed to retrieve session history"}), 500
+    if page is None:
+        return jsonify({"error": "Session not found"}), 404
+    return _conditional_json(page)
+
+@app.route('/api/usage', methods=['GET'])
+async def get_daily_usage():
+    user, error = await get_user_from_token(request)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+
+    # One UTC day from the usage_daily rollup; ?day=YYYY-MM-DD, today by default.
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    try:
+        day = datetime.date.fromisoformat(request.args['day']) if 'day' in request.args else today
+    except ValueError:
+        return jsonify({"error": "Invalid day, expected YYYY-MM-DD"}), 400
+    try:
+        usage = dict(await daily_usage(str(user.id), day))
+    except Exception as e:
+        logger.error(f"Failed to get usage for user {user.id}: {e}")
+        return jsonify({"error": "Failed to retrieve usage"}), 500
+    if day == today:
+        # Runs on this worker since its last flush are not in the rollup yet.
+        for key, value in usage_aggregator.unflushed(str(user.id)).items():
+            usage[key] = (usage.get(key) or 0) + value
+    return jsonify({"day": day.isoformat(), **usage}), 200
 
 @app.route('/api/generate-upload-url', methods=['POST'])
 async def generate_upload_url():
@@ -506,33 +645,45 @@ async def generate_upload_url():
         logger.error(f"Failed to create signed URL for user {user.id}: {e}\n{traceback.format_exc()}")
         return jsonify({"error": "Could not create signed URL"}), 500
 
-async def process_files(files_data: List[Dict[str, Any]]) -> Tuple[List[Image], List[Audio], List[Video], List[File]]:
+async def process_files(files_data: List[Dict[str, Any]], attachments: AttachmentCache) -> Tuple[List[Image], List[Audio], List[Video], List[File], List[TurnAttachment]]:
     """
-    This function is now async because it downloads files from Supabase.
+    Downloads the turn's attachments concurrently through the session's AttachmentCache,
+    which streams large objects to spooled files and skips files it already holds.
+    The returned lists keep the order the client sent the files in; the last one has
+    every attachment with its name, for SandboxTools to copy into the sandbox.
     """
-    images, audio, videos, other_files = [], [], [], []
+    images, audio, videos, other_files, named = [], [], [], [], []
     logger.info(f"Processing {len(files_data)} files into agno objects")
 
+    async def fetch(file_data):
+        try:
+            return await attachments.fetch(file_data['path'])
+        except Exception as e:
+            logger.error(f"Error downloading file from Supabase Storage at path {file_data['path']}: {str(e)}")
+            return None
+
+    downloads = await asyncio.gather(*(fetch(f) for f in files_data if 'path' in f))
+    downloaded = iter(downloads)
+
     for file_data in files_data:
         file_name = file_data.get('name', 'unnamed_file')
         file_type = file_data.get('type', '')
         
         if 'path' in file_data:
-            file_path_in_bucket = file_data['path']
-            try:
-                # Supabase calls must be awaited
-                file_bytes = await supabase_client.storage.from_('media-uploads').download(file_path_in_bucket)
-                
-                if file_type.startswith('image/'):
-                    images.append(Image(content=file_bytes, name=file_name))
-                elif file_type.startswith('audio/'):
-                    audio.append(Audio(content=file_bytes, format=file_type.split('/')[-1], name=file_name))
-                elif file_type.startswith('video/'):
-                    videos.append(Video(content=file_bytes, name=file_name))
-                else:
-                    other_files.append(File(content=file_bytes, name=file_name, mime_type=file_type))
-            except Exception as e:
-                logger.error(f"Error downloading file from Supabase Storage at path {file_path_in_bucket}: {str(e)}")
+            stored = next(downloaded)
+            if stored is None:
+                continue
+            # Spooled attachments are handed to agno by path rather than read back into memory.
+            source = {"filepath": stored.filepath} if stored.filepath else {"content": stored.content}
+            named.append(TurnAttachment(name=file_name, size=stored.size, **source))
+            if file_type.startswith('image/'):
+                images.append(Image(**source, name=file_name))
+            elif file_type.startswith('audio/'):
+                audio.append(Audio(**source, format=file_type.split('/')[-1], name=file_name))
+            elif file_type.startswith('video/'):
+                videos.append(Video(**source, name=file_name))
+            else:
+                other_files.append(File(**source, name=file_name, mime_type=file_type))
             continue
 
         if file_data.get('isText') and 'content' in file_data:
@@ -540,18 +691,68 @@ async def process_files(files_data: List[Dict[str, Any]]) -> Tuple[List[Image],
                 content_bytes = file_data['content'].encode('utf-8')
                 file_obj = File(content=content_bytes, name=file_name, mime_type=file_type)
                 other_files.append(file_obj)
+                named.append(TurnAttachment(name=file_name, size=len(content_bytes), content=content_bytes))
             except Exception as e:
                 logger.error(f"Error creating File object for {file_name}: {e}")
             continue
 
-    return images, audio, videos, other_files
+    return images, audio, videos, other_files, named
+
+async def run_turn(run: RunHandle, isolated_assistant: IsolatedAssistant, agent: Union[Agent, Team],
+                   user, message: str, context: str, files_task: "asyncio.Task"):
+    """
+    One scheduled turn. The turn's context is injected only when it starts, so a
+    queued turn cannot overwrite the context of the run ahead of it. Attachments
+    start downloading when the message arrives; the turn waits for them here.
+    """
+    isolated_assistant.message_id = run.message_id
+    images, audio, videos, other_files, named_files = await files_task
+
+    # Fit the client's context into the token budget, leaving out what the team already has.
+    session_info = connection_manager.get_session(isolated_assistant.sid) or {}
+    session_info["turn_attachments"] = named_files
+    context_state = session_info.setdefault("context_state", SessionContextState())
+    assembled = context_assembler.assemble(context_state, context, session_info.get("history", []))
+    if context:
+        logger.info(
+            f"Context for run {run.message_id}: {assembled.tokens_received} tokens received, "
+            f"{assembled.tokens_sent} sent, {assembled.tokens_saved} saved "
+            f"({assembled.duplicate_turns} duplicate, {assembled.condensed_turns} condensed, {assembled.dropped_turns} dropped turns)"
+        )
+    turn_context = {
+        "user_message": message,
+        "images": images,
+        "audio": audio,
+        "videos": videos,
+        "files": other_files,
+    }
+    if agent.team_session_state is None:
+        agent.team_session_state = {}
+    agent.team_session_state['turn_context'] = turn_context
+    logger.info(f"Injected turn_context into team_session_state for SID {isolated_assistant.sid}")
+
+    completed = await isolated_assistant.arun_safely(
+        agent, message, user=user, context=assembled.text,
+        images=turn_context["images"] or None,
+        audio=turn_context["audio"] or None,
+        videos=turn_context["videos"] or None,
+        files=turn_context["files"] or None,
+        run=run,
+    )
+    # Only context the model has actually seen in a completed run is left out next time;
+    # a failed turn's context is sent again. (A cancelled run raises past this.)
+    if completed:
+        context_state.commit(assembled.fingerprints)
 
 # This new route replaces all the `@socketio.on` decorators.
 @app.websocket('/ws')
 async def ws():
     sid = str(uuid.uuid4()) # Generate a unique ID for this connection
     logger.info(f"Client connected with SID: {sid}")
-    await websocket.send_json({"message": "Connected to server"})
+    # The client picks its framing with `?encoding=json|compact|msgpack`. permessage-deflate
+    # is negotiated by uvicorn during the upgrade (`--ws-per-message-deflate` in the Dockerfile).
+    stream = StreamEncoder(websocket, encoding=negotiate_encoding(websocket.args.get("encoding")))
+    await websocket.send_json({"message": "Connected to server", **stream.hello()})
 
     try:
         # This loop runs as long as the client is connected.
@@ -561,17 +762,14 @@ async def ws():
                 data = json.loads(data_str)
                 access_token = data.get("accessToken")
                 if not access_token:
-                    await websocket.send_json({"message": "Authentication token is missing. Please log in again.", "reset": True})
+                    await stream.send_event({"message": "Authentication token is missing. Please log in again.", "reset": True})
                     continue
                 try:
-                    user_response = await supabase_client.auth.get_user(jwt=access_token)
-                    user = user_response.user
-                    if not user:
-                        raise AuthApiError("User not found for the provided token.", 401)
+                    user = await token_verifier.get_user(access_token)
                     logger.info(f"Request authenticated for user: {user.id}")
                 except AuthApiError as e:
                     logger.error(f"Invalid token for SID {sid}: {e.message}")
-                    await websocket.send_json({"message": "Your session has expired. Please log in again.", "reset": True})
+                    await stream.send_event({"message": "Your session has expired. Please log in again.", "reset": True})
                     continue
                     
                 message = data.get("message", "")
@@ -581,66 +779,124 @@ async def ws():
 
                 if data.get("type") == "terminate_session":
                     await connection_manager.terminate_session(sid)
-                    await websocket.send_json({"message": "Session terminated"})
+                    await stream.send_event({"message": "Session terminated"})
+                    continue
+
+                if data.get("type") == "cancel":
+                    session_data = connection_manager.get_session(sid)
+                    cancelled = bool(session_data) and await session_data["scheduler"].cancel(data.get("id"))
+                    await stream.send_event({"type": "cancel_ack", "id": data.get("id"), "cancelled": cancelled})
                     continue
                     
                 session_data = connection_manager.get_session(sid)
                 if not session_data:
                     config = data.get("config", {})
                     agent = connection_manager.create_session(
-                        sid, user_id=str(user.id), config=config, ws=websocket, is_deepsearch=is_deepsearch
+                        sid, user_id=str(user.id), config=config, stream=stream, is_deepsearch=is_deepsearch
                     )
                 else:
                     agent = session_data["agent"]
+                scheduler = connection_manager.get_session(sid)["scheduler"]
                     
                 message_id = data.get("id") or str(uuid.uuid4())
                 isolated_assistant = connection_manager.isolated_assistants.get(sid)
                 if not isolated_assistant:
-                    await websocket.send_json({"message": "Session error. Starting new chat...", "reset": True})
+                    await stream.send_event({"message": "Session error. Starting new chat...", "reset": True})
                     await connection_manager.terminate_session(sid)
                     continue
-                isolated_assistant.message_id = message_id
-                
-                # Process files asynchronously
-                images, audio, videos, other_files = await process_files(files)
                 
-                turn_context = {
-                    "user_message": message,
-                    "images": images,
-                    "audio": audio,
-                    "videos": videos,
-                    "files": other_files,
-                }
-
-                if agent.team_session_state is None:
-                    agent.team_session_state = {}
-                agent.team_session_state['turn_context'] = turn_context
-                logger.info(f"Injected turn_context into team_session_state for SID {sid}")
-
-                # Launch the agent's execution as a background task so it doesn't block the websocket.
-                asyncio.create_task(isolated_assistant.arun_safely(
-                    agent, message, user=user, context=context,
-                    images=images or None, 
-                    audio=audio or None, 
-                    videos=videos or None,
-                    files=other_files or None
-                ))
+                # Download attachments in the background so the socket keeps reading messages.
+                files_task = asyncio.create_task(
+                    process_files(files, connection_manager.get_session(sid)["attachments"])
+                )
+
+                # The scheduler runs the turn as a background task so it doesn't block the websocket,
+                # and keeps turns of the same session from running concurrently against one Team.
+                status = scheduler.submit(message_id, functools.partial(
+                    run_turn,
+                    isolated_assistant=isolated_assistant, agent=agent, user=user,
+                    message=message, context=context, files_task=files_task,
+                ), files_task=files_task)
+                if status == STATUS_QUEUED:
+                    await stream.send_event({"type": "queued", "id": message_id})
+                elif status == STATUS_REJECTED:
+                    await stream.send_event({
+                        "content": "Please wait for the current response to finish.",
+                        "error": True, "done": True, "busy": True, "id": message_id,
+                    })
 
             except Exception as e:
                 logger.error(f"Error in message handler: {e}\n{traceback.format_exc()}")
-                await websocket.send_json({"message": "AI service error. Starting new chat...", "reset": True})
+                await stream.send_event({"message": "AI service error. Starting new chat...", "reset": True})
                 await connection_manager.terminate_session(sid)
     finally:
         # This block runs when the client disconnects.
-        logger.info(f"Client disconnected: {sid}")
+        logger.info(f"Client disconnected: {sid}. Outbound stream stats: {stream.stats()}")
         await connection_manager.remove_session(sid)
+        await stream.close(timeout=0)
 
 
 @app.route('/healthz', methods=['GET'])
 async def health_check():
     return "OK", 200
 
+# Counters of the shared pools, caches and background writers, for sizing them. They
+# describe every user's traffic, so they are only served to operators holding
+# METRICS_TOKEN; without it the endpoint does not exist.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+METRIC_SOURCES = {
+    "db_pool": lambda: {"engines": pool_metrics()},
+    "streams": stream_metrics,
+    "browser_pool": browser_pool.metrics,
+    "journal": conversation_journal.metrics,
+    "usage": usage_aggregator.metrics,
+    "context": context_assembler.metrics,
+    "gemini_cache": gemini_context_cache.metrics,
+    "tool_cache": tool_result_cache.metrics,
+    "sandbox_client": sandbox_client.metrics,
+    "gmail_cache": gmail_metadata_cache.metrics,
+    "gmail_index": gmail_indexes.metrics,
+}
+
+@app.route('/metrics', methods=['GET'])
+async def service_metrics():
+    if not METRICS_TOKEN:
+        return jsonify({"error": "Not found"}), 404
+    auth_header = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(auth_header.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        return jsonify({"error": "Invalid metrics token"}), 401
+    # ?source=journal&source=usage limits the response to those sources.
+    names = request.args.getlist("source") or list(METRIC_SOURCES)
+    unknown = [name for name in names if name not in METRIC_SOURCES]
+    if unknown:
+        return jsonify({"error": f"Unknown metrics source: {', '.join(unknown)}"}), 400
+    return jsonify({name: METRIC_SOURCES[name]() for name in names}), 200
+
+@app.before_serving
+async def start_background_services():
+    # Start the warm browser servers in the background so startup is not delayed.
+    asyncio.create_task(browser_pool.prewarm())
+    # Load the tokenizer off the event loop; it may be downloaded on first use.
+    asyncio.create_task(asyncio.to_thread(lambda: context_assembler.counter.exact))
+    # Write out conversations a crashed worker left in the journal, then start flushing.
+    await conversation_journal.start()
+    await usage_aggregator.start()
+    await gemini_context_cache.start()
+
+@app.after_serving
+async def stop_background_services():
+    await browser_pool.shutdown()
+    await conversation_journal.stop()
+    await usage_aggregator.stop()
+    await gemini_context_cache.stop()
+    tool_result_cache.close()
+    gmail_indexes.close()
+    await sandbox_client.close()
+    # Closing pooled database connections blocks on the network; keep it off the loop.
+    await asyncio.to_thread(dispose_all)
+    await close_supabase_clients()
+
 # The `if __name__ == "__main__"` block is no longer the primary way to run the app.
 # You will now use an ASGI server like Uvicorn from the command line.
-# For example: `uvicorn app:app --host 0.0.0.0 --port 8765`
-# This is configured in your updated Dockerfile.
\ No newline at end of file
+# For example: `uvicorn app:app --host 0.0.0.0 --port 8765 --ws websockets`
+# This is configured in the Dockerfile.
\ No newline at end of file
@@ -1,6 +1,7 @@
 import os
+import copy
 import logging
-from typing import Optional, List, Dict, Any, Set, Union
+from typing import Optional, List, Dict, Any, Set, Tuple, Union
 
 # Agno Core Imports
 from agno.agent import Agent
@@ -8,10 +9,12 @@ from agno.team import Team  # Import the Team class
 from agno.memory.v2.memory import Memory as AgnoMemoryV2
 from agno.storage.postgres import PostgresStorage
 from agno.memory.v2.db.postgres import PostgresMemoryDb
-from agno.models.google import Gemini
+from cached_gemini import CachedGemini
+from gemini_cache import gemini_context_cache
 
 # Tool Imports
 from agno.tools import Toolkit
+from agno.tools.function import Function
 from agno.tools.calculator import CalculatorTools
 from agno.tools.googlesearch import GoogleSearchTools
 from agno.tools.website import WebsiteTools
@@ -25,9 +28,11 @@ from github_tools import GitHubTools
 from google_email_tools import GoogleEmailTools
 from google_drive_tools import GoogleDriveTools
 from browser_tools import BrowserTools
+from tool_cache import cache_toolkit
 
 # Other Imports
 from supabase_client import supabase_client
+from db_engines import get_engine
 
 logger = logging.getLogger(__name__)
 
@@ -38,9 +43,11 @@ class PatchedTeam(Team):
         logging.debug(f"Turn-by-turn write_to_storage for team session {session_id} is disabled by patch.")
         pass
 
-def get_llm_os(
-    user_id: Optional[str] = None,
-    session_info: Optional[Dict[str, Any]] = None,
+# Prototypes of the Aetheria AI team, keyed by the config flags that shape the tree.
+# A prototype is never run; sessions get shallow clones of it (see get_llm_os).
+_team_prototypes: Dict[Tuple[Tuple[str, bool], ...], Team] = {}
+
+def _build_llm_os_prototype(
     calculator: bool = False,
     web_crawler: bool = False,
     internet_search: bool = False,
@@ -48,12 +55,10 @@ def get_llm_os(
     investment_assistant: bool = False,
     use_memory: bool = False,
     debug_mode: bool = True,
-    enable_github: bool = False,
-    enable_google_email: bool = False,
-    enable_google_drive: bool = False,
-) -> Team:  # The factory now returns a Team instance
+) -> Team:
     """
-    Constructs the hierarchical Aetheria AI multi-agent system.
+    Constructs the user-independent part of the hierarchical Aetheria AI multi-agent system.
+    Per-user and per-session toolkits are attached later by `get_llm_os`.
     """
     # --- 1. CORE INFRASTRUCTURE SETUP (Unchanged) ---
     direct_tools: List[Toolkit] = []
@@ -61,33 +66,23 @@ def get_llm_os(
     db_url_full = os.getenv("DATABASE_URL")
     if not db_url_full:
         raise ValueError("DATABASE_URL environment variable is not set.")
-    db_url_sqlalchemy = db_url_full.replace("postgresql://", "postgresql+psycopg2://")
+    # All storage classes share one pooled engine per database and schema.
+    db_engine = get_engine(db_url_full, schema="public")
 
     if use_memory:
-        memory_db = PostgresMemoryDb(table_name="agent_memories", db_url=db_url_sqlalchemy, schema="public")
+        memory_db = PostgresMemoryDb(table_name="agent_memories", db_engine=db_engine, schema="public")
         memory = AgnoMemoryV2(db=memory_db)
     else:
         memory = None
 
-    shared_browser_tools = BrowserTools()
-
     # --- 2. DIRECT TOOL INTEGRATIONS ---
-    # These tools will be used by the top-level coordinator.
-    if enable_github and user_id:
-        # ... (github integration logic remains the same)
-        direct_tools.append(GitHubTools(user_id=user_id))
-    if (enable_google_email or enable_google_drive) and user_id:
-        # ... (google integration logic remains the same)
-        if enable_google_email:
-            direct_tools.append(GoogleEmailTools(user_id=user_id))
-        if enable_google_drive:
-            direct_tools.append(GoogleDriveTools(user_id=user_id))
+    # These tools will be used by the top-level coordinator. The per-user integrations
+    # and the browser are added per session in `get_llm_os`. Read-only lookups (search,
+    # research, market data) go through the shared tool result cache.
     if calculator:
         direct_tools.append(CalculatorTools(add=True, subtract=True, multiply=True, divide=True, exponentiate=True, factorial=True, is_prime=True, square_root=True))
     if internet_search:
-        direct_tools.append(GoogleSearchTools(fixed_max_results=15))
-
-    direct_tools.append(shared_browser_tools)
+        direct_tools.append(cache_toolkit(GoogleSearchTools(fixed_max_results=15)))
 
     # --- 3. SPECIALIST AGENT AND TEAM DEFINITIONS ---
     main_team_members: List[Union[Agent, Team]] = []
@@ -104,7 +99,7 @@ def get_llm_os(
                 "Format: 1) Goal 2) Steps (max 5) 3) Files needed 4) Expected outcome.",
                 "Keep response under 500 words."
             ],
-            model=Gemini(id="gemini-2.5-flash-lite-preview-06-17"),
+            model=CachedGemini(id="gemini-2.5-flash-lite-preview-06-17"),
             debug_mode=debug_mode
         )
 
@@ -114,13 +109,15 @@ def get_llm_os(
             role="Efficient coder implementing plans using sandbox tools. Write clean, functional code following the exact plan provided.",
             instructions=[
                 "Use files from team_session_state['turn_context']['files'] for implementation.",
+                "To work on attached files in the sandbox, call stage_attachments once; never write their contents with echo or heredocs.",
+                "Read results back with download_files rather than printing files with cat.",
                 "Follow the plan exactly. Write complete, working code.",
                 "Use sandbox tools for file operations and testing.",
                 "Output: brief summary + code files + test results.",
                 "Keep explanations under 100 words."
             ],
-            tools=[SandboxTools(session_info=session_info)] if session_info else [],
-            model=Gemini(id="gemini-2.5-flash"),
+            tools=[],  # SandboxTools is bound to the session in `get_llm_os`.
+            model=CachedGemini(id="gemini-2.5-flash"),
             debug_mode=debug_mode
         )
 
@@ -128,7 +125,7 @@ def get_llm_os(
         dev_team = Team(
             name="dev_team",
             mode="coordinate",  # Ensures a sequential Plan -> Execute -> Review workflow
-            model=Gemini(id="gemini-2.5-flash-lite-preview-06-17"),  # A stronger model for coordination
+            model=CachedGemini(id="gemini-2.5-flash-lite-preview-06-17"),  # A stronger model for coordination
             members=[code_planner, code_executor],
             instructions=[
                 "Development coordinator: Access full context from team_session_state['turn_context'].",
@@ -148,7 +145,7 @@ def get_llm_os(
             name="Crawler",
             role="Web content extractor providing structured summaries from URLs.",
             tools=[Crawl4aiTools(max_length=None)],
-            model=Gemini(id="gemini-2.5-flash-lite-preview-06-17"),
+            model=CachedGemini(id="gemini-2.5-flash-lite-preview-06-17"),
             instructions=[
                 "Check team_session_state['turn_context'] for URLs and context.",
                 "Use website scraping functions to extract detailed content from URLs.",
@@ -164,7 +161,7 @@ def get_llm_os(
             name="Deep_Crawler",
             role="Deep web content extractor providing structured summaries from URLs.",
             tools=[WebsiteTools()],
-            model=Gemini(id="gemini-2.5-flash-lite-preview-06-17"),
+            model=CachedGemini(id="gemini-2.5-flash-lite-preview-06-17"),
             instructions=[
                 "Check team_session_state['turn_context'] for URLs and context.",
                 "Use website scraping functions to extract detailed content from URLs.",
@@ -179,8 +176,8 @@ def get_llm_os(
         Arxiv_agent = Agent(
             name="Arxiv_Agent",
             role="authors publications and research papers information extractor",
-            tools=[ArxivTools()],
-            model=Gemini(id="gemini-2.5-flash-lite-preview-06-17"),
+            tools=[cache_toolkit(ArxivTools())],
+            model=CachedGemini(id="gemini-2.5-flash-lite-preview-06-17"),
             instructions=[
                 "Use team_session_state['turn_context'] for search context.",
                 "Use ArXiv functions to search and retrieve academic papers.",
@@ -195,8 +192,8 @@ def get_llm_os(
         hacker_news_agent = Agent(
             name="Hacker News Agent",
             role="HackerNews enables an Agent to search Hacker News website.",
-            tools=[HackerNewsTools()],
-            model=Gemini(id="gemini-2.5-flash-lite-preview-06-17"),
+            tools=[cache_toolkit(HackerNewsTools())],
+            model=CachedGemini(id="gemini-2.5-flash-lite-preview-06-17"),
             instructions=[
                 "Use team_session_state['turn_context'] for search context.",
                 "Use get_top_hackernews_stories to fetch trending tech stories (default 10, specify num_stories).",
@@ -211,8 +208,8 @@ def get_llm_os(
         wikipedia_agent = Agent(
             name="Wikipedia Agent",
             role="Wikipedia enables an Agent to search Wikipedia website.",
-            tools=[WikipediaTools()],
-            model=Gemini(id="gemini-2.5-flash-lite-preview-06-17"),
+            tools=[cache_toolkit(WikipediaTools())],
+            model=CachedGemini(id="gemini-2.5-flash-lite-preview-06-17"),
             instructions=[
                 "Use team_session_state['turn_context'] for search context.",
                 "Use Wikipedia functions to search and retrieve encyclopedic content.",
@@ -227,9 +224,9 @@ def get_llm_os(
         research_leader = Team(
             name="Research Agent",
             mode="coordinate",
-            model=Gemini(id="gemini-2.5-flash-lite-preview-06-17"),
+            model=CachedGemini(id="gemini-2.5-flash-lite-preview-06-17"),
             members=[wikipedia_agent, hacker_news_agent, Arxiv_agent, deep_crawler_agent, crawler_agent],
-            tools=[shared_browser_tools],
+            tools=[],  # The session's browser is attached in `get_llm_os`.
             instructions=[
                 "Research coordinator: Route queries to appropriate specialist agents based on content type.",
                 "Access team_session_state['turn_context'] for full context.",
@@ -249,8 +246,8 @@ def get_llm_os(
         investor_agent = Agent(
             name="Investor",
             role="Generate professional investment reports.",
-            tools=[YFinanceTools(stock_price=True, company_info=True, analyst_recommendations=True, company_news=True)],
-            model=Gemini(id="gemini-2.5-flash-lite-preview-06-17"),
+            tools=[cache_toolkit(YFinanceTools(stock_price=True, company_info=True, analyst_recommendations=True, company_news=True))],
+            model=CachedGemini(id="gemini-2.5-flash-lite-preview-06-17"),
             instructions=[
                 "Use team_session_state['turn_context'] for stock symbols and context.",
                 "Create professional investment reports with:",
@@ -277,7 +274,7 @@ def get_llm_os(
     # The main orchestrator is now a PatchedTeam instance
     llm_os_team = PatchedTeam(
         name="Aetheria_AI",
-        model=Gemini(id="gemini-2.5-flash"),  # A powerful model for top-level coordination
+        model=CachedGemini(id="gemini-2.5-flash"),  # A powerful model for top-level coordination
         members=main_team_members,
         mode="coordinate",
         
@@ -286,10 +283,10 @@ def get_llm_os(
         instructions=aetheria_instructions,
         
         # Pass all the original framework parameters
-        user_id=user_id,
+        user_id=None,
         storage=PostgresStorage(
             table_name="ai_os_sessions",
-            db_url=db_url_sqlalchemy,
+            db_engine=db_engine,
             schema="public",
             auto_upgrade_schema=True
         ),
@@ -301,10 +298,111 @@ def get_llm_os(
         search_knowledge=use_memory,
         read_team_history=True, # Use read_team_history for teams
         add_history_to_messages=True,
-        num_history_runs=40,
+        num_history_runs=int(os.getenv("TEAM_HISTORY_RUNS", "40")),  # Prior runs replayed verbatim each turn
         markdown=True,
-        add_datetime_to_instructions=True,
+        # A timestamp would change the instructions every turn and defeat the context
+        # cache; with caching on, the time is sent with the message instead (see app.py).
+        add_datetime_to_instructions=not gemini_context_cache.enabled,
         debug_mode=debug_mode,
     )
 
-    return llm_os_team
\ No newline at end of file
+    return llm_os_team
+
+def _clone_tool(tool: Any) -> Any:
+    """
+    A session's view of a prototype tool. On every run agno sets `_agent`/`_team`,
+    `tool_hooks` and `strict` on each Function and re-processes its entrypoint, so
+    each clone gets its own Function objects; the toolkit instance they are bound
+    to is stateless and stays shared.
+    """
+    if isinstance(tool, Toolkit):
+        clone = copy.copy(tool)
+        clone.functions = {name: function.model_copy() for name, function in tool.functions.items()}
+        return clone
+    if isinstance(tool, Function):
+        return tool.model_copy()
+    return tool
+
+def _clone_for_session(
+    member: Union[Agent, Team],
+    extra_tools: Dict[str, List[Toolkit]],
+    prepend_tools: Optional[Dict[str, List[Toolkit]]] = None,
+) -> Union[Agent, Team]:
+    """
+    Shallow-clones an agent or team from a prototype. Models and the Function
+    objects of its tools are copied so that per-run state set on them stays within
+    the session; the toolkits themselves are shared. `extra_tools` and
+    `prepend_tools` map member names to the per-session toolkits added to that
+    member's tools.
+    """
+    clone = copy.copy(member)
+    if member.model is not None:
+        clone.model = copy.copy(member.model)
+    head = (prepend_tools or {}).get(member.name, [])
+    clone.tools = head + [_clone_tool(tool) for tool in member.tools or []] + extra_tools.get(member.name, [])
+    if isinstance(member, Team):
+        clone.members = [_clone_for_session(m, extra_tools, prepend_tools) for m in member.members]
+    return clone
+
+def get_llm_os(
+    user_id: Optional[str] = None,
+    session_info: Optional[Dict[str, Any]] = None,
+    calculator: bool = False,
+    web_crawler: bool = False,
+    internet_search: bool = False,
+    coding_assistant: bool = False,
+    investment_assistant: bool = False,
+    use_memory: bool = False,
+    debug_mode: bool = True,
+    enable_github: bool = False,
+    enable_google_email: bool = False,
+    enable_google_drive: bool = False,
+) -> Team:  # The factory now returns a Team instance
+    """
+    Returns a per-session instance of the hierarchical Aetheria AI multi-agent system.
+
+    The team tree for a given set of flags is built once and cached. Each call clones
+    it and attaches the parts that belong to the user and session: user_id, session
+    state, memory, the integration toolkits, the sandbox and the browser.
+    """
+    prototype_flags = {
+        "calculator": bool(calculator),
+        "web_crawler": bool(web_crawler),
+        "internet_search": bool(internet_search),
+        "coding_assistant": bool(coding_assistant),
+        "investment_assistant": bool(investment_assistant),
+        "use_memory": bool(use_memory),
+        "debug_mode": bool(debug_mode),
+    }
+    key = tuple(sorted(prototype_flags.items()))
+    prototype = _team_prototypes.get(key)
+    if prototype is None:
+        logger.info(f"Building Aetheria AI team prototype for flags {prototype_flags}")
+        prototype = _build_llm_os_prototype(**prototype_flags)
+        _team_prototypes[key] = prototype
+
+    # --- PER-SESSION TOOLKITS ---
+    integration_tools: List[Toolkit] = []
+    if enable_github and user_id:
+        integration_tools.append(GitHubTools(user_id=user_id))
+    if enable_google_email and user_id:
+        integration_tools.append(GoogleEmailTools(user_id=user_id))
+    if enable_google_drive and user_id:
+        integration_tools.append(GoogleDriveTools(user_id=user_id))
+
+    shared_browser_tools = BrowserTools()
+    extra_tools: Dict[str, List[Toolkit]] = {
+        "Aetheria_AI": [shared_browser_tools],
+        "Research Agent": [shared_browser_tools],
+    }
+    if session_info:
+        extra_tools["Code_Executor"] = [SandboxTools(session_info=session_info)]
+
+    llm_os_team = _clone_for_session(prototype, extra_tools, {"Aetheria_AI": integration_tools})
+    llm_os_team.user_id = user_id
+    llm_os_team.session_state = None
+    llm_os_team.team_session_state = None
+    if prototype.memory is not None:
+        llm_os_team.memory = AgnoMemoryV2(db=prototype.memory.db)
+    return llm_os_team
+
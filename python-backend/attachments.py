@@ -0,0 +1,149 @@
+# python-backend/attachments.py
+
+import os
+import shutil
+import asyncio
+import logging
+import tempfile
+from dataclasses import dataclass
+from typing import Dict, Optional
+from urllib.parse import quote
+
+import httpx
+from dotenv import load_dotenv
+
+from supabase_client import http_client, supabase_url, supabase_key
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+ATTACHMENT_BUCKET = "media-uploads"
+
+# Attachments up to this size stay in memory; larger ones are spooled to disk.
+SPOOL_MAX_MEMORY = int(os.getenv("ATTACHMENT_SPOOL_MAX_MEMORY", str(8 * 1024 * 1024)))
+DOWNLOAD_CONCURRENCY = int(os.getenv("ATTACHMENT_DOWNLOAD_CONCURRENCY", "4"))
+CHUNK_SIZE = 256 * 1024
+# Large objects need longer between reads than the pool's default timeout allows.
+DOWNLOAD_TIMEOUT = httpx.Timeout(30.0, read=120.0)
+
+
+@dataclass
+class StoredAttachment:
+    """A downloaded attachment, held either in memory (`content`) or on disk (`filepath`)."""
+    path: str
+    etag: Optional[str]
+    size: int
+    content: Optional[bytes] = None
+    filepath: Optional[str] = None
+
+
+@dataclass
+class TurnAttachment:
+    """A file of the current turn as the tools see it: its name and where its bytes are."""
+    name: str
+    size: int
+    content: Optional[bytes] = None
+    filepath: Optional[str] = None
+
+
+class AttachmentCache:
+    """
+    Downloads a session's attachments from Supabase Storage and keeps them for later turns.
+
+    Objects are streamed, and anything larger than SPOOL_MAX_MEMORY is written to a
+    temporary file in the session's spool directory instead of being held as bytes.
+    A cached attachment is revalidated with If-None-Match, so a file reused on a later
+    turn costs a 304 instead of a second download. Call `close` when the session ends
+    to delete the spooled files.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        storage_url: str,
+        service_key: str,
+        bucket: str = ATTACHMENT_BUCKET,
+        concurrency: int = DOWNLOAD_CONCURRENCY,
+    ):
+        self.client = client
+        self.storage_url = storage_url.rstrip("/")
+        self.bucket = bucket
+        self.headers = {"Authorization": f"Bearer {service_key}", "apikey": service_key}
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self._entries: Dict[str, StoredAttachment] = {}
+        self._spool_dir: Optional[str] = None
+        self.stats = {"downloads": 0, "cache_hits": 0, "bytes_downloaded": 0}
+
+    def _object_url(self, path: str) -> str:
+        return f"{self.storage_url}/object/authenticated/{self.bucket}/{quote(path)}"
+
+    def _new_spool_file(self):
+        if self._spool_dir is None:
+            self._spool_dir = tempfile.mkdtemp(prefix="aios-attachments-")
+        return tempfile.NamedTemporaryFile(dir=self._spool_dir, delete=False)
+
+    async def fetch(self, path: str) -> StoredAttachment:
+        """Returns the attachment at `path` in the bucket, downloading it only if it changed."""
+        async with self.semaphore:
+            cached = self._entries.get(path)
+            headers = dict(self.headers)
+            if cached is not None and cached.etag:
+                headers["If-None-Match"] = cached.etag
+
+            async with self.client.stream("GET", self._object_url(path), headers=headers, timeout=DOWNLOAD_TIMEOUT) as response:
+                if response.status_code == 304 and cached is not None:
+                    self.stats["cache_hits"] += 1
+                    return cached
+                response.raise_for_status()
+                etag = response.headers.get("etag")
+
+                buffer = bytearray()
+                spool = None
+                size = 0
+                try:
+                    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                        size += len(chunk)
+                        if spool is None and size > SPOOL_MAX_MEMORY:
+                            spool = self._new_spool_file()
+                            await asyncio.to_thread(spool.write, bytes(buffer))
+                            buffer = bytearray()
+                        if spool is not None:
+                            await asyncio.to_thread(spool.write, chunk)
+                        else:
+                            buffer.extend(chunk)
+                finally:
+                    if spool is not None:
+                        spool.close()
+
+        self._discard(cached)
+        if spool is not None:
+            stored = StoredAttachment(path=path, etag=etag, size=size, filepath=spool.name)
+        else:
+            stored = StoredAttachment(path=path, etag=etag, size=size, content=bytes(buffer))
+        self._entries[path] = stored
+        self.stats["downloads"] += 1
+        self.stats["bytes_downloaded"] += size
+        return stored
+
+    def _discard(self, stored: Optional[StoredAttachment]):
+        if stored is not None and stored.filepath:
+            try:
+                os.remove(stored.filepath)
+            except OSError:
+                pass
+
+    def close(self):
+        self._entries.clear()
+        if self._spool_dir:
+            shutil.rmtree(self._spool_dir, ignore_errors=True)
+            self._spool_dir = None
+
+
+def new_attachment_cache() -> AttachmentCache:
+    """An AttachmentCache for one session, on the shared Supabase connection pool."""
+    return AttachmentCache(
+        client=http_client,
+        storage_url=f"{supabase_url.rstrip('/')}/storage/v1",
+        service_key=supabase_key,
+    )
+
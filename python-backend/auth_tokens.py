@@ -0,0 +1,197 @@
+# python-backend/auth_tokens.py
+
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+import jwt
+from dotenv import load_dotenv
+from gotrue.errors import AuthApiError
+
+from supabase_client import supabase_client
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+
+@dataclass
+class VerifiedUser:
+    """
+    The subset of a Supabase user that the backend relies on. It exposes `id`
+    just like the `User` object returned by `auth.get_user`, so call sites can
+    use either interchangeably.
+    """
+    id: str
+    email: Optional[str] = None
+    role: Optional[str] = None
+    claims: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class _CachedToken:
+    user: Any
+    expires_at: float
+    validated_at: float
+
+
+class SupabaseTokenVerifier:
+    """
+    Verifies Supabase access tokens locally and caches the result.
+
+    Tokens are checked for signature, expiry and audience without a network call,
+    either with the project's shared JWT secret (HS256) or with the public keys
+    published at the project's JWKS endpoint. Verified tokens are kept in a bounded
+    LRU keyed by the SHA-256 of the token until they expire. If a revalidation
+    interval is configured, cached tokens are periodically re-checked against
+    Supabase Auth so that revoked sessions are eventually rejected.
+    """
+
+    def __init__(
+        self,
+        jwt_secret: Optional[str] = None,
+        jwks_url: Optional[str] = None,
+        audience: str = "authenticated",
+        max_entries: int = 4096,
+        revalidate_interval: float = 0,
+        leeway: float = 10,
+    ):
+        self.jwt_secret = jwt_secret
+        self.audience = audience
+        self.max_entries = max_entries
+        self.revalidate_interval = revalidate_interval
+        self.leeway = leeway
+        self._jwks_client = jwt.PyJWKClient(jwks_url, cache_keys=True) if jwks_url else None
+        self._cache: "OrderedDict[str, _CachedToken]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _token_key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[_CachedToken]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.time():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry
+
+    def _cache_put(self, key: str, entry: _CachedToken):
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def invalidate(self, token: str):
+        """Drops a token from the cache, e.g. after the user logs out."""
+        self._cache.pop(self._token_key(token), None)
+
+    async def _decode_locally(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the verified claims, or None if local verification is not configured.
+        Raises AuthApiError if the token is invalid.
+        """
+        try:
+            header = jwt.get_unverified_header(token)
+            algorithm = header.get("alg", "HS256")
+            if algorithm == "HS256":
+                if not self.jwt_secret:
+                    return None
+                key = self.jwt_secret
+            else:
+                if not self._jwks_client:
+                    return None
+                # The JWKS client does blocking HTTP on a key-cache miss.
+                signing_key = await asyncio.to_thread(self._jwks_client.get_signing_key_from_jwt, token)
+                key = signing_key.key
+            return jwt.decode(
+                token,
+                key,
+                algorithms=[algorithm],
+                audience=self.audience,
+                leeway=self.leeway,
+                options={"require": ["exp", "sub"]},
+            )
+        except jwt.PyJWKClientError as e:
+            logger.warning(f"Could not load Supabase signing keys, falling back to remote verification: {e}")
+            return None
+        except jwt.ExpiredSignatureError:
+            raise AuthApiError("Token has expired.", 401)
+        except jwt.InvalidTokenError as e:
+            raise AuthApiError(f"Invalid token: {e}", 401)
+
+    async def _fetch_remote_user(self, token: str):
+        user_response = await supabase_client.auth.get_user(jwt=token)
+        if not user_response or not user_response.user:
+            raise AuthApiError("User not found for the provided token.", 401)
+        return user_response.user
+
+    async def get_user(self, token: str):
+        """
+        Returns the user for a valid access token, or raises AuthApiError.
+        The returned object always has an `id` attribute.
+        """
+        if not token:
+            raise AuthApiError("Authentication token is missing.", 401)
+
+        key = self._token_key(token)
+        now = time.time()
+        entry = self._cache_get(key)
+        if entry is not None:
+            if not self.revalidate_interval or now - entry.validated_at < self.revalidate_interval:
+                self.hits += 1
+                return entry.user
+            try:
+                await self._fetch_remote_user(token)
+            except AuthApiError:
+                self._cache.pop(key, None)
+                raise
+            entry.validated_at = now
+            self.hits += 1
+            return entry.user
+
+        self.misses += 1
+        claims = await self._decode_locally(token)
+        if claims is not None:
+            user = VerifiedUser(
+                id=claims["sub"],
+                email=claims.get("email"),
+                role=claims.get("role"),
+                claims=claims,
+            )
+            expires_at = float(claims["exp"])
+        else:
+            # Local verification is not configured, so the remote answer is the
+            # source of truth. The token's own `exp` still bounds the cache entry.
+            user = await self._fetch_remote_user(token)
+            try:
+                expires_at = float(jwt.decode(token, options={"verify_signature": False}).get("exp", 0))
+            except jwt.InvalidTokenError:
+                expires_at = 0
+
+        if expires_at > now:
+            self._cache_put(key, _CachedToken(user=user, expires_at=expires_at, validated_at=now))
+        return user
+
+
+def _build_default_verifier() -> SupabaseTokenVerifier:
+    supabase_url = os.getenv("SUPABASE_URL", "").rstrip("/")
+    jwks_url = os.getenv("SUPABASE_JWKS_URL") or (f"{supabase_url}/auth/v1/.well-known/jwks.json" if supabase_url else None)
+    return SupabaseTokenVerifier(
+        jwt_secret=os.getenv("SUPABASE_JWT_SECRET"),
+        jwks_url=jwks_url,
+        audience=os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated"),
+        max_entries=int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "4096")),
+        revalidate_interval=float(os.getenv("AUTH_REVALIDATE_SECONDS", "0")),
+    )
+
+
+token_verifier = _build_default_verifier()
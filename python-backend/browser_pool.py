@@ -0,0 +1,357 @@
+# python-backend/browser_pool.py
+
+import os
+import time
+import uuid
+import shlex
+import shutil
+import asyncio
+import logging
+import tempfile
+import contextlib
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+
+class _BrowserServer:
+    """
+    One browser-use MCP server subprocess with its own browser profile directory.
+
+    The stdio transport is entered and exited inside a dedicated task, because the
+    MCP client's cancel scopes must be closed by the task that opened them. Other
+    tasks talk to the server through `call_tool`.
+    """
+
+    def __init__(self, command: str, call_timeout: float):
+        self.id = uuid.uuid4().hex[:8]
+        self.command = command
+        self.call_timeout = call_timeout
+        self.profile_dir = tempfile.mkdtemp(prefix=f"browser-use-{self.id}-")
+        self.session: Optional[ClientSession] = None
+        self.error: Optional[BaseException] = None
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def start(self, timeout: float):
+        self._task = asyncio.create_task(self._run(), name=f"browser-server-{self.id}")
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            await self.stop()
+            raise RuntimeError(f"Browser server {self.id} did not start within {timeout}s")
+        if self.error or not self.alive:
+            await self.stop()
+            raise RuntimeError(f"Browser server {self.id} failed to start: {self.error}")
+
+    async def _run(self):
+        argv = shlex.split(self.command)
+        # Each server gets a private profile, so cookies and storage never cross sessions.
+        env = {**os.environ, "BROWSER_USE_CONFIG_DIR": self.profile_dir}
+        params = StdioServerParameters(command=argv[0], args=argv[1:], env=env)
+        try:
+            async with stdio_client(params) as (read_stream, write_stream):
+                async with ClientSession(read_stream, write_stream) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    await self._stop.wait()
+        except Exception as e:
+            self.error = e
+            logger.error(f"Browser server {self.id} exited with an error: {e}")
+        finally:
+            self.session = None
+            self._ready.set()
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> str:
+        if not self.alive:
+            raise RuntimeError(f"Browser server {self.id} is not running.")
+        self.last_used = time.monotonic()
+        result = await asyncio.wait_for(self.session.call_tool(name, arguments), self.call_timeout)
+        text = "".join(item.text for item in result.content if getattr(item, "type", None) == "text")
+        if result.isError:
+            raise RuntimeError(text or f"Browser tool '{name}' failed.")
+        return text
+
+    async def ping(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self.call_tool("browser_list_tabs", {}), timeout)
+            return True
+        except Exception:
+            return False
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            with contextlib.suppress(Exception, asyncio.CancelledError):
+                await asyncio.wait_for(self._task, 10)
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class BrowserLease:
+    """
+    Exclusive use of one warm browser server by one session.
+    Obtain it with `BrowserServerPool.acquire` and hand it back with `release`.
+    """
+
+    def __init__(self, pool: "BrowserServerPool", server: _BrowserServer, owner: Optional[str]):
+        self.pool = pool
+        self.server = server
+        self.owner = owner
+        self.acquired_at = time.monotonic()
+        self.last_used = self.acquired_at
+        self.revoked = False
+
+    @property
+    def usable(self) -> bool:
+        return not self.revoked and self.server.alive
+
+    async def call_tool(self, name: str, **arguments: Any) -> str:
+        if self.revoked:
+            raise RuntimeError("Browser lease was revoked.")
+        self.last_used = time.monotonic()
+        return await self.server.call_tool(name, arguments)
+
+
+class BrowserServerPool:
+    """
+    Keeps browser-use MCP servers started ahead of demand and leases them to sessions.
+
+    - `min_warm` servers are kept idle and ready; the pool grows up to `max_servers`.
+    - A lease gives a session its own server process and browser profile. Returned
+      servers are never handed to another session: the process and its profile are
+      discarded and the pool refills in the background. That is the only reset that
+      also clears cookies and local storage.
+    - Warm servers above `min_warm` are reaped after `idle_timeout` seconds, leases
+      unused for `lease_idle_timeout` seconds are revoked, and servers that stop
+      answering health checks are replaced.
+    """
+
+    def __init__(
+        self,
+        command: str = "uvx browser-use --mcp",
+        min_warm: int = 2,
+        max_servers: int = 8,
+        idle_timeout: float = 300,
+        lease_idle_timeout: float = 600,
+        health_interval: float = 30,
+        start_timeout: float = 90,
+        acquire_timeout: float = 60,
+        call_timeout: float = 120,
+    ):
+        self.command = command
+        self.min_warm = min_warm
+        self.max_servers = max_servers
+        self.idle_timeout = idle_timeout
+        self.lease_idle_timeout = lease_idle_timeout
+        self.health_interval = health_interval
+        self.start_timeout = start_timeout
+        self.acquire_timeout = acquire_timeout
+        self.call_timeout = call_timeout
+
+        self._warm: List[_BrowserServer] = []
+        self._leases: Dict[str, BrowserLease] = {}
+        self._starting = 0
+        self._available: Optional[asyncio.Condition] = None
+        self._maintenance_task: Optional[asyncio.Task] = None
+        self._closed = False
+        self.stats = {
+            "servers_started": 0,
+            "start_failures": 0,
+            "leases_granted": 0,
+            "cold_leases": 0,
+            "crashed_replaced": 0,
+            "idle_reaped": 0,
+            "leases_revoked": 0,
+            "total_wait_seconds": 0.0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "BrowserServerPool":
+        return cls(
+            command=os.getenv("BROWSER_MCP_COMMAND", "uvx browser-use --mcp"),
+            min_warm=int(os.getenv("BROWSER_POOL_MIN_WARM", "2")),
+            max_servers=int(os.getenv("BROWSER_POOL_MAX_SERVERS", "8")),
+            idle_timeout=float(os.getenv("BROWSER_POOL_IDLE_TIMEOUT", "300")),
+            lease_idle_timeout=float(os.getenv("BROWSER_POOL_LEASE_IDLE_TIMEOUT", "600")),
+            health_interval=float(os.getenv("BROWSER_POOL_HEALTH_INTERVAL", "30")),
+        )
+
+    @property
+    def total_servers(self) -> int:
+        return len(self._warm) + len(self._leases) + self._starting
+
+    def _ensure_started(self):
+        # The pool is created at import time, before an event loop exists,
+        # so background work starts with the first lease.
+        if self._available is None:
+            self._available = asyncio.Condition()
+        if self._maintenance_task is None or self._maintenance_task.done():
+            self._maintenance_task = asyncio.create_task(self._maintain(), name="browser-pool-maintenance")
+
+    async def _spawn(self) -> Optional[_BrowserServer]:
+        self._starting += 1
+        server = _BrowserServer(self.command, self.call_timeout)
+        try:
+            await server.start(self.start_timeout)
+            self.stats["servers_started"] += 1
+            logger.info(f"Browser server {server.id} is warm.")
+            return server
+        except Exception as e:
+            self.stats["start_failures"] += 1
+            logger.error(f"Failed to start browser server: {e}")
+            return None
+        finally:
+            self._starting -= 1
+
+    async def _spawn_warm(self):
+        server = await self._spawn()
+        if server is None:
+            return
+        if self._closed:
+            await server.stop()
+            return
+        async with self._available:
+            self._warm.append(server)
+            self._available.notify()
+
+    def _refill(self):
+        missing = self.min_warm - len(self._warm) - self._starting
+        room = self.max_servers - self.total_servers
+        for _ in range(max(0, min(missing, room))):
+            asyncio.create_task(self._spawn_warm())
+
+    async def acquire(self, owner: Optional[str] = None) -> BrowserLease:
+        """Leases a warm server, starting one if none is idle and there is room."""
+        if self._closed:
+            raise RuntimeError("Browser server pool is shut down.")
+        self._ensure_started()
+        started = time.monotonic()
+        server: Optional[_BrowserServer] = None
+
+        async with self._available:
+            while server is None:
+                while self._warm:
+                    candidate = self._warm.pop()
+                    if candidate.alive:
+                        server = candidate
+                        break
+                    self.stats["crashed_replaced"] += 1
+                    asyncio.create_task(candidate.stop())
+                if server is not None:
+                    break
+                if self.total_servers < self.max_servers:
+                    break
+                remaining = self.acquire_timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    raise RuntimeError("Timed out waiting for a free browser server.")
+                try:
+                    await asyncio.wait_for(self._available.wait(), remaining)
+                except asyncio.TimeoutError:
+                    raise RuntimeError("Timed out waiting for a free browser server.")
+
+        if server is None:
+            # Nothing warm and there is room: start one on the caller's time.
+            self.stats["cold_leases"] += 1
+            server = await self._spawn()
+            if server is None:
+                raise RuntimeError("Could not start a browser server.")
+
+        lease = BrowserLease(self, server, owner)
+        self._leases[server.id] = lease
+        self.stats["leases_granted"] += 1
+        self.stats["total_wait_seconds"] += time.monotonic() - started
+        self._refill()
+        return lease
+
+    async def release(self, lease: BrowserLease):
+        """Returns a lease. Its server is retired and a fresh one takes its place."""
+        if self._leases.pop(lease.server.id, None) is None:
+            return
+        lease.revoked = True
+        asyncio.create_task(lease.server.stop())
+        if not self._closed and self._available is not None:
+            async with self._available:
+                self._available.notify()
+            self._refill()
+
+    async def _maintain(self):
+        while not self._closed:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self._maintenance_pass()
+            except Exception as e:
+                logger.error(f"Browser pool maintenance failed: {e}", exc_info=True)
+
+    async def _maintenance_pass(self):
+        now = time.monotonic()
+
+        for lease in list(self._leases.values()):
+            if not lease.server.alive:
+                self.stats["crashed_replaced"] += 1
+                await self.release(lease)
+            elif now - lease.last_used > self.lease_idle_timeout:
+                logger.info(f"Revoking idle browser lease held by {lease.owner}.")
+                self.stats["leases_revoked"] += 1
+                await self.release(lease)
+
+        async with self._available:
+            warm, self._warm = self._warm, []
+        keep, retire = [], []
+        for server in warm:
+            if not server.alive or not await server.ping(timeout=10):
+                self.stats["crashed_replaced"] += 1
+                retire.append(server)
+            elif len(keep) >= self.min_warm and now - server.last_used > self.idle_timeout:
+                self.stats["idle_reaped"] += 1
+                retire.append(server)
+            else:
+                keep.append(server)
+        async with self._available:
+            self._warm = keep + self._warm
+        for server in retire:
+            await server.stop()
+        self._refill()
+
+    async def prewarm(self):
+        """Starts `min_warm` servers and waits until they are ready."""
+        self._ensure_started()
+        missing = max(0, self.min_warm - len(self._warm) - self._starting)
+        await asyncio.gather(*(self._spawn_warm() for _ in range(missing)))
+
+    async def shutdown(self):
+        self._closed = True
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+        servers = self._warm + [lease.server for lease in self._leases.values()]
+        for lease in self._leases.values():
+            lease.revoked = True
+        self._warm, self._leases = [], {}
+        await asyncio.gather(*(server.stop() for server in servers), return_exceptions=True)
+
+    def metrics(self) -> Dict[str, Any]:
+        granted = self.stats["leases_granted"]
+        return {
+            "warm": len(self._warm),
+            "leased": len(self._leases),
+            "starting": self._starting,
+            **self.stats,
+            "avg_wait_seconds": self.stats["total_wait_seconds"] / granted if granted else 0.0,
+        }
+
+
+browser_pool = BrowserServerPool.from_env()
+
@@ -4,7 +4,9 @@ import logging
 from typing import Any, Dict, Optional
 
 from agno.tools import Toolkit
-from agno.tools.mcp import MCPTools
+
+from browser_pool import BrowserLease, BrowserServerPool, browser_pool
+from screenshot_pipeline import ScreenshotPipeline, ScreenshotSettings
 
 # Configure a logger for this toolkit to aid in debugging.
 logger = logging.getLogger(__name__)
@@ -14,19 +16,30 @@ class BrowserTools(Toolkit):
     A state-aware toolkit that provides interactive web browsing capabilities to an agent.
 
     This toolkit acts as a client to the Browser-Use MCP (Model Context Protocol) server.
-    It starts and manages a local instance of the Browser-Use server and wraps its
+    On first use it leases a warm Browser-Use server from the shared pool, so each
+    session gets its own browser without paying for the server launch, and wraps its
     core functions (navigate, click, type) to automatically provide a screenshot and
     the page's current state after every action. This ensures that agents always have
     up-to-date visual context for their next decision.
     """
 
-    def __init__(self, **kwargs: Any):
+    def __init__(
+        self,
+        pool: Optional[BrowserServerPool] = None,
+        screenshot_settings: Optional[ScreenshotSettings] = None,
+        **kwargs: Any,
+    ):
         """
         Initializes the BrowserTools toolkit.
 
-        This sets up the connection to the Browser-Use MCP server, which is launched
-        as a local subprocess. The tools exposed to the agent are the public wrapper
-        methods defined in this class.
+        Construction is cheap: no server is leased until the agent first uses the
+        browser. The tools exposed to the agent are the public wrapper methods
+        defined in this class.
+
+        Args:
+            pool: The pool to lease Browser-Use servers from. Defaults to the process-wide pool.
+            screenshot_settings: How screenshots are downscaled, re-encoded, deduplicated
+                                 and delivered. Defaults to the SCREENSHOT_* environment settings.
         """
         # The tools list registers the public methods of this class as available
         # tools for any agent that uses this toolkit.
@@ -41,13 +54,33 @@ class BrowserTools(Toolkit):
             **kwargs,
         )
 
-        # Instantiate the MCPTools client from Agno.
-        # The `command` argument tells MCPTools to start the Browser-Use server
-        # as a subprocess and communicate with it over stdio. This is the most
-        # efficient method for locally managed tools.
-        # The lifecycle of this subprocess is automatically managed by MCPTools.
-        self.mcp_tools = MCPTools(command="uvx browser-use --mcp")
-        logger.info("BrowserTools initialized, ready to launch MCP server on first use.")
+        self.pool = pool or browser_pool
+        self._lease: Optional[BrowserLease] = None
+        self._lease_lock = asyncio.Lock()
+        self.screenshots = ScreenshotPipeline(screenshot_settings)
+        logger.info("BrowserTools initialized, ready to lease an MCP server on first use.")
+
+    async def _call_tool(self, tool_name: str, **params: Any) -> str:
+        """
+        Runs a Browser-Use MCP tool on this session's leased server, leasing one first
+        if needed. A lease that was revoked or whose server died is replaced, which
+        starts the agent on a fresh browser.
+        """
+        async with self._lease_lock:
+            if self._lease is not None and not self._lease.usable:
+                await self.pool.release(self._lease)
+                self._lease = None
+            if self._lease is None:
+                self._lease = await self.pool.acquire(owner=self.name)
+            lease = self._lease
+        return await lease.call_tool(tool_name, **params)
+
+    async def release(self):
+        """Returns the leased browser server to the pool. Called when the session ends."""
+        async with self._lease_lock:
+            if self._lease is not None:
+                await self.pool.release(self._lease)
+                self._lease = None
 
     async def _execute_and_get_state(
         self, action_tool: str, action_params: Dict[str, Any]
@@ -66,7 +99,7 @@ class BrowserTools(Toolkit):
         try:
             # 1. Execute the primary action (e.g., click a button).
             logger.info(f"Executing browser action: {action_tool} with params: {action_params}")
-            action_result = await self.mcp_tools.run_tool(action_tool, **action_params)
+            action_result = await self._call_tool(action_tool, **action_params)
             logger.info(f"Action '{action_tool}' completed. Result: {action_result}")
 
             # 2. Immediately fetch the new state of the browser.
@@ -79,8 +112,9 @@ class BrowserTools(Toolkit):
     async def get_current_state(self, action_summary: Optional[str] = None) -> Dict[str, Any]:
         """
         Gets the current state of the browser page, including the URL, title,
-        interactive elements, and a Base64-encoded screenshot. This tool is essential
-        for an agent to "see" the page before deciding on its next action.
+        interactive elements, and a screenshot. This tool is essential for an agent
+        to "see" the page before deciding on its next action. If the page looks the
+        same as in the previous state, `screenshot_unchanged` is set instead.
 
         Args:
             action_summary: An optional summary of the last action taken, to be included in the output.
@@ -92,7 +126,7 @@ class BrowserTools(Toolkit):
         try:
             # The `browser_get_state` tool from the Browser-Use MCP server is called.
             # `include_screenshot=True` is critical for our visual feedback loop.
-            state_json_str = await self.mcp_tools.run_tool(
+            state_json_str = await self._call_tool(
                 "browser_get_state", include_screenshot=True
             )
 
@@ -101,14 +135,20 @@ class BrowserTools(Toolkit):
 
             # Structure the output for clarity and consistency.
             # This dictionary is what the agent will receive as the tool's output.
-            # The frontend will later extract the 'screenshot_base64' key for display.
+            # The frontend will later extract the 'screenshot_base64' key for display,
+            # or match 'screenshot_id' against a binary frame in binary delivery mode.
             output = {
                 "summary": action_summary or "Successfully retrieved browser state.",
                 "url": state_data.get("url"),
                 "title": state_data.get("title"),
                 "interactive_elements": state_data.get("interactive_elements", []),
-                "screenshot_base64": state_data.get("screenshot"),
             }
+            try:
+                # Decoding, resizing and re-encoding would stall every connection on the loop.
+                output.update(await asyncio.to_thread(self.screenshots.process, state_data.get("screenshot")))
+            except Exception as e:
+                logger.warning(f"Could not process screenshot, sending it unchanged: {e}")
+                output["screenshot_base64"] = state_data.get("screenshot")
             logger.info(f"Successfully fetched browser state for URL: {output['url']}")
             return output
 
@@ -229,11 +269,11 @@ if __name__ == "__main__":
             print(f"   - Found {len(state.get('interactive_elements', []))} interactive elements on the results page.")
 
         finally:
-            # Gracefully close the MCP server process
-            if hasattr(browser.mcp_tools, "close"):
-                print("\n--- Shutting down MCP server ---")
-                await browser.mcp_tools.close()
-                print("--- Test complete ---")
+            # Return the server and stop the pool's MCP server processes
+            print("\n--- Shutting down MCP server ---")
+            await browser.release()
+            await browser.pool.shutdown()
+            print("--- Test complete ---")
 
     # Run the async main function
     asyncio.run(main())
\ No newline at end of file
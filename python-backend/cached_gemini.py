@@ -0,0 +1,84 @@
+# python-backend/cached_gemini.py
+
+import logging
+from typing import Any, Dict, Optional
+
+from agno.exceptions import ModelProviderError
+from agno.models.google import Gemini
+
+from gemini_cache import gemini_context_cache
+
+logger = logging.getLogger(__name__)
+
+
+class CachedGemini(Gemini):
+    """
+    Gemini that sends its system instruction and tool declarations through the
+    shared context cache (see gemini_cache.GeminiContextCache), and reports the
+    cached and uncached input tokens of every response to it.
+
+    If the provider rejects a cache before anything was streamed (it expired or
+    was deleted elsewhere), the cache is forgotten and the call is repeated uncached.
+    """
+
+    _bypass_cache: bool = False
+    _applied_cache: Optional[str] = None
+
+    def get_request_params(self, system_message: Optional[str] = None, response_format=None, tools=None) -> Dict[str, Any]:
+        params = super().get_request_params(system_message, response_format=response_format, tools=tools)
+        if self._bypass_cache:
+            self._applied_cache = None
+            return params
+        params = gemini_context_cache.apply(self.id, params)
+        config = params.get("config")
+        self._applied_cache = getattr(config, "cached_content", None) if config is not None else None
+        return params
+
+    def parse_provider_response(self, response, **kwargs):
+        gemini_context_cache.record_usage(getattr(response, "usage_metadata", None))
+        return super().parse_provider_response(response, **kwargs)
+
+    def parse_provider_response_delta(self, response_delta):
+        # Streamed chunks repeat the prompt counts; the last chunk carries the totals.
+        candidates = getattr(response_delta, "candidates", None) or []
+        if candidates and candidates[0].finish_reason is not None:
+            gemini_context_cache.record_usage(getattr(response_delta, "usage_metadata", None))
+        return super().parse_provider_response_delta(response_delta)
+
+    def _retry_uncached(self, error: ModelProviderError) -> bool:
+        if not self._applied_cache or self._bypass_cache:
+            return False
+        if error.status_code != 404 and "cache" not in str(error).lower():
+            return False
+        logger.warning(f"Context cache {self._applied_cache} was rejected, retrying uncached: {error}")
+        gemini_context_cache.invalidate(self._applied_cache)
+        return True
+
+    async def ainvoke(self, *args, **kwargs):
+        try:
+            return await super().ainvoke(*args, **kwargs)
+        except ModelProviderError as e:
+            if not self._retry_uncached(e):
+                raise
+        self._bypass_cache = True
+        try:
+            return await super().ainvoke(*args, **kwargs)
+        finally:
+            self._bypass_cache = False
+
+    async def ainvoke_stream(self, *args, **kwargs):
+        started = False
+        try:
+            async for chunk in super().ainvoke_stream(*args, **kwargs):
+                started = True
+                yield chunk
+            return
+        except ModelProviderError as e:
+            if started or not self._retry_uncached(e):
+                raise
+        self._bypass_cache = True
+        try:
+            async for chunk in super().ainvoke_stream(*args, **kwargs):
+                yield chunk
+        finally:
+            self._bypass_cache = False
@@ -0,0 +1,234 @@
+# python-backend/context_assembler.py
+
+import os
+import json
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from session_summaries import display_text
+
+try:
+    import tiktoken
+except ImportError:  # Without tiktoken, tokens are estimated at four characters each.
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+ELISION = " […]"
+
+
+class TokenCounter:
+    """
+    Counts tokens with tiktoken. Gemini's tokenizer is not public, so cl100k_base is used
+    as a close stand-in; if the encoding cannot be loaded (it is downloaded on first use)
+    the counter falls back to four characters per token.
+    """
+
+    def __init__(self, encoding_name: Optional[str] = None):
+        self.encoding_name = encoding_name or os.getenv("CONTEXT_TOKEN_ENCODING", "cl100k_base")
+        self._encoding = None
+        self._unavailable = tiktoken is None
+
+    @property
+    def exact(self) -> bool:
+        return self._load() is not None
+
+    def _load(self):
+        if self._encoding is None and not self._unavailable:
+            try:
+                self._encoding = tiktoken.get_encoding(self.encoding_name)
+            except Exception as e:
+                logger.warning(f"tiktoken encoding {self.encoding_name} unavailable, estimating tokens instead: {e}")
+                self._unavailable = True
+        return self._encoding
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        encoding = self._load()
+        if encoding is None:
+            return (len(text) + 3) // 4
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """The first `max_tokens` tokens of `text`, marked as cut if anything was removed."""
+        encoding = self._load()
+        if encoding is None:
+            limit = max(0, max_tokens * 4)
+            return text if len(text) <= limit else text[:limit].rstrip() + ELISION
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens]).rstrip() + ELISION
+
+
+@dataclass
+class ContextBudget:
+    """
+    How much client-supplied context a turn may carry.
+
+    Attributes:
+        max_tokens: Upper bound for the whole context block. Oldest turns are dropped to meet it.
+        recent_turns: The newest turns are kept verbatim.
+        older_turn_tokens: Older turns are condensed to at most this many tokens.
+    """
+    max_tokens: int = 3000
+    recent_turns: int = 6
+    older_turn_tokens: int = 120
+
+    @classmethod
+    def from_env(cls) -> "ContextBudget":
+        return cls(
+            max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", "3000")),
+            recent_turns=int(os.getenv("CONTEXT_RECENT_TURNS", "6")),
+            older_turn_tokens=int(os.getenv("CONTEXT_OLDER_TURN_TOKENS", "120")),
+        )
+
+
+@dataclass
+class AssembledContext:
+    text: str
+    tokens_received: int = 0
+    tokens_sent: int = 0
+    duplicate_turns: int = 0
+    condensed_turns: int = 0
+    dropped_turns: int = 0
+    # Turns that made it into `text`; committed to the session once the run succeeds.
+    fingerprints: List[str] = field(default_factory=list)
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.tokens_received - self.tokens_sent)
+
+
+class SessionContextState:
+    """Fingerprints of the context turns a session has already put in front of the model."""
+
+    def __init__(self):
+        self.delivered: Set[str] = set()
+
+    def commit(self, fingerprints: Iterable[str]):
+        """Records turns as delivered. Called only after the run that carried them completed."""
+        self.delivered.update(fingerprints)
+
+
+def _fingerprint(role: str, text: str) -> str:
+    return hashlib.blake2b(f"{role}\x00{' '.join(text.split())}".encode(), digest_size=12).hexdigest()
+
+
+class ContextAssembler:
+    """
+    Builds the context block for a turn from the `context` the client sends.
+
+    The client sends the sessions picked in the context window as JSON. Stored user
+    messages can themselves carry an earlier context block, so only the text after the
+    last "Current message:" marker is kept. Turns already in the session's own history,
+    or delivered with an earlier turn that completed (the team replays those through its
+    history), are left out. Of what remains, the newest `recent_turns` are kept
+    verbatim, older ones are condensed (cached by content), and the oldest are dropped
+    if the block would still exceed `max_tokens`. `assemble` does not change the
+    session's state; the caller commits `fingerprints` once the run has succeeded.
+    """
+
+    def __init__(self, budget: Optional[ContextBudget] = None, counter: Optional[TokenCounter] = None, cache_size: int = 2048):
+        self.budget = budget or ContextBudget.from_env()
+        self.counter = counter or TokenCounter()
+        self.cache_size = cache_size
+        self._condensed: "OrderedDict[str, str]" = OrderedDict()
+        self.stats = {"turns": 0, "tokens_received": 0, "tokens_sent": 0, "duplicate_turns": 0, "condensed_turns": 0, "dropped_turns": 0}
+
+    @staticmethod
+    def parse(context: str) -> List[Tuple[str, str]]:
+        """The (role, text) turns in a client context string, oldest first."""
+        try:
+            sessions = json.loads(context)
+        except (TypeError, ValueError):
+            sessions = None
+        if not isinstance(sessions, list):
+            return [("context", context.strip())] if context and context.strip() else []
+
+        turns = []
+        for session in sessions:
+            for interaction in (session or {}).get("interactions", []) if isinstance(session, dict) else []:
+                user_text = display_text(interaction.get("user_input"))
+                assistant_text = (interaction.get("llm_output") or "").strip()
+                if user_text:
+                    turns.append(("user", user_text))
+                if assistant_text:
+                    turns.append(("assistant", assistant_text))
+        return turns
+
+    def _condense(self, fingerprint: str, text: str) -> str:
+        condensed = self._condensed.get(fingerprint)
+        if condensed is not None:
+            self._condensed.move_to_end(fingerprint)
+            return condensed
+        condensed = self.counter.truncate(text, self.budget.older_turn_tokens)
+        self._condensed[fingerprint] = condensed
+        if len(self._condensed) > self.cache_size:
+            self._condensed.popitem(last=False)
+        return condensed
+
+    @staticmethod
+    def _render(role: str, text: str) -> str:
+        return text if role == "context" else f"{role.capitalize()}: {text}"
+
+    def assemble(self, state: SessionContextState, context: Optional[str], history: Iterable[Dict[str, Any]] = ()) -> AssembledContext:
+        if not context:
+            return AssembledContext(text="")
+        result = AssembledContext(text="", tokens_received=self.counter.count(context))
+
+        covered = set(state.delivered)
+        covered.update(_fingerprint(h.get("role", ""), display_text(h.get("content"))) for h in history)
+
+        fresh: List[Tuple[str, str, str]] = []
+        for role, text in self.parse(context):
+            fingerprint = _fingerprint(role, text)
+            if fingerprint in covered:
+                result.duplicate_turns += 1
+                continue
+            covered.add(fingerprint)
+            fresh.append((fingerprint, role, text))
+
+        recent_start = max(0, len(fresh) - self.budget.recent_turns)
+        lines, included = [], []
+        for index, (fingerprint, role, text) in enumerate(fresh):
+            if index < recent_start:
+                condensed = self._condense(fingerprint, text)
+                if condensed is not text:
+                    result.condensed_turns += 1
+                text = condensed
+            lines.append(self._render(role, text))
+            included.append(fingerprint)
+
+        counts = [self.counter.count(line) + 1 for line in lines]
+        total = sum(counts)
+        while len(lines) > 1 and total > self.budget.max_tokens:
+            total -= counts.pop(0)
+            lines.pop(0)
+            included.pop(0)
+            result.dropped_turns += 1
+        if lines and total > self.budget.max_tokens:
+            lines[0] = self.counter.truncate(lines[0], self.budget.max_tokens)
+
+        result.text = "\n".join(lines)
+        result.tokens_sent = self.counter.count(result.text)
+        result.fingerprints = included
+
+        self.stats["turns"] += 1
+        for key in ("tokens_received", "tokens_sent", "duplicate_turns", "condensed_turns", "dropped_turns"):
+            self.stats[key] += getattr(result, key)
+        return result
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self.stats, "tokens_saved": self.stats["tokens_received"] - self.stats["tokens_sent"], "exact_counts": self.counter.exact}
+
+
+context_assembler = ContextAssembler()
+
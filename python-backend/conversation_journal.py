@@ -0,0 +1,291 @@
+# python-backend/conversation_journal.py
+
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from session_summaries import SUMMARY_TABLE, summarize_session
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id   TEXT PRIMARY KEY,
+    user_id      TEXT,
+    agent_id     TEXT NOT NULL,
+    created_at   INTEGER NOT NULL,
+    session_data TEXT NOT NULL DEFAULT '{}',
+    version      INTEGER NOT NULL DEFAULT 0,
+    flushed      INTEGER NOT NULL DEFAULT 0,
+    closed       INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS turns (
+    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    role       TEXT NOT NULL,
+    content    TEXT,
+    timestamp  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_by_session ON turns (session_id, seq);
+"""
+
+Upsert = Callable[[List[Dict[str, Any]]], Awaitable[Any]]
+
+
+async def _supabase_upsert(rows: List[Dict[str, Any]]):
+    from supabase_client import supabase_client
+    await supabase_client.from_('ai_os_sessions').upsert(rows).execute()
+    # The sidebar lists sessions from these compact rows instead of the full history.
+    summaries = [summarize_session(row) for row in rows if row.get("user_id")]
+    if summaries:
+        await supabase_client.from_(SUMMARY_TABLE).upsert(summaries).execute()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ConversationJournal:
+    """
+    A write-behind journal for conversation history.
+
+    Every turn is appended to a local SQLite database in WAL mode before anything else
+    happens, so a conversation survives a crash of the worker. A background flusher
+    upserts the sessions that changed into `ai_os_sessions`, in one batch, every
+    `flush_interval` seconds or as soon as `flush_turns` turns are waiting. A session's
+    rows are deleted once it is closed and its last version has been flushed.
+
+    Each worker process writes its own file, `journal-<pid>.db`, in `directory`. On
+    start, the journal replays its own leftover file and those of workers that are no
+    longer running, so sessions lost in a crash are still written to Supabase.
+
+    The SQLite calls are short local transactions and run inline on the event loop;
+    only the upsert to Supabase is awaited.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        flush_interval: Optional[float] = None,
+        flush_turns: Optional[int] = None,
+        upsert: Optional[Upsert] = None,
+        agent_id: str = "AI_OS",
+    ):
+        self.directory = directory or os.getenv("CONVERSATION_JOURNAL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "journal"))
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.getenv("JOURNAL_FLUSH_SECONDS", "5"))
+        self.flush_turns = flush_turns if flush_turns is not None else int(os.getenv("JOURNAL_FLUSH_TURNS", "20"))
+        self.upsert = upsert or _supabase_upsert
+        self.agent_id = agent_id
+        self.path = os.path.join(self.directory, f"journal-{os.getpid()}.db")
+        self._db: Optional[sqlite3.Connection] = None
+        self._pending_turns = 0
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats = {"turns_appended": 0, "flushes": 0, "sessions_flushed": 0, "flush_errors": 0, "replayed_sessions": 0}
+
+    # --- Local spool ---
+
+    @staticmethod
+    def _connect(path: str) -> sqlite3.Connection:
+        db = sqlite3.connect(path, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only syncs at checkpoints: a committed turn survives a process
+        # crash, and only an OS crash or power loss can take the last few with it.
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(_SCHEMA)
+        return db
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._db = self._connect(self.path)
+        return self._db
+
+    def open_session(self, session_id: str, user_id: Optional[str]):
+        self._conn().execute(
+            "INSERT OR IGNORE INTO sessions (session_id, user_id, agent_id, created_at) VALUES (?, ?, ?, ?)",
+            (session_id, user_id, self.agent_id, int(time.time())),
+        )
+
+    def append_turns(self, session_id: str, turns: List[Dict[str, Any]]):
+        """Durably records turns (dicts with role, content and timestamp) for a session."""
+        db = self._conn()
+        with db:
+            db.execute("BEGIN")
+            db.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, agent_id, created_at) VALUES (?, ?, ?)",
+                (session_id, self.agent_id, int(time.time())),
+            )
+            db.executemany(
+                "INSERT INTO turns (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+                [(session_id, t["role"], t.get("content"), t.get("timestamp") or datetime.datetime.now().isoformat()) for t in turns],
+            )
+            db.execute("UPDATE sessions SET version = version + 1 WHERE session_id = ?", (session_id,))
+        self.stats["turns_appended"] += len(turns)
+        self._pending_turns += len(turns)
+        if self._pending_turns >= self.flush_turns:
+            self._wake.set()
+
+    def update_session_data(self, session_id: str, session_data: Dict[str, Any]):
+        self._conn().execute(
+            "UPDATE sessions SET session_data = ?, version = version + 1 WHERE session_id = ?",
+            (json.dumps(session_data, default=str), session_id),
+        )
+
+    def close_session(self, session_id: str):
+        """Marks a session finished; its rows are dropped after the next successful flush."""
+        self._conn().execute("UPDATE sessions SET closed = 1, version = version + 1 WHERE session_id = ?", (session_id,))
+        self._wake.set()
+
+    # --- Flushing ---
+
+    @staticmethod
+    def _collect(db: sqlite3.Connection):
+        sessions = db.execute(
+            "SELECT session_id, user_id, agent_id, created_at, session_data, version, closed "
+            "FROM sessions WHERE version > flushed"
+        ).fetchall()
+        rows, versions = [], []
+        now = int(time.time())
+        for session_id, user_id, agent_id, created_at, session_data, version, closed in sessions:
+            history = [
+                {"role": role, "content": content, "timestamp": timestamp}
+                for role, content, timestamp in db.execute(
+                    "SELECT role, content, timestamp FROM turns WHERE session_id = ? ORDER BY seq", (session_id,)
+                )
+            ]
+            versions.append((session_id, version, closed))
+            if not history:
+                continue  # Nothing to persist, e.g. a session closed before its first turn.
+            rows.append({
+                "session_id": session_id, "user_id": user_id, "agent_id": agent_id,
+                "created_at": created_at, "updated_at": now,
+                "memory": {"runs": history}, "session_data": json.loads(session_data),
+            })
+        return rows, versions
+
+    @staticmethod
+    def _mark_flushed(db: sqlite3.Connection, versions):
+        with db:
+            db.execute("BEGIN")
+            for session_id, version, closed in versions:
+                db.execute("UPDATE sessions SET flushed = ? WHERE session_id = ? AND flushed < ?", (version, session_id, version))
+                if closed:
+                    # Anything recorded after the snapshot bumps the version and keeps the rows.
+                    deleted = db.execute("DELETE FROM sessions WHERE session_id = ? AND version = ?", (session_id, version)).rowcount
+                    if deleted:
+                        db.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+
+    async def _flush_db(self, db: sqlite3.Connection) -> int:
+        rows, versions = self._collect(db)
+        if not versions:
+            return 0
+        if rows:
+            await self.upsert(rows)
+        self._mark_flushed(db, versions)
+        return len(rows)
+
+    async def flush(self) -> int:
+        """Upserts every session that changed since the last flush. Returns how many were written."""
+        async with self._flush_lock:
+            self._pending_turns = 0
+            try:
+                flushed = await self._flush_db(self._conn())
+            except Exception as e:
+                self.stats["flush_errors"] += 1
+                logger.error(f"Conversation journal flush failed, will retry: {e}")
+                return 0
+            if flushed:
+                self.stats["flushes"] += 1
+                self.stats["sessions_flushed"] += flushed
+            return flushed
+
+    async def _run_flusher(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not self._stopping:
+                await self.flush()
+
+    # --- Lifecycle ---
+
+    async def replay(self):
+        """Flushes journals left behind by a crashed worker, including this process's own file."""
+        if not os.path.isdir(self.directory):
+            return
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith("journal-") and name.endswith(".db")):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                pid = int(name[len("journal-"):-len(".db")])
+            except ValueError:
+                continue
+            if path != self.path and _pid_alive(pid):
+                continue
+            db = self._conn() if path == self.path else self._connect(path)
+            # Whoever owned these sessions is gone: close them all so they are written once and dropped.
+            db.execute("UPDATE sessions SET closed = 1, version = version + 1")
+            remaining = db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            try:
+                flushed = await self._flush_db(db)
+            except Exception as e:
+                logger.error(f"Could not replay conversation journal {path}: {e}")
+                if db is not self._db:
+                    db.close()
+                continue
+            self.stats["replayed_sessions"] += flushed
+            if remaining:
+                logger.info(f"Replayed {flushed} of {remaining} sessions from conversation journal {path}")
+            if db is not self._db:
+                db.close()
+                for suffix in ("", "-wal", "-shm"):
+                    try:
+                        os.remove(path + suffix)
+                    except FileNotFoundError:
+                        pass
+
+    async def start(self):
+        await self.replay()
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._run_flusher())
+
+    async def stop(self):
+        if self._flusher is not None:
+            # Wake the flusher and let it return rather than cancelling it: on Python 3.11
+            # wait_for() swallows a cancel that lands as the event fires, and the loop kept going.
+            self._stopping = True
+            self._wake.set()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+            self._stopping = False
+        await self.flush()
+
+    def metrics(self) -> Dict[str, Any]:
+        dirty = 0
+        if self._db is not None:
+            dirty = self._db.execute("SELECT COUNT(*) FROM sessions WHERE version > flushed").fetchone()[0]
+        return {**self.stats, "dirty_sessions": dirty, "pending_turns": self._pending_turns}
+
+
+conversation_journal = ConversationJournal()
+
@@ -0,0 +1,131 @@
+# python-backend/db_engines.py
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# One engine (and therefore one connection pool) per (db_url, schema) for the whole process.
+_engines: Dict[Tuple[str, str], Engine] = {}
+_pool_stats: Dict[Tuple[str, str], Dict[str, Any]] = {}
+_lock = threading.Lock()
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def sqlalchemy_url(db_url: str) -> str:
+    """Rewrites a plain `postgresql://` URL to use the psycopg2 driver."""
+    if db_url.startswith("postgresql://"):
+        return db_url.replace("postgresql://", "postgresql+psycopg2://", 1)
+    return db_url
+
+
+def _instrument(engine: Engine, stats: Dict[str, Any]):
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        stats["connects"] += 1
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        stats["checkouts"] += 1
+        connection_record.info["checked_out_at"] = time.perf_counter()
+        checked_out = engine.pool.checkedout()
+        if checked_out > stats["peak_checked_out"]:
+            stats["peak_checked_out"] = checked_out
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is not None:
+            held = time.perf_counter() - started
+            stats["checkins"] += 1
+            stats["total_hold_seconds"] += held
+            if held > stats["max_hold_seconds"]:
+                stats["max_hold_seconds"] = held
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        stats["invalidations"] += 1
+
+
+def get_engine(db_url: str, schema: str = "public") -> Engine:
+    """
+    Returns the process-wide engine for a database URL and schema, creating it on first use.
+
+    Pool sizing is read from the environment: DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE and DB_POOL_PRE_PING.
+    """
+    url = sqlalchemy_url(db_url)
+    key = (url, schema)
+    engine = _engines.get(key)
+    if engine is not None:
+        return engine
+
+    with _lock:
+        engine = _engines.get(key)
+        if engine is not None:
+            return engine
+
+        engine = create_engine(
+            url,
+            pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+            pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+            pool_pre_ping=_env_bool("DB_POOL_PRE_PING", True),
+            connect_args={"options": f"-csearch_path={schema}"},
+        )
+        stats = {
+            "connects": 0,
+            "checkouts": 0,
+            "checkins": 0,
+            "invalidations": 0,
+            "peak_checked_out": 0,
+            "total_hold_seconds": 0.0,
+            "max_hold_seconds": 0.0,
+        }
+        _instrument(engine, stats)
+        _engines[key] = engine
+        _pool_stats[key] = stats
+        logger.info(f"Created shared database engine for schema '{schema}' (pool size {engine.pool.size()}).")
+        return engine
+
+
+def pool_metrics() -> List[Dict[str, Any]]:
+    """Returns a snapshot of checkout metrics for every registered engine."""
+    snapshot = []
+    for (url, schema), engine in list(_engines.items()):
+        pool = engine.pool
+        stats = dict(_pool_stats[(url, schema)])
+        stats["avg_hold_seconds"] = stats["total_hold_seconds"] / stats["checkins"] if stats["checkins"] else 0.0
+        snapshot.append({
+            "schema": schema,
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            **stats,
+        })
+    return snapshot
+
+
+def dispose_all():
+    """Closes every pooled connection, e.g. at shutdown."""
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        _pool_stats.clear()
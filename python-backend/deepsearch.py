@@ -1,5 +1,7 @@
 from agno.agent import Agent, AgentMemory
 from agno.models.google import Gemini
+from cached_gemini import CachedGemini
+from gemini_cache import gemini_context_cache
 from agno.models.groq import Groq
 from agno.storage.json import JsonStorage
 from agno.memory.db.sqlite import SqliteMemoryDb
@@ -87,7 +89,7 @@ def get_deepsearch(
     if python_assistant:
         python = Agent(
             name="Python Assistant",
-            model=Gemini(id="gemini-2.0-flash"),
+            model=CachedGemini(id="gemini-2.0-flash"),
             tools=[PythonTools()],
             role="Python agent",
             instructions=["you can write and run python code to fulfill users request"],
@@ -100,7 +102,7 @@ def get_deepsearch(
     if web_crawler:
         crawler = Agent(
             name="Crawler",
-            model=Gemini(id="gemini-2.0-flash"),
+            model=CachedGemini(id="gemini-2.0-flash"),
             description="for the given url crawl the page and extract the text",
             tools=[Crawl4aiTools(max_length=None)],
             show_tool_calls=True,
@@ -160,7 +162,7 @@ def get_deepsearch(
                     "   - Think critically and evaluate the information you gather from different sources. Do not simply repeat information without considering its validity and reliability.",
                     ],
         team=team,
-        model=Gemini(id="gemini-2.0-flash"),
+        model=CachedGemini(id="gemini-2.0-flash"),
         reasoning=False,
         markdown=True,
         storage=JsonStorage(dir_path="storage/tmp/deepsearch_agent_sessions.json"),
@@ -169,7 +171,8 @@ def get_deepsearch(
         num_history_responses=6,
         debug_mode=debug_mode,
         show_tool_calls=True,
-        add_datetime_to_instructions=True,
+        # Sent with the message instead when the instructions are context-cached.
+        add_datetime_to_instructions=not gemini_context_cache.enabled,
     )
     
     # Return either the Agent directly or wrap it in DeepSearch
@@ -0,0 +1,292 @@
+# python-backend/gemini_cache.py
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import datetime
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+try:
+    from google import genai
+except ImportError:  # Without google-genai every request is sent uncached.
+    genai = None
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+
+@dataclass
+class CacheEntry:
+    """One static prefix (system instruction + tools) and the provider cache that holds it."""
+    key: str
+    model: str
+    name: Optional[str] = None
+    expires_at: float = 0.0
+    tokens: int = 0
+    sightings: int = 0
+    last_used: float = 0.0
+    retry_after: float = 0.0
+    creating: bool = False
+
+
+def _dump(value: Any) -> Any:
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    if isinstance(value, (list, tuple)):
+        return [_dump(v) for v in value]
+    return value
+
+
+def _expiry(cached_content, fallback: float) -> float:
+    expire_time = getattr(cached_content, "expire_time", None)
+    if isinstance(expire_time, datetime.datetime):
+        return expire_time.timestamp()
+    return fallback
+
+
+def _model_name(model: str) -> str:
+    return model if model.startswith(("models/", "publishers/", "projects/")) else f"models/{model}"
+
+
+class GeminiContextCache:
+    """
+    Keeps the static prefix of Gemini requests in the provider's context cache.
+
+    Every Aetheria_AI turn, and every member delegation, sends the same system
+    instruction and tool declarations. `apply` is called with the request parameters
+    of each Gemini call (see cached_gemini.CachedGemini). The prefix is keyed by a hash
+    of the model id, system instruction and tools; once a key has been seen
+    `min_sightings` times a cache is created for it in the background, and later calls
+    send only `cached_content` in place of the prefix. The first calls, and any prefix
+    that is below `min_tokens`, changes every turn or failed to cache (unsupported
+    model, API error), go out unchanged.
+
+    Cached prefixes are billed for storage while they live, so entries are renewed
+    `renew_before` seconds ahead of expiry only while they are in use; entries idle for
+    a whole TTL expire, and at most `max_entries` are kept (least recently used are
+    deleted first).
+    """
+
+    def __init__(
+        self,
+        client: Any = None,
+        ttl: Optional[int] = None,
+        renew_before: Optional[int] = None,
+        min_tokens: Optional[int] = None,
+        min_sightings: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        retry_after: Optional[int] = None,
+        enabled: Optional[bool] = None,
+    ):
+        self.ttl = ttl if ttl is not None else int(os.getenv("GEMINI_CACHE_TTL_SECONDS", "3600"))
+        self.renew_before = renew_before if renew_before is not None else int(os.getenv("GEMINI_CACHE_RENEW_BEFORE_SECONDS", "300"))
+        self.min_tokens = min_tokens if min_tokens is not None else int(os.getenv("GEMINI_CACHE_MIN_TOKENS", "1024"))
+        self.min_sightings = min_sightings if min_sightings is not None else int(os.getenv("GEMINI_CACHE_MIN_SIGHTINGS", "2"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", "64"))
+        self.retry_after = retry_after if retry_after is not None else int(os.getenv("GEMINI_CACHE_RETRY_SECONDS", "3600"))
+        if enabled is None:
+            enabled = os.getenv("GEMINI_CONTEXT_CACHE", "true").lower() in ("1", "true", "yes")
+        self.enabled = enabled and (client is not None or genai is not None)
+        self._client = client
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._renewer: Optional[asyncio.Task] = None
+        self.stats = {
+            "requests": 0, "cached_requests": 0, "input_tokens": 0, "cached_input_tokens": 0,
+            "caches_created": 0, "caches_renewed": 0, "caches_deleted": 0,
+            "create_errors": 0, "renew_errors": 0, "below_minimum": 0, "invalidated": 0,
+        }
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = genai.Client()
+        return self._client
+
+    @staticmethod
+    def key_for(model: str, system_instruction: Any, tools: Any, tool_config: Any = None) -> str:
+        payload = json.dumps(
+            {"model": model, "system": _dump(system_instruction), "tools": _dump(tools), "tool_config": _dump(tool_config)},
+            sort_keys=True, default=str,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @staticmethod
+    def _estimate_tokens(system_instruction: Any, tools: Any) -> int:
+        # Four characters per token; only used to skip prefixes the API would refuse.
+        return len(json.dumps([_dump(system_instruction), _dump(tools)], default=str)) // 4
+
+    def apply(self, model: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Request parameters for one Gemini call, with the static prefix replaced by its
+        cache when one is live. Never blocks; caches are created in the background.
+        """
+        config = params.get("config")
+        if not self.enabled or config is None or getattr(config, "cached_content", None):
+            return params
+        system_instruction = getattr(config, "system_instruction", None)
+        tools = getattr(config, "tools", None)
+        tool_config = getattr(config, "tool_config", None)
+        if system_instruction is None and not tools:
+            return params
+
+        now = time.time()
+        key = self.key_for(model, system_instruction, tools, tool_config)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = CacheEntry(key=key, model=model)
+            self._evict()
+        self._entries.move_to_end(key)
+        entry.sightings += 1
+        entry.last_used = now
+
+        if entry.name and entry.expires_at - now > self.renew_before / 2:
+            return {**params, "config": config.model_copy(update={
+                "system_instruction": None, "tools": None, "tool_config": None, "cached_content": entry.name,
+            })}
+
+        if not entry.creating and entry.sightings >= self.min_sightings and now >= entry.retry_after:
+            if self._estimate_tokens(system_instruction, tools) < self.min_tokens:
+                self.stats["below_minimum"] += 1
+                entry.retry_after = float("inf")
+            else:
+                entry.creating = self._schedule(self._create(entry, system_instruction, tools, tool_config))
+        return params
+
+    def _schedule(self, coro) -> bool:
+        try:
+            asyncio.get_running_loop().create_task(coro)
+        except RuntimeError:
+            # A synchronous model call from a worker thread.
+            if self._loop is None or not self._loop.is_running():
+                coro.close()
+                return False
+            asyncio.run_coroutine_threadsafe(coro, self._loop)
+        return True
+
+    async def _create(self, entry: CacheEntry, system_instruction: Any, tools: Any, tool_config: Any):
+        config = {"ttl": f"{self.ttl}s", "display_name": f"aios-{entry.key[:16]}"}
+        if system_instruction is not None:
+            config["system_instruction"] = system_instruction
+        if tools:
+            config["tools"] = tools
+        if tool_config is not None:
+            config["tool_config"] = tool_config
+        try:
+            cached = await self.client.aio.caches.create(model=_model_name(entry.model), config=config)
+        except Exception as e:
+            self.stats["create_errors"] += 1
+            entry.retry_after = time.time() + self.retry_after
+            logger.warning(f"Context cache for {entry.model} unavailable, sending the prefix uncached: {e}")
+            return
+        finally:
+            entry.creating = False
+        if self._entries.get(entry.key) is not entry:
+            # Evicted while it was being created.
+            await self._delete(cached.name)
+            return
+        entry.name = cached.name
+        entry.expires_at = _expiry(cached, time.time() + self.ttl)
+        usage = getattr(cached, "usage_metadata", None)
+        entry.tokens = getattr(usage, "total_token_count", None) or 0
+        self.stats["caches_created"] += 1
+        logger.info(f"Created context cache {entry.name} for {entry.model} ({entry.tokens} tokens)")
+
+    async def _delete(self, name: str):
+        try:
+            await self.client.aio.caches.delete(name=name)
+            self.stats["caches_deleted"] += 1
+        except Exception as e:
+            logger.warning(f"Failed to delete context cache {name}: {e}")
+
+    def _evict(self):
+        # Prefixes that change every turn are tracked too, so this also bounds those.
+        while len(self._entries) > self.max_entries:
+            _, entry = self._entries.popitem(last=False)
+            if entry.name:
+                self._schedule(self._delete(entry.name))
+
+    def invalidate(self, name: str):
+        """Forgets a cache the provider no longer honours; the next call recreates it."""
+        for entry in self._entries.values():
+            if entry.name == name:
+                entry.name = None
+                entry.expires_at = 0.0
+                self.stats["invalidated"] += 1
+
+    async def renew(self):
+        """Extends caches that are close to expiry and were used within the last TTL."""
+        now = time.time()
+        for key, entry in list(self._entries.items()):
+            if not entry.name:
+                continue
+            if entry.expires_at <= now:
+                entry.name = None
+                continue
+            if entry.expires_at - now > self.renew_before:
+                continue
+            if now - entry.last_used > self.ttl:
+                # Idle: let it expire rather than pay to keep it.
+                continue
+            try:
+                cached = await self.client.aio.caches.update(name=entry.name, config={"ttl": f"{self.ttl}s"})
+                entry.expires_at = _expiry(cached, now + self.ttl)
+                self.stats["caches_renewed"] += 1
+            except Exception as e:
+                self.stats["renew_errors"] += 1
+                logger.warning(f"Failed to renew context cache {entry.name}, dropping it: {e}")
+                entry.name = None
+
+    async def _run_renewer(self):
+        interval = max(0.1, self.renew_before / 4)
+        while True:
+            await asyncio.sleep(interval)
+            await self.renew()
+
+    def record_usage(self, usage) -> None:
+        """Adds one response's usage_metadata to the cached/uncached input token counts."""
+        if usage is None:
+            return
+        prompt = getattr(usage, "prompt_token_count", None) or 0
+        cached = getattr(usage, "cached_content_token_count", None) or 0
+        self.stats["requests"] += 1
+        self.stats["input_tokens"] += prompt
+        self.stats["cached_input_tokens"] += cached
+        if cached:
+            self.stats["cached_requests"] += 1
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        if self.enabled and self._renewer is None:
+            self._renewer = asyncio.create_task(self._run_renewer())
+
+    async def stop(self):
+        if self._renewer is not None:
+            self._renewer.cancel()
+            await asyncio.gather(self._renewer, return_exceptions=True)
+            self._renewer = None
+        # Caches are billed until they expire; nobody else will use this worker's.
+        names = [entry.name for entry in self._entries.values() if entry.name]
+        self._entries.clear()
+        await asyncio.gather(*(self._delete(name) for name in names))
+
+    def metrics(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "uncached_input_tokens": self.stats["input_tokens"] - self.stats["cached_input_tokens"],
+            "live_caches": sum(1 for e in self._entries.values() if e.name and e.expires_at > now),
+            "cached_prefix_tokens": sum(e.tokens for e in self._entries.values() if e.name and e.expires_at > now),
+            "tracked_prefixes": len(self._entries),
+        }
+
+
+gemini_context_cache = GeminiContextCache()
@@ -6,7 +6,7 @@ from typing import List, Optional
 from agno.tools import Toolkit
 from github import Github, GithubException
 
-from supabase_client import supabase_client
+from supabase_client import supabase_sync
 
 logger = logging.getLogger(__name__)
 
@@ -32,24 +32,29 @@ class GitHubTools(Toolkit):
         self._access_token: Optional[str] = None
         self._token_fetched = False
 
+    def _token_query(self, client):
+        return (
+            client.from_("user_integrations")
+            .select("access_token").eq("user_id", self.user_id).eq("service", "github")
+            .maybe_single().execute()
+        )
+
     def _get_access_token(self) -> Optional[str]:
-        # This method is unchanged and remains the same.
+        # Fetched once per toolkit, on first use. Tools run in a worker thread, so the
+        # facade's blocking call never holds up the event loop. No row: not connected.
         if self._token_fetched:
             return self._access_token
         try:
-            response = (
-                supabase_client.from_("user_integrations")
-                .select("access_token").eq("user_id", self.user_id).eq("service", "github")
-                .single().execute()
-            )
-            if response.data and response.data.get("access_token"):
+            response = supabase_sync.run(self._token_query)
+            if response is not None and response.data and response.data.get("access_token"):
                 self._access_token = response.data["access_token"]
             else:
                 self._access_token = None
+            self._token_fetched = True
         except Exception as e:
             logger.error(f"Error fetching GitHub token for user {self.user_id}: {e}")
             self._access_token = None
-        self._token_fetched = True
+            self._token_fetched = True
         return self._access_token
 
     def _get_client(self) -> Optional[Github]:
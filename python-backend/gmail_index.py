@@ -0,0 +1,601 @@
+# python-backend/gmail_index.py
+
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import datetime
+import threading
+import contextlib
+import concurrent.futures
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from dotenv import load_dotenv
+from googleapiclient.errors import HttpError
+
+from gmail_metadata import MessageMetadata, fetch_labelled
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# Off by default: the index keeps a copy of every indexed user's mail headers on this host.
+ENABLED = os.getenv("GMAIL_INDEX_ENABLED", "false").lower() in ("1", "true", "yes")
+INDEX_DIR = os.getenv("GMAIL_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "gmail_index"))
+# Newest messages fetched when a user's index is first built.
+INITIAL_SYNC_MESSAGES = int(os.getenv("GMAIL_INDEX_INITIAL_SYNC", "500"))
+# Messages kept per user; beyond this the oldest are dropped.
+MAX_MESSAGES = int(os.getenv("GMAIL_INDEX_MAX_MESSAGES", "5000"))
+# An index last synced longer ago than this catches up through history.list before it
+# answers. 0 catches up before every answer (one small request when nothing changed).
+MAX_STALENESS = float(os.getenv("GMAIL_INDEX_MAX_STALENESS", "60"))
+# More history records than this since the last sync: rebuilding is cheaper than replaying.
+MAX_HISTORY_RECORDS = int(os.getenv("GMAIL_INDEX_MAX_HISTORY", "2000"))
+OPEN_INDEXES = int(os.getenv("GMAIL_INDEX_OPEN", "64"))
+SYNC_WORKERS = int(os.getenv("GMAIL_INDEX_SYNC_WORKERS", "2"))
+
+HISTORY_FIELDS = (
+    "history(messagesAdded/message(id,labelIds),messagesDeleted/message/id,"
+    "labelsAdded(message/id,labelIds),labelsRemoved(message/id,labelIds)),historyId,nextPageToken"
+)
+# Gmail search leaves these out unless asked for, and so does the index.
+_HIDDEN_LABELS = ("SPAM", "TRASH")
+
+# Gmail reads dates in queries as midnight Pacific time.
+try:
+    _QUERY_TZ = ZoneInfo("America/Los_Angeles")
+except ZoneInfoNotFoundError:
+    _QUERY_TZ = datetime.timezone(datetime.timedelta(hours=-8))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    thread_id TEXT NOT NULL,
+    internal_date INTEGER NOT NULL,
+    labels TEXT NOT NULL,
+    sender TEXT,
+    recipients TEXT,
+    subject TEXT,
+    date TEXT,
+    snippet TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_internal_date ON messages (internal_date);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    sender, recipients, subject, snippet, content='messages', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, sender, recipients, subject, snippet)
+    VALUES (new.rowid, new.sender, new.recipients, new.subject, new.snippet);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, sender, recipients, subject, snippet)
+    VALUES ('delete', old.rowid, old.sender, old.recipients, old.subject, old.snippet);
+END;
+CREATE TABLE IF NOT EXISTS labels (id TEXT PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+# --- Queries the index can answer ---
+
+_TERM = re.compile(r'\s*([a-z_]+):("[^"]*"|[^\s"(){}]+)(?=\s|$)', re.IGNORECASE)
+_TEXT_COLUMNS = {"from": "sender", "to": "recipients", "subject": "subject"}
+_IS_LABELS = {"unread": "UNREAD", "starred": "STARRED", "important": "IMPORTANT", "inbox": "INBOX", "sent": "SENT"}
+_PERIODS = {"d": 1, "m": 30, "y": 365}
+
+
+@dataclass
+class IndexQuery:
+    """A Gmail query reduced to what the index stores. Label names are resolved per user."""
+    match: List[str] = field(default_factory=list)           # FTS5 column filters, ANDed.
+    labels: List[str] = field(default_factory=list)          # Label names or system ids that must be present.
+    without_labels: List[str] = field(default_factory=list)  # System ids that must be absent.
+    after: Optional[int] = None                              # Epoch milliseconds, inclusive.
+    before: Optional[int] = None                             # Epoch milliseconds, exclusive.
+
+
+def _label_key(name: str) -> str:
+    # Gmail's spelling of a label in queries: "Work/Clients 2" is label:work-clients-2.
+    return re.sub(r"[\s/]+", "-", name.strip().lower())
+
+
+def _date_ms(value: str) -> Optional[int]:
+    if value.isdigit():
+        return int(value) * 1000
+    match = re.fullmatch(r"(\d{4})[/-](\d{1,2})[/-](\d{1,2})", value)
+    if not match:
+        return None
+    try:
+        day = datetime.datetime(*map(int, match.groups()), tzinfo=_QUERY_TZ)
+    except ValueError:
+        return None
+    return int(day.timestamp() * 1000)
+
+
+def parse_query(query: str, now: Optional[float] = None) -> Optional[IndexQuery]:
+    """
+    The query as an IndexQuery, or None when it uses anything but from:, to:, subject:,
+    label:, is:/in: for the common system labels, after:/before: and newer_than:/
+    older_than:. Free text, negation, OR and grouping all go to the API.
+    """
+    parsed, position = IndexQuery(), 0
+    query = query.strip()
+    if not query:
+        return None
+    now = time.time() if now is None else now
+    while position < len(query):
+        term = _TERM.match(query, position)
+        if term is None:
+            return None
+        position = term.end()
+        operator, value = term.group(1).lower(), term.group(2).strip('"')
+        if operator in _TEXT_COLUMNS:
+            words = re.findall(r"\w+", value.lower())
+            if not words:
+                return None
+            parsed.match.append(f'{_TEXT_COLUMNS[operator]} : "{" ".join(words)}"')
+        elif operator == "label":
+            if _label_key(value) in ("spam", "trash"):
+                return None
+            parsed.labels.append(_label_key(value))
+        elif operator in ("is", "in") and value.lower() in _IS_LABELS:
+            parsed.labels.append(_IS_LABELS[value.lower()])
+        elif operator == "is" and value.lower() == "read":
+            parsed.without_labels.append("UNREAD")
+        elif operator in ("after", "before"):
+            moment = _date_ms(value)
+            if moment is None:
+                return None
+            if operator == "after":
+                parsed.after = max(parsed.after or 0, moment)
+            else:
+                parsed.before = min(parsed.before or moment, moment)
+        elif operator in ("newer_than", "older_than"):
+            match = re.fullmatch(r"(\d+)([dmy])", value.lower())
+            if not match:
+                return None
+            moment = int((now - int(match.group(1)) * _PERIODS[match.group(2)] * 86400) * 1000)
+            if operator == "newer_than":
+                parsed.after = max(parsed.after or 0, moment)
+            else:
+                parsed.before = min(parsed.before or moment, moment)
+        else:
+            return None
+    return parsed
+
+
+# --- One user's index ---
+
+class GmailIndex:
+    """
+    Headers, labels and snippets of one user's recent mail in a SQLite file with an FTS5
+    table over sender, recipients, subject and snippet.
+
+    `seed` fetches the newest `initial_sync` messages; `sync` replays what changed since
+    through history.list. The index records the oldest date down to which it is known
+    to hold every message (`floor`), or that it holds the whole mailbox (`complete`), and
+    `search` only answers when that makes its result the same as Gmail's: the newest
+    `max_results` matches are all newer than the floor, or the query's own date range
+    starts above it. Otherwise it returns None and the caller asks the API.
+    """
+
+    def __init__(self, user_id: str, path: str, initial_sync: int = INITIAL_SYNC_MESSAGES, max_messages: int = MAX_MESSAGES):
+        self.user_id = user_id
+        self.path = path
+        self.initial_sync = initial_sync
+        self.max_messages = max_messages
+        # Network work (seeding, history replay) is serialized per user by GmailIndexes;
+        # only the SQLite connection is guarded here, so a search can read while another
+        # thread waits on Gmail.
+        self._db_lock = threading.Lock()
+        # Kept by GmailIndexes under its lock: who is using the index, and whether it
+        # was evicted (it is closed once nobody is).
+        self.users = 0
+        self.evicted = False
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._state = dict(self._db.execute("SELECT key, value FROM state").fetchall())
+
+    # State: history_id, synced_at, floor (epoch ms), complete ("1" or "0") and
+    # email_address, the Google account the messages came from.
+
+    @property
+    def seeded(self) -> bool:
+        return "history_id" in self._state
+
+    @property
+    def account(self) -> Optional[str]:
+        return self._state.get("email_address")
+
+    @property
+    def age(self) -> float:
+        return time.time() - float(self._state.get("synced_at", 0))
+
+    def reload_state(self):
+        """Re-reads the state, which another instance on the same file may have changed."""
+        with self._db_lock:
+            self._state = dict(self._db.execute("SELECT key, value FROM state").fetchall())
+
+    def _set_state(self, **values):
+        for key, value in values.items():
+            self._db.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, str(value)))
+        self._state.update({key: str(value) for key, value in values.items()})
+
+    def _upsert(self, labelled: Iterable[Tuple[MessageMetadata, List[str]]]):
+        self._db.executemany(
+            "INSERT INTO messages (id, thread_id, internal_date, labels, sender, recipients, subject, date, snippet)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET labels = excluded.labels",
+            [
+                (
+                    metadata.id, metadata.thread_id, metadata.internal_date, f" {' '.join(labels)} ",
+                    metadata.header("From") or None, metadata.header("To") or None,
+                    metadata.header("Subject") or None, metadata.header("Date") or None, metadata.snippet,
+                )
+                for metadata, labels in labelled
+            ],
+        )
+
+    def _store_labels(self, service):
+        response = service.users().labels().list(userId="me", fields="labels(id,name)").execute()
+        with self._db_lock:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM labels")
+            self._db.executemany(
+                "INSERT INTO labels (id, name) VALUES (?, ?)", [(label["id"], label["name"]) for label in response.get("labels", [])]
+            )
+            self._db.execute("COMMIT")
+
+    def _prune(self) -> int:
+        """Drops the oldest messages over `max_messages`, raising the floor past them."""
+        excess = self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0] - self.max_messages
+        if excess <= 0:
+            return 0
+        newest_dropped = self._db.execute(
+            "SELECT MAX(internal_date) FROM (SELECT internal_date FROM messages ORDER BY internal_date LIMIT ?)", (excess,)
+        ).fetchone()[0]
+        self._db.execute(
+            "DELETE FROM messages WHERE id IN (SELECT id FROM messages ORDER BY internal_date LIMIT ?)", (excess,)
+        )
+        self._set_state(floor=max(int(self._state.get("floor", 0)), newest_dropped + 1), complete=0)
+        return excess
+
+    def seed(self, service) -> int:
+        """Rebuilds the index from the newest `initial_sync` messages. Returns how many were indexed."""
+        # The history id is taken first, so changes made while listing are replayed by the next sync.
+        profile = service.users().getProfile(userId="me", fields="historyId,emailAddress").execute()
+        history_id = profile["historyId"]
+        self._store_labels(service)
+        message_ids, page_token, complete = [], None, False
+        while len(message_ids) < self.initial_sync:
+            response = service.users().messages().list(
+                userId="me", maxResults=min(500, self.initial_sync - len(message_ids)),
+                pageToken=page_token, fields="messages/id,nextPageToken",
+            ).execute()
+            message_ids += [message["id"] for message in response.get("messages", [])]
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                complete = True
+                break
+        labelled = fetch_labelled(service, self.user_id, message_ids)
+        floor = 0 if complete or not labelled else min(metadata.internal_date for metadata, _ in labelled)
+        with self._db_lock:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM messages")
+            self._upsert(labelled)
+            self._set_state(
+                history_id=history_id, synced_at=time.time(), floor=floor, complete=int(complete),
+                email_address=profile.get("emailAddress", ""),
+            )
+            self._prune()
+            self._db.execute("COMMIT")
+        return len(labelled)
+
+    def sync(self, service) -> int:
+        """
+        Applies the mailbox history since the last sync. Returns the number of history
+        records replayed, or -1 when the index had to be rebuilt because the stored
+        history id expired (Gmail keeps about a week) or too much had changed.
+        """
+        start, records, page_token = self._state["history_id"], [], None
+        try:
+            while True:
+                response = service.users().history().list(
+                    userId="me", startHistoryId=start, pageToken=page_token, fields=HISTORY_FIELDS,
+                ).execute()
+                records += response.get("history", [])
+                history_id = response.get("historyId", start)
+                page_token = response.get("nextPageToken")
+                if not page_token:
+                    break
+                if len(records) > MAX_HISTORY_RECORDS:
+                    raise OverflowError
+        except (HttpError, OverflowError) as e:
+            if isinstance(e, HttpError) and e.resp.status != 404:
+                raise
+            logger.info(f"Rebuilding the Gmail index of user {self.user_id}: history since {start} is unavailable.")
+            self.seed(service)
+            return -1
+
+        relabelled = {
+            change["message"]["id"]
+            for record in records for kind in ("labelsAdded", "labelsRemoved") for change in record.get(kind, [])
+        }
+        with self._db_lock:
+            indexed = {}
+            for message_id in relabelled:
+                row = self._db.execute("SELECT labels FROM messages WHERE id = ?", (message_id,)).fetchone()
+                if row is not None:
+                    indexed[message_id] = set(row[0].split())
+            known_labels = {row[0] for row in self._db.execute("SELECT id FROM labels").fetchall()}
+        changed: Dict[str, Set[str]] = {}
+        to_fetch: Set[str] = set()
+        deleted: Set[str] = set()
+        for record in records:
+            for added in record.get("messagesAdded", []):
+                to_fetch.add(added["message"]["id"])
+                deleted.discard(added["message"]["id"])
+            for removed in record.get("messagesDeleted", []):
+                deleted.add(removed["message"]["id"])
+            for kind in ("labelsAdded", "labelsRemoved"):
+                for change in record.get(kind, []):
+                    message_id = change["message"]["id"]
+                    if message_id in to_fetch or message_id not in indexed:
+                        # Fetched below with its current labels: new, or e.g. back from the trash.
+                        to_fetch.add(message_id)
+                        continue
+                    labels = changed.setdefault(message_id, set(indexed[message_id]))
+                    if kind == "labelsAdded":
+                        labels.update(change.get("labelIds", []))
+                    else:
+                        labels.difference_update(change.get("labelIds", []))
+        to_fetch -= deleted
+        labelled = fetch_labelled(service, self.user_id, sorted(to_fetch)) if to_fetch else []
+        seen_labels = set().union(*changed.values(), *(labels for _, labels in labelled))
+        if seen_labels - known_labels:
+            self._store_labels(service)
+
+        with self._db_lock:
+            self._db.execute("BEGIN")
+            self._db.executemany("DELETE FROM messages WHERE id = ?", [(message_id,) for message_id in deleted])
+            self._db.executemany(
+                "UPDATE messages SET labels = ? WHERE id = ?",
+                [(f" {' '.join(sorted(labels))} ", message_id) for message_id, labels in changed.items() if message_id not in deleted],
+            )
+            self._upsert(labelled)
+            self._set_state(history_id=history_id, synced_at=time.time())
+            self._prune()
+            self._db.execute("COMMIT")
+        return len(records)
+
+    def search(self, query: IndexQuery, max_results: int) -> Optional[List[MessageMetadata]]:
+        """The newest `max_results` matches, or None if the index cannot be sure it has them all."""
+        with self._db_lock:
+            labels = dict(self._db.execute("SELECT id, name FROM labels").fetchall())
+            label_ids = {_label_key(name): label_id for label_id, name in labels.items()}
+            label_ids.update({label_id: label_id for label_id in labels})
+            conditions, params = [], []
+            for label in query.labels:
+                if label not in label_ids:
+                    return None  # A label created since the last sync, or a typo: Gmail will say.
+                conditions.append("instr(labels, ?) > 0")
+                params.append(f" {label_ids[label]} ")
+            for label_id in query.without_labels + list(_HIDDEN_LABELS):
+                conditions.append("instr(labels, ?) = 0")
+                params.append(f" {label_id} ")
+            if query.match:
+                conditions.append("rowid IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)")
+                params.append(" AND ".join(query.match))
+
+            complete = self._state.get("complete") == "1"
+            floor = int(self._state.get("floor", 0))
+            lower = max(query.after or 0, 0 if complete else floor)
+            conditions.append("internal_date >= ?")
+            params.append(lower)
+            if query.before is not None:
+                conditions.append("internal_date < ?")
+                params.append(query.before)
+            rows = self._db.execute(
+                "SELECT id, thread_id, internal_date, sender, recipients, subject, date, snippet FROM messages"
+                f" WHERE {' AND '.join(conditions)} ORDER BY internal_date DESC LIMIT ?",
+                params + [max_results],
+            ).fetchall()
+        if not (complete or len(rows) >= max_results or (query.after or 0) >= floor):
+            return None
+        return [
+            MessageMetadata(
+                id=message_id, thread_id=thread_id, snippet=snippet or "", internal_date=internal_date,
+                headers=tuple(
+                    (name, value)
+                    for name, value in (("From", sender), ("To", recipients), ("Subject", subject), ("Date", date))
+                    if value is not None
+                ),
+            )
+            for message_id, thread_id, internal_date, sender, recipients, subject, date, snippet in rows
+        ]
+
+    def size(self) -> int:
+        with self._db_lock:
+            return self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def close(self):
+        with self._db_lock:
+            self._db.close()
+
+
+class GmailIndexes:
+    """
+    The per-user indexes of this process, opened on demand and kept open for the
+    `max_open` most recently used users; an evicted index is closed once the searches
+    and syncs still using it are done. Seeding and syncing are serialized per user, so
+    an index reopened while an evicted one is still in use never syncs concurrently.
+
+    A user's first search starts the initial sync in the background and is answered by
+    the API meanwhile, as is any query the index cannot answer or any search while
+    syncing with Gmail fails. An index built from another Google account than the one
+    the user's credentials now belong to is rebuilt the same way.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = ENABLED,
+        directory: str = INDEX_DIR,
+        max_staleness: float = MAX_STALENESS,
+        initial_sync: int = INITIAL_SYNC_MESSAGES,
+        max_messages: int = MAX_MESSAGES,
+        max_open: int = OPEN_INDEXES,
+        sync_workers: int = SYNC_WORKERS,
+    ):
+        self.enabled = enabled
+        self.directory = directory
+        self.max_staleness = max_staleness
+        self.initial_sync = initial_sync
+        self.max_messages = max_messages
+        self.max_open = max_open
+        self._open: "OrderedDict[str, GmailIndex]" = OrderedDict()
+        self._seeding: Set[str] = set()
+        self._sync_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._seeder = concurrent.futures.ThreadPoolExecutor(max_workers=sync_workers, thread_name_prefix="gmail-index")
+        self.stats = {
+            "answered": 0, "unsupported": 0, "incomplete": 0, "not_seeded": 0, "sync_errors": 0,
+            "seeds": 0, "syncs": 0, "history_records": 0, "rebuilds": 0, "account_changes": 0,
+        }
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _sync_lock(self, user_id: str) -> threading.Lock:
+        with self._lock:
+            return self._sync_locks.setdefault(user_id, threading.Lock())
+
+    def _acquire(self, user_id: str) -> GmailIndex:
+        evicted = []
+        with self._lock:
+            index = self._open.get(user_id)
+            if index is None:
+                os.makedirs(self.directory, mode=0o700, exist_ok=True)
+                name = hashlib.sha256(user_id.encode()).hexdigest()[:32]
+                index = self._open[user_id] = GmailIndex(
+                    user_id, os.path.join(self.directory, f"gmail-{name}.db"), self.initial_sync, self.max_messages
+                )
+            self._open.move_to_end(user_id)
+            index.users += 1
+            while len(self._open) > self.max_open:
+                _, oldest = self._open.popitem(last=False)
+                oldest.evicted = True
+                if oldest.users == 0:
+                    evicted.append(oldest)
+        for oldest in evicted:
+            oldest.close()
+        return index
+
+    def _release(self, index: GmailIndex):
+        with self._lock:
+            index.users -= 1
+            idle = index.evicted and index.users == 0
+        if idle:
+            index.close()
+
+    @contextlib.contextmanager
+    def using(self, user_id: str) -> Iterator[GmailIndex]:
+        """The user's index, kept open until the block ends even if it is evicted meanwhile."""
+        index = self._acquire(user_id)
+        try:
+            yield index
+        finally:
+            self._release(index)
+
+    def _seed(self, index: GmailIndex, build_service: Callable, account: str):
+        try:
+            with self._sync_lock(index.user_id):
+                # An index reopened after eviction may have been seeded by the evicted one.
+                index.reload_state()
+                if not index.seeded or index.account != account:
+                    count = index.seed(build_service())
+                    self._count("seeds")
+                    logger.info(f"Indexed {count} Gmail messages of user {index.user_id}.")
+        except Exception as e:
+            self._count("sync_errors")
+            logger.warning(f"Initial Gmail index sync failed for user {index.user_id}: {e}")
+        finally:
+            with self._lock:
+                self._seeding.discard(index.user_id)
+            self._release(index)
+
+    def search(self, user_id: str, query: str, max_results: int, service, build_service: Callable,
+               account: Callable[[], str]) -> Optional[List[MessageMetadata]]:
+        """
+        Messages matching `query` from the user's index, synced first if older than
+        `max_staleness`, or None when the API has to answer. `build_service` makes a
+        separate Gmail client for the background initial sync, since the tool's own
+        client is not thread-safe. `account` returns the email address of the Google
+        account the user's credentials belong to.
+        """
+        if not self.enabled:
+            return None
+        parsed = parse_query(query)
+        if parsed is None:
+            self._count("unsupported")
+            return None
+        with self.using(user_id) as index:
+            try:
+                email_address = account()
+            except Exception as e:
+                self._count("sync_errors")
+                logger.warning(f"Could not tell which Gmail account user {user_id} is connected to, asking the API: {e}")
+                return None
+            if not index.seeded or index.account != email_address:
+                with self._lock:
+                    start = user_id not in self._seeding
+                    self._seeding.add(user_id)
+                    if start:
+                        index.users += 1  # Released by _seed.
+                if start:
+                    if index.seeded:
+                        self._count("account_changes")
+                        logger.info(f"Rebuilding the Gmail index of user {user_id}: another Google account is connected.")
+                    self._seeder.submit(self._seed, index, build_service, email_address)
+                self._count("not_seeded")
+                return None
+            if index.age > self.max_staleness:
+                try:
+                    with self._sync_lock(user_id):
+                        # Another search may have synced while this one waited.
+                        if index.age > self.max_staleness:
+                            replayed = index.sync(service)
+                            self._count("syncs")
+                            if replayed < 0:
+                                self._count("rebuilds")
+                            else:
+                                self._count("history_records", replayed)
+                except Exception as e:
+                    self._count("sync_errors")
+                    logger.warning(f"Gmail index sync failed for user {user_id}, asking the API: {e}")
+                    return None
+            messages = index.search(parsed, max_results)
+        self._count("incomplete" if messages is None else "answered")
+        return messages
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                **self.stats, "enabled": self.enabled, "open": len(self._open), "seeding": len(self._seeding),
+                "max_staleness_seconds": self.max_staleness, "max_messages": self.max_messages,
+            }
+
+    def close(self):
+        self._seeder.shutdown(wait=False)
+        with self._lock:
+            for index in self._open.values():
+                index.close()
+            self._open.clear()
+
+
+gmail_indexes = GmailIndexes()
@@ -0,0 +1,201 @@
+# python-backend/gmail_metadata.py
+
+import os
+import time
+import random
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# Every metadata fetch asks for the same headers, so a cached entry serves all tools.
+METADATA_HEADERS = ["From", "To", "Subject", "Date"]
+# Partial response: only what the tools read, not labels or the payload structure.
+METADATA_FIELDS = "id,threadId,snippet,internalDate,payload/headers"
+# Gmail accepts up to 100 calls per batch but throttles large ones; 50 is its recommendation.
+BATCH_SIZE = int(os.getenv("GMAIL_BATCH_SIZE", "50"))
+BATCH_RETRIES = 3
+CACHE_PER_USER = int(os.getenv("GMAIL_METADATA_CACHE_SIZE", "2000"))
+CACHE_USERS = int(os.getenv("GMAIL_METADATA_CACHE_USERS", "256"))
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+_GONE_STATUSES = {404, 410}
+
+
+@dataclass(frozen=True)
+class MessageMetadata:
+    """The immutable parts of a message. Labels change (read, archived), so they are not kept."""
+    id: str
+    thread_id: str
+    snippet: str
+    internal_date: int
+    headers: Tuple[Tuple[str, str], ...]
+
+    def header(self, name: str, default: str = "") -> str:
+        name = name.lower()
+        return next((value for key, value in self.headers if key.lower() == name), default)
+
+    @classmethod
+    def from_response(cls, message: Dict) -> "MessageMetadata":
+        return cls(
+            id=message["id"],
+            thread_id=message.get("threadId", ""),
+            snippet=message.get("snippet", ""),
+            internal_date=int(message.get("internalDate", 0)),
+            headers=tuple((h["name"], h["value"]) for h in message.get("payload", {}).get("headers", [])),
+        )
+
+
+class MessageMetadataCache:
+    """
+    Per-user LRU of message metadata keyed by message id. A Gmail message id always
+    names the same message, and its headers and snippet never change, so entries
+    never need revalidation; they only leave when the user's LRU is full (or the user
+    is the least recently seen of CACHE_USERS).
+    """
+
+    def __init__(self, max_per_user: int = CACHE_PER_USER, max_users: int = CACHE_USERS):
+        self.max_per_user = max_per_user
+        self.max_users = max_users
+        self._users: "OrderedDict[str, OrderedDict[str, MessageMetadata]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "fetched": 0, "batches": 0, "retried": 0, "failed": 0}
+
+    def get_many(self, user_id: str, message_ids: Sequence[str]) -> Tuple[Dict[str, MessageMetadata], List[str]]:
+        """The cached entries among `message_ids`, and the ids that are not cached."""
+        found, missing = {}, []
+        with self._lock:
+            entries = self._users.get(user_id)
+            if entries is not None:
+                self._users.move_to_end(user_id)
+            for message_id in message_ids:
+                entry = entries.get(message_id) if entries is not None else None
+                if entry is None:
+                    missing.append(message_id)
+                else:
+                    entries.move_to_end(message_id)
+                    found[message_id] = entry
+            self.stats["hits"] += len(found)
+            self.stats["misses"] += len(missing)
+        return found, missing
+
+    def put_many(self, user_id: str, metadata: Sequence[MessageMetadata]):
+        with self._lock:
+            entries = self._users.get(user_id)
+            if entries is None:
+                entries = self._users[user_id] = OrderedDict()
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            self._users.move_to_end(user_id)
+            for entry in metadata:
+                entries[entry.id] = entry
+                entries.move_to_end(entry.id)
+            while len(entries) > self.max_per_user:
+                entries.popitem(last=False)
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {**self.stats, "users": len(self._users), "entries": sum(len(e) for e in self._users.values())}
+
+
+def _retryable(error: Exception) -> bool:
+    if not isinstance(error, HttpError):
+        return False
+    if error.resp.status in _RETRY_STATUSES:
+        return True
+    return error.resp.status == 403 and b"rateLimitExceeded" in (error.content or b"")
+
+
+def _fetch_batch(service, message_ids: List[str], cache: MessageMetadataCache,
+                 fields: str = METADATA_FIELDS) -> Dict[str, Dict]:
+    """
+    One chunk of ids through the batch endpoint, retrying throttled items with jittered
+    backoff. Messages gone since they were listed (404/410) are left out; any other
+    error, such as revoked access (401/403), is raised once the batch has finished.
+    """
+    fetched: Dict[str, Dict] = {}
+    pending = message_ids
+    # Every users()/messages() call builds the resource from the discovery document
+    # again, which costs more CPU than adding the request to the batch.
+    messages = service.users().messages()
+    for attempt in range(BATCH_RETRIES):
+        retry, errors = [], []
+
+        def on_response(request_id, response, exception):
+            if exception is None:
+                fetched[request_id] = response
+            elif _retryable(exception):
+                retry.append(request_id)
+            elif isinstance(exception, HttpError) and exception.resp.status in _GONE_STATUSES:
+                cache.stats["failed"] += 1
+                logger.warning(f"Gmail message {request_id} is gone: {exception}")
+            else:
+                cache.stats["failed"] += 1
+                errors.append(exception)
+
+        batch = service.new_batch_http_request(callback=on_response)
+        for message_id in pending:
+            batch.add(
+                messages.get(
+                    userId="me", id=message_id, format="metadata",
+                    metadataHeaders=METADATA_HEADERS, fields=fields,
+                ),
+                request_id=message_id,
+            )
+        batch.execute()
+        cache.stats["batches"] += 1
+        if errors:
+            raise errors[0]
+        if not retry:
+            break
+        cache.stats["retried"] += len(retry)
+        pending = retry
+        time.sleep(random.uniform(0, 0.5 * 2 ** attempt))
+    else:
+        cache.stats["failed"] += len(pending)
+        logger.warning(f"Gave up on {len(pending)} throttled Gmail messages after {BATCH_RETRIES} attempts.")
+    return fetched
+
+
+def fetch_metadata(service, user_id: str, message_ids: Sequence[str],
+                   cache: Optional[MessageMetadataCache] = None) -> List[MessageMetadata]:
+    """
+    Metadata of `message_ids`, in the same order, from the user's cache where possible
+    and otherwise through Gmail's batch endpoint, BATCH_SIZE messages per HTTP request.
+    Messages deleted since they were listed are left out; other errors raise HttpError.
+    """
+    cache = cache or gmail_metadata_cache
+    found, missing = cache.get_many(user_id, message_ids)
+    for start in range(0, len(missing), BATCH_SIZE):
+        fetched = _fetch_batch(service, missing[start:start + BATCH_SIZE], cache)
+        metadata = [MessageMetadata.from_response(response) for response in fetched.values()]
+        cache.put_many(user_id, metadata)
+        cache.stats["fetched"] += len(metadata)
+        found.update((entry.id, entry) for entry in metadata)
+    return [found[message_id] for message_id in message_ids if message_id in found]
+
+
+def fetch_labelled(service, user_id: str, message_ids: Sequence[str],
+                   cache: Optional[MessageMetadataCache] = None) -> List[Tuple[MessageMetadata, List[str]]]:
+    """
+    Metadata and current label ids of `message_ids`, always from Gmail since labels are
+    not cached. The metadata still goes into the cache for later `fetch_metadata` calls.
+    """
+    cache = cache or gmail_metadata_cache
+    labelled = []
+    for start in range(0, len(message_ids), BATCH_SIZE):
+        fetched = _fetch_batch(service, list(message_ids[start:start + BATCH_SIZE]), cache, METADATA_FIELDS + ",labelIds")
+        chunk = [(MessageMetadata.from_response(response), response.get("labelIds", [])) for response in fetched.values()]
+        cache.put_many(user_id, [metadata for metadata, _ in chunk])
+        cache.stats["fetched"] += len(chunk)
+        labelled.extend(chunk)
+    return labelled
+
+
+gmail_metadata_cache = MessageMetadataCache()
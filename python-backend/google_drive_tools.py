@@ -12,7 +12,7 @@ from googleapiclient.discovery import build, Resource
 from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseDownload
 
-from supabase_client import supabase_client
+from supabase_client import supabase_sync
 
 logger = logging.getLogger(__name__)
 
@@ -32,36 +32,53 @@ class GoogleDriveTools(Toolkit):
         )
         self.user_id = user_id
         self._credentials: Optional[Credentials] = None
+        # Set once Supabase has no Google row for the user, so later calls don't ask again.
+        self._not_connected = False
         self._drive_service: Optional[Resource] = None
 
+    def _credentials_query(self, client):
+        return (
+            client.from_("user_integrations")
+            .select("access_token, refresh_token, scopes")
+            .eq("user_id", self.user_id).eq("service", "google")
+            .maybe_single().execute()
+        )
+
+    def _credentials_from_row(self, creds_data) -> Credentials:
+        return Credentials(
+            token=creds_data.get('access_token'),
+            refresh_token=creds_data.get('refresh_token'),
+            token_uri='https://oauth2.googleapis.com/token',
+            client_id=os.getenv("GOOGLE_CLIENT_ID"),
+            client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
+            scopes=creds_data.get('scopes')
+        )
+
+    def _token_update(self, creds: Credentials):
+        def update(client):
+            return client.from_('user_integrations').update({
+                'access_token': creds.token,
+                'scopes': creds.scopes
+            }).eq('user_id', self.user_id).eq('service', 'google').execute()
+        return update
+
     def _get_credentials(self) -> Optional[Credentials]:
-        # This method is unchanged and remains the same.
         if self._credentials and self._credentials.valid:
             return self._credentials
+        if self._not_connected:
+            return None
         try:
-            response = (
-                supabase_client.from_("user_integrations")
-                .select("access_token, refresh_token, scopes")
-                .eq("user_id", self.user_id).eq("service", "google")
-                .single().execute()
-            )
-            if not response.data: return None
-            creds_data = response.data
-            creds = Credentials(
-                token=creds_data.get('access_token'),
-                refresh_token=creds_data.get('refresh_token'),
-                token_uri='https://oauth2.googleapis.com/token',
-                client_id=os.getenv("GOOGLE_CLIENT_ID"),
-                client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
-                scopes=creds_data.get('scopes')
-            )
+            # Tools run in a worker thread, so the facade's blocking call never holds up the event loop.
+            response = supabase_sync.run(self._credentials_query)
+            if response is None or not response.data:
+                self._not_connected = True
+                return None
+            creds = self._credentials_from_row(response.data)
             if creds.expired:
                 if creds.refresh_token:
                     creds.refresh(Request())
-                    supabase_client.from_('user_integrations').update({
-                        'access_token': creds.token,
-                        'scopes': creds.scopes
-                    }).eq('user_id', self.user_id).eq('service', 'google').execute()
+                    # Persisting the new token does not need to hold up the tool call.
+                    supabase_sync.submit(self._token_update(creds))
                 else:
                     return None
             self._credentials = creds
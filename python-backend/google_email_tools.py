@@ -12,7 +12,9 @@ from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build, Resource
 from googleapiclient.errors import HttpError
 
-from supabase_client import supabase_client
+from supabase_client import supabase_sync
+from gmail_metadata import fetch_metadata
+from gmail_index import gmail_indexes
 
 logger = logging.getLogger(__name__)
 
@@ -32,35 +34,53 @@ class GoogleEmailTools(Toolkit):
         )
         self.user_id = user_id
         self._credentials: Optional[Credentials] = None
+        # Set once Supabase has no Google row for the user, so later calls don't ask again.
+        self._not_connected = False
         self._gmail_service: Optional[Resource] = None
+        self._email_address: Optional[str] = None
+
+    def _credentials_query(self, client):
+        return (
+            client.from_("user_integrations")
+            .select("access_token, refresh_token, scopes")
+            .eq("user_id", self.user_id).eq("service", "google")
+            .maybe_single().execute()
+        )
+
+    def _credentials_from_row(self, creds_data) -> Credentials:
+        return Credentials(
+            token=creds_data.get('access_token'),
+            refresh_token=creds_data.get('refresh_token'),
+            token_uri='https://oauth2.googleapis.com/token',
+            client_id=os.getenv("GOOGLE_CLIENT_ID"),
+            client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
+            scopes=creds_data.get('scopes')
+        )
+
+    def _token_update(self, creds: Credentials):
+        def update(client):
+            return client.from_('user_integrations').update({
+                'access_token': creds.token
+            }).eq('user_id', self.user_id).eq('service', 'google').execute()
+        return update
 
     def _get_credentials(self) -> Optional[Credentials]:
-        # This method is unchanged and remains the same.
         if self._credentials and self._credentials.valid:
             return self._credentials
+        if self._not_connected:
+            return None
         try:
-            response = (
-                supabase_client.from_("user_integrations")
-                .select("access_token, refresh_token, scopes")
-                .eq("user_id", self.user_id).eq("service", "google")
-                .single().execute()
-            )
-            if not response.data: return None
-            creds_data = response.data
-            creds = Credentials(
-                token=creds_data.get('access_token'),
-                refresh_token=creds_data.get('refresh_token'),
-                token_uri='https://oauth2.googleapis.com/token',
-                client_id=os.getenv("GOOGLE_CLIENT_ID"),
-                client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
-                scopes=creds_data.get('scopes')
-            )
+            # Tools run in a worker thread, so the facade's blocking call never holds up the event loop.
+            response = supabase_sync.run(self._credentials_query)
+            if response is None or not response.data:
+                self._not_connected = True
+                return None
+            creds = self._credentials_from_row(response.data)
             if creds.expired:
                 if creds.refresh_token:
                     creds.refresh(Request())
-                    supabase_client.from_('user_integrations').update({
-                        'access_token': creds.token
-                    }).eq('user_id', self.user_id).eq('service', 'google').execute()
+                    # Persisting the new token does not need to hold up the tool call.
+                    supabase_sync.submit(self._token_update(creds))
                 else:
                     return None
             self._credentials = creds
@@ -82,24 +102,37 @@ class GoogleEmailTools(Toolkit):
             logger.error(f"An error occurred building the Gmail service: {error}")
             return None
 
-    # --- EXISTING TOOLS (Unchanged) ---
+    def _account_email(self, service: Resource) -> str:
+        # The Gmail index checks it was built from the account these credentials belong to.
+        if self._email_address is None:
+            profile = service.users().getProfile(userId="me", fields="emailAddress").execute()
+            self._email_address = profile["emailAddress"]
+        return self._email_address
+
+    def _new_gmail_service(self) -> Resource:
+        # A client of its own for work on another thread; googleapiclient clients are not thread-safe.
+        return build('gmail', 'v1', credentials=self._get_credentials())
+
+    def _list_message_ids(self, service: Resource, query: str, max_results: int) -> List[str]:
+        results = service.users().messages().list(
+            userId='me', maxResults=max_results, q=query, fields='messages/id'
+        ).execute()
+        return [msg['id'] for msg in results.get('messages', [])]
+
+    # --- EXISTING TOOLS ---
     def read_latest_emails(self, max_results: int = 5, only_unread: bool = True) -> str:
-        # This method is unchanged.
         service = self._get_gmail_service()
         if not service: return "Google account not connected or credentials invalid."
         try:
             query = 'is:unread' if only_unread else ''
-            results = service.users().messages().list(userId='me', maxResults=max_results, q=query).execute()
-            messages = results.get('messages', [])
-            if not messages: return "No new emails found."
+            message_ids = self._list_message_ids(service, query, max_results)
+            if not message_ids: return "No new emails found."
+            # Headers and snippets of all messages in one batch request, or from the cache.
             email_summaries = []
-            for msg in messages:
-                msg_data = service.users().messages().get(userId='me', id=msg['id']).execute()
-                headers = msg_data['payload']['headers']
-                subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-                sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown Sender')
-                snippet = msg_data['snippet']
-                email_summaries.append(f"From: {sender}\nSubject: {subject}\nSnippet: {snippet}\n---")
+            for metadata in fetch_metadata(service, self.user_id, message_ids):
+                subject = metadata.header('Subject', 'No Subject')
+                sender = metadata.header('From', 'Unknown Sender')
+                email_summaries.append(f"From: {sender}\nSubject: {subject}\nSnippet: {metadata.snippet}\n---")
             return "\n".join(email_summaries)
         except HttpError as error:
             return f"An error occurred while trying to read your emails: {error}"
@@ -135,17 +168,20 @@ class GoogleEmailTools(Toolkit):
         service = self._get_gmail_service()
         if not service: return "Google account not connected or credentials invalid."
         try:
-            results = service.users().messages().list(userId='me', maxResults=max_results, q=query).execute()
-            messages = results.get('messages', [])
+            # Simple sender/subject/label/date queries come from the local index when it is enabled and current.
+            messages = gmail_indexes.search(
+                self.user_id, query, max_results, service, self._new_gmail_service, lambda: self._account_email(service)
+            )
+            if messages is None:
+                message_ids = self._list_message_ids(service, query, max_results)
+                messages = fetch_metadata(service, self.user_id, message_ids) if message_ids else []
             if not messages: return f"No emails found matching query: '{query}'"
             
             email_details = []
-            for msg in messages:
-                msg_data = service.users().messages().get(userId='me', id=msg['id'], format='metadata', metadataHeaders=['Subject', 'From']).execute()
-                headers = msg_data['payload']['headers']
-                subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-                sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown Sender')
-                email_details.append(f"From: {sender}\nSubject: {subject}\nMessage ID: {msg['id']}\n---")
+            for metadata in messages:
+                subject = metadata.header('Subject', 'No Subject')
+                sender = metadata.header('From', 'Unknown Sender')
+                email_details.append(f"From: {sender}\nSubject: {subject}\nMessage ID: {metadata.id}\n---")
             return "\n".join(email_details)
         except HttpError as error:
             return f"An error occurred while searching emails: {error}"
@@ -0,0 +1,160 @@
+# python-backend/run_scheduler.py
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+POLICY_QUEUE = "queue"    # Overlapping turns wait for the active one to finish.
+POLICY_REJECT = "reject"  # Overlapping turns are refused while a run is active.
+
+STATUS_STARTED = "started"
+STATUS_QUEUED = "queued"
+STATUS_REJECTED = "rejected"
+
+
+class RunHandle:
+    """
+    One agent run scheduled for a session. The job updates `output_chars` while it
+    streams and `output_tokens` when it completes, for the session's token accounting.
+    `files_task` is the turn's attachment download, which started at submission and
+    is cancelled if the turn is dropped before it runs.
+    """
+
+    def __init__(self, message_id: str, job: Callable[["RunHandle"], Awaitable[Any]],
+                 files_task: Optional[asyncio.Task] = None):
+        self.message_id = message_id
+        self.job = job
+        self.files_task = files_task
+        self.task: Optional[asyncio.Task] = None
+        self.submitted_at = time.monotonic()
+        self.output_chars = 0
+        self.output_tokens = 0
+
+
+class SessionRunScheduler:
+    """
+    Runs a session's turns one at a time and keeps track of the active run.
+
+    A turn submitted while another is running is queued (up to `max_pending`) or
+    rejected, depending on `policy`. Runs can be cancelled individually or all at
+    once when the session ends; cancelling the task stops the agent stream and the
+    async tool calls it is awaiting.
+    """
+
+    def __init__(self, sid: str, policy: Optional[str] = None, max_pending: Optional[int] = None):
+        self.sid = sid
+        self.policy = (policy or os.getenv("RUN_OVERLAP_POLICY", POLICY_QUEUE)).lower()
+        self.max_pending = max_pending if max_pending is not None else int(os.getenv("RUN_MAX_PENDING", "2"))
+        self.default_output_tokens = int(os.getenv("RUN_DEFAULT_OUTPUT_TOKENS", "600"))
+        self.active: Optional[RunHandle] = None
+        self.pending: Deque[RunHandle] = deque()
+        self.metrics: Dict[str, int] = {
+            "runs_started": 0,
+            "runs_completed": 0,
+            "runs_failed": 0,
+            "runs_cancelled": 0,
+            "runs_rejected": 0,
+            "completed_output_tokens": 0,
+            "cancelled_partial_output_tokens": 0,
+            "estimated_output_tokens_saved": 0,
+        }
+
+    @property
+    def busy(self) -> bool:
+        return self.active is not None
+
+    def submit(self, message_id: str, job: Callable[[RunHandle], Awaitable[Any]],
+               files_task: Optional[asyncio.Task] = None) -> str:
+        """
+        Starts, queues or rejects a turn. Returns one of the STATUS_* values. A rejected
+        turn's `files_task` is cancelled.
+        """
+        handle = RunHandle(message_id, job, files_task)
+        if self.active is None:
+            self._start(handle)
+            return STATUS_STARTED
+        if self.policy == POLICY_REJECT or len(self.pending) >= self.max_pending:
+            self.metrics["runs_rejected"] += 1
+            self._release_files(handle)
+            return STATUS_REJECTED
+        self.pending.append(handle)
+        return STATUS_QUEUED
+
+    def _start(self, handle: RunHandle):
+        self.active = handle
+        self.metrics["runs_started"] += 1
+        handle.task = asyncio.create_task(self._run(handle), name=f"run-{self.sid}-{handle.message_id}")
+
+    async def _run(self, handle: RunHandle):
+        try:
+            await handle.job(handle)
+        except asyncio.CancelledError:
+            self._record_cancelled(handle, started=True)
+            # Cancelled before the job got to await its attachments.
+            self._release_files(handle)
+        except Exception as e:
+            self.metrics["runs_failed"] += 1
+            logger.error(f"Run {handle.message_id} for SID {self.sid} failed: {e}", exc_info=True)
+        else:
+            self.metrics["runs_completed"] += 1
+            self.metrics["completed_output_tokens"] += handle.output_tokens
+        finally:
+            if self.active is handle:
+                self.active = None
+                if self.pending:
+                    self._start(self.pending.popleft())
+
+    def _average_output_tokens(self) -> int:
+        completed = self.metrics["runs_completed"]
+        if completed and self.metrics["completed_output_tokens"]:
+            return self.metrics["completed_output_tokens"] // completed
+        return self.default_output_tokens
+
+    @staticmethod
+    def _release_files(handle: RunHandle):
+        if handle.files_task is not None and not handle.files_task.done():
+            handle.files_task.cancel()
+
+    def _drop_pending(self, handle: RunHandle):
+        self.pending.remove(handle)
+        self._release_files(handle)
+        self._record_cancelled(handle, started=False)
+
+    def _record_cancelled(self, handle: RunHandle, started: bool):
+        # The tokens a cancelled run would still have produced are estimated from the
+        # session's completed runs; about four characters per token have streamed so far.
+        partial = handle.output_chars // 4 if started else 0
+        self.metrics["runs_cancelled"] += 1
+        self.metrics["cancelled_partial_output_tokens"] += partial
+        self.metrics["estimated_output_tokens_saved"] += max(0, self._average_output_tokens() - partial)
+        logger.info(f"Cancelled run {handle.message_id} for SID {self.sid} after ~{partial} output tokens.")
+
+    async def cancel(self, message_id: Optional[str] = None) -> bool:
+        """
+        Cancels the run for `message_id`, whether active or queued, or the active run
+        when no id is given. Returns True if something was cancelled.
+        """
+        for handle in list(self.pending):
+            if message_id is not None and handle.message_id == message_id:
+                self._drop_pending(handle)
+                return True
+        active = self.active
+        if active is None or (message_id is not None and active.message_id != message_id):
+            return False
+        active.task.cancel()
+        await asyncio.gather(active.task, return_exceptions=True)
+        return True
+
+    async def cancel_all(self):
+        """Drops queued turns and cancels the active run. Used when the session ends."""
+        while self.pending:
+            self._drop_pending(self.pending[0])
+        await self.cancel()
@@ -0,0 +1,211 @@
+# python-backend/sandbox_client.py
+
+import os
+import time
+import random
+import asyncio
+import logging
+import tarfile
+import weakref
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+RETRY_STATUSES = {502, 503, 504}
+
+# Owner of uploaded files: the sandbox image's non-root user.
+SANDBOX_FILE_UID = int(os.getenv("SANDBOX_FILE_UID", "1000"))
+SANDBOX_FILE_GID = int(os.getenv("SANDBOX_FILE_GID", "1000"))
+ARCHIVE_CHUNK_SIZE = 256 * 1024
+_BLOCK = tarfile.BLOCKSIZE
+
+
+def _member_names(names: Sequence[str]) -> List[str]:
+    """Plain file names for the archive: no directories, and unique within it."""
+    taken = set()
+    result = []
+    for name in names:
+        base = os.path.basename(name.replace("\\", "/")).strip() or "unnamed_file"
+        if base in (".", ".."):
+            base = "unnamed_file"
+        stem, ext = os.path.splitext(base)
+        candidate, n = base, 1
+        while candidate in taken:
+            candidate = f"{stem} ({n}){ext}"
+            n += 1
+        taken.add(candidate)
+        result.append(candidate)
+    return result
+
+
+def build_archive(files: Sequence[Any]) -> Tuple[int, List[Tuple[str, int]], AsyncIterator[bytes]]:
+    """
+    A tar archive of `files` (objects with `name`, `size` and either `content` or
+    `filepath`, like attachments.TurnAttachment), as its exact length, the
+    (member name, size) list and an async iterator over its bytes.
+
+    The archive is never assembled: headers are generated, in-memory content is
+    yielded as is, and spooled files are read straight from disk chunk by chunk, so
+    memory stays flat however large the attachments are.
+    """
+    names = _member_names([f.name for f in files])
+    mtime = int(time.time())
+    members = []
+    for name, f in zip(names, files):
+        size = len(f.content) if f.content is not None else os.path.getsize(f.filepath)
+        info = tarfile.TarInfo(name)
+        info.size, info.mtime, info.mode = size, mtime, 0o644
+        info.uid, info.gid = SANDBOX_FILE_UID, SANDBOX_FILE_GID
+        header = info.tobuf(format=tarfile.PAX_FORMAT, encoding="utf-8", errors="surrogateescape")
+        members.append((header, size, f))
+    length = sum(len(header) + size + (-size % _BLOCK) for header, size, _ in members) + 2 * _BLOCK
+
+    async def chunks() -> AsyncIterator[bytes]:
+        for header, size, f in members:
+            yield header
+            if f.content is not None:
+                yield f.content
+            else:
+                sent = 0
+                with open(f.filepath, "rb") as source:
+                    while sent < size:
+                        chunk = await asyncio.to_thread(source.read, min(ARCHIVE_CHUNK_SIZE, size - sent))
+                        if not chunk:
+                            break
+                        sent += len(chunk)
+                        yield chunk
+                if sent < size:
+                    # The file shrank since it was measured; keep the archive well-formed.
+                    yield bytes(size - sent)
+            if size % _BLOCK:
+                yield bytes(-size % _BLOCK)
+        yield bytes(2 * _BLOCK)
+
+    return length, [(name, size) for name, (_, size, _) in zip(names, members)], chunks()
+
+
+class SandboxClient:
+    """
+    The backend's connection to the sandbox manager.
+
+    All sandbox traffic goes through one pooled `httpx.AsyncClient` with keep-alive,
+    created on first use so it belongs to the server's event loop. `user_slot` bounds
+    how many commands one user runs at once, across all their sessions. Only
+    idempotent calls (health, delete) are retried, with jittered exponential backoff;
+    creating a session and running a command are never repeated automatically.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        max_connections: Optional[int] = None,
+        per_user_concurrency: Optional[int] = None,
+        retry_attempts: int = 3,
+        retry_base_delay: float = 0.2,
+    ):
+        self.base_url = (base_url or os.getenv("SANDBOX_API_URL") or "").rstrip("/")
+        self.max_connections = max_connections or int(os.getenv("SANDBOX_HTTP_MAX_CONNECTIONS", "100"))
+        self.per_user_concurrency = per_user_concurrency or int(os.getenv("SANDBOX_MAX_CONCURRENT_PER_USER", "2"))
+        self.retry_attempts = retry_attempts
+        self.retry_base_delay = retry_base_delay
+        self._http: Optional[httpx.AsyncClient] = None
+        # A semaphore lives as long as someone holds or waits on it.
+        self._user_slots: "weakref.WeakValueDictionary[str, asyncio.Semaphore]" = weakref.WeakValueDictionary()
+        self.stats = {"requests": 0, "retries": 0, "waited_for_slot": 0}
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=int(os.getenv("SANDBOX_HTTP_MAX_KEEPALIVE", "20")),
+                    keepalive_expiry=float(os.getenv("SANDBOX_HTTP_KEEPALIVE_EXPIRY", "60")),
+                ),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+            )
+        return self._http
+
+    def user_slot(self, user_id: str) -> asyncio.Semaphore:
+        slot = self._user_slots.get(user_id)
+        if slot is None:
+            slot = asyncio.Semaphore(self.per_user_concurrency)
+            self._user_slots[user_id] = slot
+        if slot.locked():
+            self.stats["waited_for_slot"] += 1
+        return slot
+
+    async def request_idempotent(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Sends a request that is safe to repeat, retrying transport errors and 502/503/504."""
+        for attempt in range(self.retry_attempts):
+            self.stats["requests"] += 1
+            try:
+                response = await self.http.request(method, path, **kwargs)
+                if response.status_code not in RETRY_STATUSES or attempt == self.retry_attempts - 1:
+                    return response
+            except httpx.TransportError:
+                if attempt == self.retry_attempts - 1:
+                    raise
+            self.stats["retries"] += 1
+            # Full jitter: a random delay up to the exponential step.
+            await asyncio.sleep(random.uniform(0, self.retry_base_delay * 2 ** attempt))
+        raise RuntimeError("unreachable")
+
+    async def health(self) -> Dict[str, Any]:
+        response = await self.request_idempotent("GET", "/health", timeout=10)
+        response.raise_for_status()
+        return response.json()
+
+    async def create_session(self, user_id: Optional[str] = None) -> str:
+        """Starts a sandbox session; the manager accounts its executions to `user_id`."""
+        self.stats["requests"] += 1
+        response = await self.http.post("/sessions", json={"user_id": user_id}, timeout=60)
+        response.raise_for_status()
+        return response.json()["session_id"]
+
+    async def delete_session(self, sandbox_id: str) -> bool:
+        """Removes a sandbox session. One that is already gone counts as removed."""
+        response = await self.request_idempotent("DELETE", f"/sessions/{sandbox_id}", timeout=10)
+        if response.status_code == 404:
+            return True
+        response.raise_for_status()
+        return True
+
+    def stream_exec(self, sandbox_id: str, payload: Dict[str, Any], read_timeout: float = 60.0):
+        """The streaming exec response, as an async context manager."""
+        self.stats["requests"] += 1
+        return self.http.stream(
+            "POST", f"/sessions/{sandbox_id}/exec/stream", json=payload,
+            timeout=httpx.Timeout(read_timeout, connect=10.0),
+        )
+
+    async def put_archive(self, sandbox_id: str, path: str, length: int, content: AsyncIterator[bytes]) -> httpx.Response:
+        """Uploads a tar stream to be extracted under `path` in the sandbox."""
+        self.stats["requests"] += 1
+        return await self.http.put(
+            f"/sessions/{sandbox_id}/archive", params={"path": path}, content=content,
+            headers={"Content-Type": "application/x-tar", "Content-Length": str(length)},
+            timeout=httpx.Timeout(60.0, connect=10.0, write=120.0),
+        )
+
+    def stream_archive(self, sandbox_id: str, path: str):
+        """A file or directory of the sandbox as a tar stream, as an async context manager."""
+        self.stats["requests"] += 1
+        return self.http.stream("GET", f"/sessions/{sandbox_id}/archive", params={"path": path}, timeout=httpx.Timeout(60.0, connect=10.0))
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self.stats, "users_with_slots": len(self._user_slots)}
+
+
+sandbox_client = SandboxClient()
+
@@ -1,46 +1,300 @@
 # python-backend/sandbox_tools.py
 import os
-import requests
+import json
+import time
+import asyncio
+import tarfile
+import tempfile
+import httpx
+from typing import Any, Callable, Dict, List, Optional
 from agno.tools import Toolkit
 
+from sandbox_client import SandboxClient, sandbox_client, build_archive
+
+# Downloads are spooled in memory up to this size, then to a temporary file.
+DOWNLOAD_SPOOL_MEMORY = 8 * 1024 * 1024
+DOWNLOAD_MAX_BYTES = int(os.getenv("SANDBOX_DOWNLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+# Text files up to this size are returned in full by `download_files`, within the total budget.
+PREVIEW_FILE_BYTES = 16 * 1024
+PREVIEW_TOTAL_BYTES = 64 * 1024
+
 class SandboxTools(Toolkit):
-    def __init__(self):
+    """
+    Runs shell commands in the sandbox session bound to a backend session.
+
+    The sandbox session is created on first use and recorded in `session_info`
+    ("active_sandbox_id", and "sandbox_ids" so app.py deletes it when the backend
+    session ends). Commands of one backend session share the container, so files
+    and installed packages persist between them.
+
+    The tool is a coroutine, so agno awaits it on the server's event loop instead of
+    parking a worker thread for the length of the command. Requests go through the
+    shared `sandbox_client` connection pool, and at most
+    SANDBOX_MAX_CONCURRENT_PER_USER commands of one user ("user_id" in
+    `session_info`) run at a time; further ones wait for a slot.
+
+    `stage_attachments` copies the current turn's attachments ("turn_attachments" in
+    `session_info`, set by app.py) into the sandbox as one tar stream, and
+    `download_files` reads files back the same way, so file content never has to be
+    written out through shell commands.
+
+    Output is read from the manager's streaming endpoint as it is produced. If
+    `session_info` has a "sandbox_output" callback, live output is passed to it in
+    batches (at most one call per OUTPUT_RELAY_INTERVAL seconds) so the client can
+    show progress of long commands.
+    """
+
+    # Seconds without any bytes from the manager (it sends heartbeats every 10 s).
+    STREAM_READ_TIMEOUT = 60
+    OUTPUT_RELAY_INTERVAL = 0.5
+
+    def __init__(self, session_info: Optional[Dict[str, Any]] = None, client: Optional[SandboxClient] = None):
         super().__init__(
             name="sandbox_tools",
-            tools=[self.execute_shell_command]
+            tools=[self.execute_shell_command, self.stage_attachments, self.download_files]
         )
-        self.sandbox_api_url = os.getenv("SANDBOX_API_URL")
-        if not self.sandbox_api_url:
+        self.client = client or sandbox_client
+        if not self.client.base_url:
             raise ValueError("SANDBOX_API_URL environment variable is not set.")
+        self.session_info = session_info if session_info is not None else {"sandbox_ids": set(), "active_sandbox_id": None}
+        self.session_info.setdefault("sandbox_ids", set())
+        self.session_info.setdefault("active_sandbox_id", None)
+        self._session_lock = asyncio.Lock()
+
+    async def _sandbox_id(self) -> str:
+        """The active sandbox session, created if there is none."""
+        async with self._session_lock:
+            sandbox_id = self.session_info.get("active_sandbox_id")
+            if sandbox_id:
+                return sandbox_id
+            sandbox_id = await self.client.create_session(self.session_info.get("user_id"))
+            self.session_info["sandbox_ids"].add(sandbox_id)
+            self.session_info["active_sandbox_id"] = sandbox_id
+            return sandbox_id
+
+    def _forget(self, sandbox_id: str):
+        self.session_info["sandbox_ids"].discard(sandbox_id)
+        if self.session_info.get("active_sandbox_id") == sandbox_id:
+            self.session_info["active_sandbox_id"] = None
+
+    async def _stream(self, sandbox_id: str, payload: Dict[str, Any], relay: Optional[Callable[[str, str], None]]) -> Dict[str, Any]:
+        """Runs one command through the streaming endpoint and collects its events."""
+        result = {"stdout": "", "stderr": "", "tail": {}, "exit": None, "error": None}
+        pending = {"stdout": "", "stderr": ""}
+        last_relay = time.monotonic()
 
-    def execute_shell_command(self, command: str) -> str:
+        def relay_pending():
+            for stream, text in pending.items():
+                if text:
+                    relay(stream, text)
+                    pending[stream] = ""
+
+        async with self.client.stream_exec(sandbox_id, payload, read_timeout=self.STREAM_READ_TIMEOUT) as response:
+            if response.status_code == 404:
+                return {"missing": True}
+            if response.status_code == 429:
+                await response.aread()
+                detail = response.json().get("detail", "the sandbox service is busy")
+                retry_after = response.headers.get("retry-after")
+                return {"refused": f"{detail} Retry after {retry_after} s." if retry_after else detail}
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                kind = event.get("type")
+                if kind in ("stdout", "stderr"):
+                    result[kind] += event["data"]
+                    pending[kind] += event["data"]
+                elif kind == "tail":
+                    result["tail"][event["stream"]] = event
+                elif kind == "exit":
+                    result["exit"] = event
+                elif kind == "error":
+                    result["error"] = event.get("detail")
+                if relay and time.monotonic() - last_relay >= self.OUTPUT_RELAY_INTERVAL:
+                    relay_pending()
+                    last_relay = time.monotonic()
+        if relay:
+            relay_pending()
+        return result
+
+    async def execute_shell_command(self, command: str, timeout: int = 120) -> str:
         """
         Executes a shell command in a secure, isolated sandbox environment.
         Use this for all shell operations like 'ls', 'cat', 'git clone', or running scripts.
-        
+        Files and installed packages persist between commands in the same conversation.
+
         Args:
             command: The shell command to execute.
+            timeout: Seconds before the command is killed. Raise it for long builds or installs.
 
         Returns:
             A string containing the stdout and stderr from the command execution.
         """
-        api_endpoint = f"{self.sandbox_api_url}/execute"
-        payload = {"command": command}
+        payload = {"command": command, "timeout": timeout}
+        relay = self.session_info.get("sandbox_output")
 
         try:
-            response = requests.post(api_endpoint, json=payload, timeout=70) # Timeout > sandbox timeout
-            response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
-            
-            data = response.json()
-            
+            async with self.client.user_slot(str(self.session_info.get("user_id", "anonymous"))):
+                # A session reaped by the manager (idle or too old) answers 404; start a new one once.
+                restarted = False
+                for attempt in range(2):
+                    sandbox_id = await self._sandbox_id()
+                    result = await self._stream(sandbox_id, payload, relay)
+                    if result.get("missing") and attempt == 0:
+                        self._forget(sandbox_id)
+                        restarted = True
+                        continue
+                    break
+
+            if result.get("missing"):
+                return "Error communicating with the sandbox service: the sandbox session could not be found."
+            if result.get("refused"):
+                return f"The sandbox refused the command: {result['refused']}"
+            if result["error"]:
+                return f"Error communicating with the sandbox service: {result['error']}"
+
             output = ""
-            if data.get("stdout"):
-                output += f"STDOUT:\n{data['stdout']}\n"
-            if data.get("stderr"):
-                output += f"STDERR:\n{data['stderr']}\n"
-            
-            output += f"Exit Code: {data['exit_code']}"
+            if restarted:
+                output += "Note: the previous sandbox expired; files from earlier commands are gone.\n"
+            for stream in ("stdout", "stderr"):
+                text = result[stream]
+                tail = result["tail"].get(stream)
+                if tail:
+                    if tail["omitted_bytes"]:
+                        text += f"\n[... {tail['omitted_bytes']} bytes omitted ...]\n"
+                    text += tail["data"]
+                if text:
+                    output += f"{stream.upper()}:\n{text}\n"
+
+            exit_event = result["exit"]
+            if exit_event is None:
+                return output + "Error communicating with the sandbox service: the output stream ended early."
+            if exit_event["timed_out"]:
+                output += f"The command was killed after exceeding its {timeout} s timeout.\n"
+            if exit_event["truncated"]:
+                output += f"Output was truncated; the full log is available from the sandbox service as {exit_event['log_id']}.\n"
+            usage = exit_event.get("usage")
+            if usage:
+                output += _usage_line(usage)
+            output += f"Exit Code: {exit_event['exit_code']}"
             return output
 
-        except requests.RequestException as e:
-            return f"Error communicating with the sandbox service: {e}"
\ No newline at end of file
+        except (httpx.HTTPError, ValueError) as e:
+            return f"Error communicating with the sandbox service: {e}"
+
+    async def stage_attachments(self, directory: str = "attachments") -> str:
+        """
+        Copies all files attached to the current message into the sandbox in one step.
+        Use this instead of writing attachment contents with echo or heredocs; binary
+        files are copied intact.
+
+        Args:
+            directory: Directory to put the files in, relative to the home directory. Created if missing.
+
+        Returns:
+            The directory and the names and sizes of the staged files.
+        """
+        attachments = self.session_info.get("turn_attachments") or []
+        if not attachments:
+            return "There are no attachments in the current message."
+
+        try:
+            async with self.client.user_slot(str(self.session_info.get("user_id", "anonymous"))):
+                restarted = False
+                for attempt in range(2):
+                    sandbox_id = await self._sandbox_id()
+                    # A fresh stream per attempt; the first one may have been partly sent.
+                    length, members, content = build_archive(attachments)
+                    response = await self.client.put_archive(sandbox_id, directory, length, content)
+                    if response.status_code == 404 and attempt == 0:
+                        self._forget(sandbox_id)
+                        restarted = True
+                        continue
+                    break
+            response.raise_for_status()
+            target = response.json()["path"]
+        except (httpx.HTTPError, OSError, ValueError) as e:
+            return f"Error communicating with the sandbox service: {e}"
+
+        output = ""
+        if restarted:
+            output += "Note: the previous sandbox expired; files from earlier commands are gone.\n"
+        output += f"Staged {len(members)} files in {target}:\n"
+        output += "\n".join(f"- {name} ({size} bytes)" for name, size in members)
+        return output
+
+    async def download_files(self, path: str) -> str:
+        """
+        Reads a file, or every file in a directory, from the sandbox in one step.
+        Small text files are returned in full; larger or binary files are listed with their size.
+
+        Args:
+            path: File or directory in the sandbox, absolute or relative to the home directory.
+
+        Returns:
+            The files found, with the contents of small text files.
+        """
+        sandbox_id = self.session_info.get("active_sandbox_id")
+        if not sandbox_id:
+            return "There is no sandbox yet; run a command or stage attachments first."
+
+        try:
+            async with self.client.user_slot(str(self.session_info.get("user_id", "anonymous"))):
+                with tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_MEMORY) as spool:
+                    async with self.client.stream_archive(sandbox_id, path) as response:
+                        if response.status_code == 404:
+                            await response.aread()
+                            return f"Error: {response.json().get('detail', 'not found')}"
+                        response.raise_for_status()
+                        received = 0
+                        async for chunk in response.aiter_bytes():
+                            received += len(chunk)
+                            if received > DOWNLOAD_MAX_BYTES:
+                                return f"Error: '{path}' is larger than the {DOWNLOAD_MAX_BYTES} byte download limit."
+                            await asyncio.to_thread(spool.write, chunk)
+                    spool.seek(0)
+                    return await asyncio.to_thread(_describe_archive, spool)
+        except (httpx.HTTPError, tarfile.TarError, ValueError) as e:
+            return f"Error communicating with the sandbox service: {e}"
+
+
+def _usage_line(usage: Dict[str, Any]) -> str:
+    """One line of the resources an execution used, so the model can notice limits."""
+    parts = [f"{usage['wall_seconds']:.1f} s wall"]
+    if usage.get("cpu_seconds") is not None:
+        parts.append(f"{usage['cpu_seconds']:.1f} s CPU")
+    if usage.get("peak_memory_bytes") is not None:
+        peak = f"peak memory {usage['peak_memory_bytes'] / 2 ** 20:.0f} MiB"
+        if usage.get("memory_limit_bytes"):
+            peak += f" of {usage['memory_limit_bytes'] / 2 ** 20:.0f} MiB"
+        parts.append(peak)
+    return f"Resources: {', '.join(parts)}.\n"
+
+
+def _describe_archive(fileobj) -> str:
+    """Lists the files of a tar stream and includes small UTF-8 files in full."""
+    lines: List[str] = []
+    budget = PREVIEW_TOTAL_BYTES
+    with tarfile.open(fileobj=fileobj, mode="r|") as archive:
+        for member in archive:
+            if member.isdir():
+                continue
+            if not member.isfile():
+                lines.append(f"- {member.name} (link or special file)")
+                continue
+            text = None
+            if member.size <= min(PREVIEW_FILE_BYTES, budget):
+                data = archive.extractfile(member).read()
+                try:
+                    text = data.decode("utf-8")
+                except UnicodeDecodeError:
+                    text = None
+            if text is None:
+                lines.append(f"- {member.name} ({member.size} bytes)")
+                continue
+            budget -= member.size
+            lines.append(f"- {member.name} ({member.size} bytes):\n{text}")
+    return "\n".join(lines) if lines else "No files found."
+
@@ -0,0 +1,167 @@
+# python-backend/screenshot_pipeline.py
+
+import io
+import os
+import json
+import uuid
+import base64
+import struct
+import hashlib
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+try:
+    from PIL import Image as PILImage
+except ImportError:  # Pillow is optional; without it screenshots are only deduplicated.
+    PILImage = None
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+DELIVERY_INLINE = "inline"
+DELIVERY_BINARY = "binary"
+
+
+@dataclass
+class ScreenshotSettings:
+    """
+    How browser screenshots are prepared before they reach the agent and the client.
+
+    Attributes:
+        max_width: Screenshots wider than this are downscaled, keeping the aspect ratio.
+        max_bytes: Target size of the encoded image; quality and then size are reduced to meet it.
+        image_format: "WEBP" or "JPEG".
+        quality: Starting encoder quality.
+        min_quality: Quality is never reduced below this.
+        dedupe: Omit the image when the page looks exactly like the previous screenshot.
+        delivery: "inline" embeds base64 in the tool result, "binary" sends it as a
+                  separate binary WebSocket frame referenced by `screenshot_id`.
+    """
+    max_width: int = 1280
+    max_bytes: int = 150_000
+    image_format: str = "WEBP"
+    quality: int = 80
+    min_quality: int = 30
+    dedupe: bool = True
+    delivery: str = DELIVERY_INLINE
+
+    @classmethod
+    def from_env(cls) -> "ScreenshotSettings":
+        return cls(
+            max_width=int(os.getenv("SCREENSHOT_MAX_WIDTH", "1280")),
+            max_bytes=int(os.getenv("SCREENSHOT_MAX_BYTES", "150000")),
+            image_format=os.getenv("SCREENSHOT_FORMAT", "WEBP").upper(),
+            quality=int(os.getenv("SCREENSHOT_QUALITY", "80")),
+            min_quality=int(os.getenv("SCREENSHOT_MIN_QUALITY", "30")),
+            dedupe=os.getenv("SCREENSHOT_DEDUPE", "true").lower() in ("1", "true", "yes"),
+            delivery=os.getenv("SCREENSHOT_DELIVERY", DELIVERY_INLINE).lower(),
+        )
+
+
+def encode_binary_frame(header: Dict[str, Any], payload: bytes) -> bytes:
+    """
+    Packs a binary WebSocket frame: a 4-byte big-endian header length, the UTF-8
+    JSON header, then the raw payload.
+    """
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    return struct.pack(">I", len(header_bytes)) + header_bytes + payload
+
+
+class ScreenshotPipeline:
+    """
+    Downscales, re-encodes and deduplicates the screenshots of one browser session.
+    In binary delivery mode, processed images wait in `pending` until the connection
+    sends them with `drain_frames`, after each tool call. The queue is not bounded: the
+    model has already been given every queued `screenshot_id`, so none may be dropped.
+
+    `process` decodes and re-encodes images, so callers on the event loop run it in a
+    thread; calls for the same session are serialized.
+    """
+
+    def __init__(self, settings: Optional[ScreenshotSettings] = None):
+        self.settings = settings or ScreenshotSettings.from_env()
+        self._last_hash: Optional[str] = None
+        self.pending: Deque[Tuple[str, str, bytes]] = deque()
+        self._lock = threading.Lock()
+        self.stats = {"screenshots": 0, "deduplicated": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def _encode(self, image) -> Tuple[bytes, str]:
+        fmt = self.settings.image_format if self.settings.image_format in ("WEBP", "JPEG") else "JPEG"
+        mime = f"image/{fmt.lower()}"
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        encoded = b""
+        for _ in range(4):
+            quality = self.settings.quality
+            while True:
+                buffer = io.BytesIO()
+                image.save(buffer, format=fmt, quality=quality, optimize=True)
+                encoded = buffer.getvalue()
+                if len(encoded) <= self.settings.max_bytes or quality <= self.settings.min_quality:
+                    break
+                quality = max(self.settings.min_quality, quality - 10)
+            if len(encoded) <= self.settings.max_bytes:
+                break
+            width, height = image.size
+            image = image.resize((max(1, int(width * 0.75)), max(1, int(height * 0.75))), PILImage.LANCZOS)
+        return encoded, mime
+
+    def process(self, screenshot_base64: Optional[str]) -> Dict[str, Any]:
+        """
+        Returns the screenshot fields to merge into a browser state result: either
+        `screenshot_base64`, or `screenshot_id` in binary mode, plus `screenshot_mime`;
+        or `screenshot_unchanged: True` when the page looks the same as last time.
+        """
+        if not screenshot_base64:
+            return {"screenshot_base64": None}
+        with self._lock:
+            return self._process(screenshot_base64)
+
+    def _process(self, screenshot_base64: str) -> Dict[str, Any]:
+        raw = base64.b64decode(screenshot_base64)
+        self.stats["screenshots"] += 1
+        self.stats["bytes_in"] += len(raw)
+
+        if PILImage is not None:
+            image = PILImage.open(io.BytesIO(raw))
+            image.load()
+            if image.width > self.settings.max_width:
+                height = max(1, round(image.height * self.settings.max_width / image.width))
+                image = image.resize((self.settings.max_width, height), PILImage.LANCZOS)
+            # Hash the pixels rather than the file, so re-encoding noise does not defeat deduplication.
+            content_hash = hashlib.blake2b(image.tobytes(), digest_size=16).hexdigest()
+        else:
+            image = None
+            content_hash = hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+        if self.settings.dedupe and content_hash == self._last_hash:
+            self.stats["deduplicated"] += 1
+            return {"screenshot_unchanged": True}
+        self._last_hash = content_hash
+
+        if image is not None:
+            encoded, mime = self._encode(image)
+        else:
+            encoded, mime = raw, "image/png"
+        self.stats["bytes_out"] += len(encoded)
+
+        if self.settings.delivery == DELIVERY_BINARY:
+            screenshot_id = uuid.uuid4().hex
+            self.pending.append((screenshot_id, mime, encoded))
+            return {"screenshot_id": screenshot_id, "screenshot_mime": mime}
+        return {"screenshot_base64": base64.b64encode(encoded).decode("ascii"), "screenshot_mime": mime}
+
+    def drain_frames(self, message_id: Optional[str] = None) -> List[bytes]:
+        """Returns the pending screenshots as binary WebSocket frames and clears them."""
+        frames = []
+        while self.pending:
+            screenshot_id, mime, payload = self.pending.popleft()
+            header = {"type": "screenshot", "screenshot_id": screenshot_id, "mime": mime, "id": message_id}
+            frames.append(encode_binary_frame(header, payload))
+        return frames
@@ -0,0 +1,107 @@
+# python-backend/session_summaries.py
+
+import json
+import base64
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_TABLE = "ai_os_session_summaries"
+SUMMARY_FIELDS = "session_id, title, turn_count, last_message_preview, byte_size, created_at, updated_at"
+TITLE_LENGTH = 80
+PREVIEW_LENGTH = 160
+CONTEXT_MARKER = "Current message:"
+
+
+def display_text(content: Optional[str]) -> str:
+    """The part of a stored message a person typed, without the injected context."""
+    text = content or ""
+    index = text.rfind(CONTEXT_MARKER)
+    if index != -1:
+        text = text[index + len(CONTEXT_MARKER):]
+    return text.strip()
+
+
+def summarize_session(row: Dict[str, Any]) -> Dict[str, Any]:
+    """The ai_os_session_summaries row for an ai_os_sessions row that is being saved."""
+    runs = (row.get("memory") or {}).get("runs") or []
+    first_user = next((r for r in runs if r.get("role") == "user" and (r.get("content") or "").strip()), None)
+    title = display_text(first_user["content"]).split("\n")[0].strip()[:TITLE_LENGTH] if first_user else None
+    last = runs[-1] if runs else None
+    preview = display_text(last.get("content")) if last else ""
+    return {
+        "session_id": row["session_id"],
+        "user_id": row["user_id"],
+        "title": title or None,
+        "turn_count": len(runs),
+        "last_message_preview": preview[:PREVIEW_LENGTH] or None,
+        "byte_size": len(json.dumps(row.get("memory") or {}, separators=(",", ":")).encode("utf-8")),
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+
+
+def encode_cursor(updated_at: int, session_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{updated_at}:{session_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, str]:
+    """Raises ValueError for a malformed cursor."""
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    updated_at, session_id = raw.split(":", 1)
+    if not session_id or any(c in session_id for c in ",()"):
+        raise ValueError("invalid cursor")
+    return int(updated_at), session_id
+
+
+def etag_for(payload: Any) -> str:
+    """A weak ETag over the response body."""
+    digest = hashlib.blake2b(json.dumps(payload, sort_keys=True, default=str).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or etag[2:] in candidates
+
+
+async def list_summaries(client, user_id: str, limit: int, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """One page of a user's sessions, newest first, with the cursor for the next page."""
+    query = client.from_(SUMMARY_TABLE).select(SUMMARY_FIELDS).eq("user_id", user_id)
+    if cursor:
+        updated_at, session_id = decode_cursor(cursor)
+        query = query.or_(f"updated_at.lt.{updated_at},and(updated_at.eq.{updated_at},session_id.lt.{session_id})")
+    # One extra row tells us whether there is a next page.
+    response = await query.order("updated_at", desc=True).order("session_id", desc=True).limit(limit + 1).execute()
+    rows: List[Dict[str, Any]] = response.data or []
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["updated_at"], rows[-1]["session_id"])
+    return {"sessions": rows, "next_cursor": next_cursor}
+
+
+async def get_turns(client, user_id: str, session_id: str, offset: int, limit: int) -> Optional[Dict[str, Any]]:
+    """One page of a session's turns, or None if the user has no such session."""
+    summary = await client.from_(SUMMARY_TABLE).select("turn_count, updated_at") \
+        .eq("user_id", user_id).eq("session_id", session_id).limit(1).execute()
+    if not summary.data:
+        return None
+    turn_count = summary.data[0]["turn_count"]
+    response = await client.rpc("session_turns", {
+        "p_user_id": user_id, "p_session_id": session_id, "p_offset": offset, "p_limit": limit,
+    }).execute()
+    turns = [{"role": t["role"], "content": t["content"], "timestamp": t["timestamp"]} for t in response.data or []]
+    next_offset = offset + len(turns) if offset + len(turns) < turn_count else None
+    return {
+        "session_id": session_id,
+        "turn_count": turn_count,
+        "updated_at": summary.data[0]["updated_at"],
+        "turns": turns,
+        "next_offset": next_offset,
+    }
+
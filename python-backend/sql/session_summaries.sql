@@ -0,0 +1,52 @@
+-- Compact per-session rows for the chat history sidebar, plus a function that pages
+-- through one session's turns. The backend writes a summary whenever it saves a session
+-- (see session_summaries.py); the sidebar never has to download memory.runs.
+-- Apply once in the Supabase SQL editor (or with psql) after ai_os_sessions exists.
+
+create table if not exists public.ai_os_session_summaries (
+    session_id           text    primary key,
+    user_id              text    not null,
+    title                text,
+    turn_count           integer not null default 0,
+    last_message_preview text,
+    byte_size            integer not null default 0,
+    created_at           bigint  not null,
+    updated_at           bigint  not null
+);
+
+-- Serves the keyset-paginated listing: newest first, session_id breaking ties.
+create index if not exists ai_os_session_summaries_user_recent
+    on public.ai_os_session_summaries (user_id, updated_at desc, session_id desc);
+
+create or replace function public.session_turns(p_user_id text, p_session_id text, p_offset integer, p_limit integer)
+returns table (idx integer, role text, content text, "timestamp" text)
+language sql stable as $$
+    select (t.ordinality - 1)::integer, t.turn->>'role', t.turn->>'content', t.turn->>'timestamp'
+    from public.ai_os_sessions s,
+         jsonb_array_elements(s.memory::jsonb->'runs') with ordinality as t(turn, ordinality)
+    where s.session_id = p_session_id and s.user_id = p_user_id
+    order by t.ordinality
+    offset p_offset limit p_limit;
+$$;
+
+-- Backfill summaries for sessions saved before this table existed.
+insert into public.ai_os_session_summaries
+    (session_id, user_id, title, turn_count, last_message_preview, byte_size, created_at, updated_at)
+select s.session_id,
+       s.user_id,
+       left(trim(split_part(trim(regexp_replace(first_user.content, '^.*Current message:', '')), E'\n', 1)), 80),
+       coalesce(jsonb_array_length(s.memory::jsonb->'runs'), 0),
+       left(s.memory::jsonb->'runs'->-1->>'content', 160),
+       octet_length(s.memory::text),
+       s.created_at,
+       coalesce(s.updated_at, s.created_at)
+from public.ai_os_sessions s
+left join lateral (
+    select t.turn->>'content' as content
+    from jsonb_array_elements(s.memory::jsonb->'runs') with ordinality as t(turn, ordinality)
+    where t.turn->>'role' = 'user' and coalesce(trim(t.turn->>'content'), '') <> ''
+    order by t.ordinality
+    limit 1
+) first_user on true
+where s.user_id is not null and jsonb_typeof(s.memory::jsonb->'runs') = 'array'
+on conflict (session_id) do nothing;
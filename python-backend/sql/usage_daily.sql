@@ -0,0 +1,54 @@
+-- Per-user daily token totals, maintained from request_logs.
+-- Quota checks read one row per user and day instead of summing raw request_logs rows.
+-- Apply once in the Supabase SQL editor (or with psql) after request_logs exists.
+
+create table if not exists public.usage_daily (
+    user_id       uuid        not null,
+    day           date        not null,
+    input_tokens  bigint      not null default 0,
+    output_tokens bigint      not null default 0,
+    total_tokens  bigint      generated always as (input_tokens + output_tokens) stored,
+    log_rows      integer     not null default 0,
+    updated_at    timestamptz not null default now(),
+    primary key (user_id, day)
+);
+
+create or replace function public.roll_up_request_log() returns trigger
+language plpgsql as $$
+begin
+    insert into public.usage_daily as u (user_id, day, input_tokens, output_tokens, log_rows)
+    values (
+        new.user_id::uuid,
+        (coalesce(new.created_at, now()) at time zone 'utc')::date,
+        coalesce(new.input_tokens, 0),
+        coalesce(new.output_tokens, 0),
+        1
+    )
+    on conflict (user_id, day) do update set
+        input_tokens  = u.input_tokens  + excluded.input_tokens,
+        output_tokens = u.output_tokens + excluded.output_tokens,
+        log_rows      = u.log_rows      + 1,
+        updated_at    = now();
+    return new;
+end;
+$$;
+
+drop trigger if exists request_logs_roll_up on public.request_logs;
+create trigger request_logs_roll_up
+    after insert on public.request_logs
+    for each row execute function public.roll_up_request_log();
+
+-- Backfill from the rows logged before the trigger existed.
+insert into public.usage_daily (user_id, day, input_tokens, output_tokens, log_rows)
+select user_id::uuid,
+       (coalesce(created_at, now()) at time zone 'utc')::date,
+       sum(coalesce(input_tokens, 0)),
+       sum(coalesce(output_tokens, 0)),
+       count(*)
+from public.request_logs
+group by 1, 2
+on conflict (user_id, day) do update set
+    input_tokens  = excluded.input_tokens,
+    output_tokens = excluded.output_tokens,
+    log_rows      = excluded.log_rows,
+    updated_at    = now();
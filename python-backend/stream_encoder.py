@@ -0,0 +1,284 @@
+# python-backend/stream_encoder.py
+
+import os
+import json
+import asyncio
+import logging
+import weakref
+import contextlib
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; clients asking for it get compact JSON instead.
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+ENCODING_JSON = "json"        # The original frames, one JSON object per event.
+ENCODING_COMPACT = "compact"  # JSON with the short keys below and redundant fields dropped.
+ENCODING_MSGPACK = "msgpack"  # The compact schema, packed with msgpack in binary frames.
+
+# Short keys for the compact encodings. Sent to the client in the connect message.
+COMPACT_KEYS = {
+    "content": "c",
+    "streaming": "s",
+    "id": "i",
+    "agent_name": "a",
+    "team_name": "tn",
+    "is_log": "l",
+    "done": "d",
+    "type": "t",
+    "name": "n",
+    "error": "e",
+    "tool": "tl",
+    "message": "m",
+    "reset": "r",
+}
+
+
+def negotiate_encoding(requested: Optional[str]) -> str:
+    """Picks the encoding for a connection from what the client asked for at connect time."""
+    requested = (requested or os.getenv("STREAM_ENCODING", ENCODING_JSON)).lower()
+    if requested == ENCODING_MSGPACK and msgpack is None:
+        logger.warning("msgpack is not installed; falling back to compact JSON.")
+        return ENCODING_COMPACT
+    if requested in (ENCODING_JSON, ENCODING_COMPACT, ENCODING_MSGPACK):
+        return requested
+    return ENCODING_JSON
+
+
+def compact_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Applies the short-key schema, dropping null values and a team_name equal to agent_name."""
+    compact = {}
+    for key, value in payload.items():
+        if value is None:
+            continue
+        if key == "team_name" and value == payload.get("agent_name"):
+            continue
+        compact[COMPACT_KEYS.get(key, key)] = value
+    return compact
+
+
+class _Outbound:
+    """One queued frame. `key` is set for content deltas so adjacent ones can be merged."""
+    __slots__ = ("kind", "payload", "key")
+
+    def __init__(self, kind: str, payload: Any, key: Optional[Tuple[Any, Any, bool]] = None):
+        self.kind = kind
+        self.payload = payload
+        self.key = key
+
+
+class StreamEncoder:
+    """
+    Writes one connection's stream events to its WebSocket.
+
+    Content deltas for the same message, owner and log flag are coalesced and flushed
+    after `flush_interval` seconds or once `flush_bytes` characters are buffered,
+    whichever comes first. Any other event flushes the buffer first, so ordering is
+    preserved. A `flush_interval` of 0 sends every delta as it arrives.
+
+    Frames go through an outbound queue drained by a dedicated writer task, so a slow
+    client never blocks the agent run that produces them. While the client lags,
+    content is merged into the queued delta it follows, and once `max_queue` frames
+    are waiting, member log chunks (`is_log`) are dropped. All other events, including
+    `done`, `error` and `tool_end`, are always delivered.
+    """
+
+    def __init__(
+        self,
+        websocket,
+        encoding: str = ENCODING_JSON,
+        flush_interval: Optional[float] = None,
+        flush_bytes: Optional[int] = None,
+        max_queue: Optional[int] = None,
+    ):
+        self.websocket = websocket
+        self.encoding = encoding
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.getenv("STREAM_FLUSH_MS", "30")) / 1000
+        self.flush_bytes = flush_bytes if flush_bytes is not None else int(os.getenv("STREAM_FLUSH_BYTES", "2048"))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("STREAM_QUEUE_MAX", "64"))
+        self._buffer: List[str] = []
+        self._buffer_size = 0
+        self._buffer_key: Optional[Tuple[Any, Any, bool]] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._queue: Deque[_Outbound] = deque()
+        self._queue_ready = asyncio.Event()
+        self._writer_task: Optional[asyncio.Task] = None
+        self._sending = False
+        self._closed = False
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.max_depth = 0
+        self.merged = 0
+        self.dropped = 0
+        _live_encoders.add(self)
+
+    def hello(self) -> Dict[str, Any]:
+        """Describes the negotiated framing, for the connect message."""
+        info = {
+            "encoding": self.encoding,
+            "flush_ms": int(self.flush_interval * 1000),
+            "flush_bytes": self.flush_bytes,
+        }
+        if self.encoding != ENCODING_JSON:
+            info["keys"] = COMPACT_KEYS
+        return info
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "merged": self.merged,
+            "dropped": self.dropped,
+            "frames_sent": self.frames_sent,
+            "bytes_sent": self.bytes_sent,
+        }
+
+    # --- Queue side (called by producers, never blocks) ---
+
+    def _push(self, item: _Outbound):
+        if self._closed:
+            return
+        self._queue.append(item)
+        if len(self._queue) > self.max_depth:
+            self.max_depth = len(self._queue)
+        self._queue_ready.set()
+        if self._writer_task is None:
+            self._writer_task = asyncio.create_task(self._writer())
+
+    def _enqueue_content(self, key: Tuple[Any, Any, bool], content: str):
+        tail = self._queue[-1] if self._queue else None
+        if tail is not None and tail.kind == "content" and tail.key == key:
+            # The client has not taken the previous delta yet; ride along with it.
+            tail.payload["content"] += content
+            self.merged += 1
+            return
+        message_id, owner_name, is_log = key
+        if is_log and len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._push(_Outbound("content", {
+            "content": content,
+            "streaming": True,
+            "id": message_id,
+            "agent_name": owner_name,
+            "team_name": owner_name,
+            "is_log": is_log,
+        }, key))
+
+    def _flush_buffer(self):
+        if self._flush_task is not None and self._flush_task is not asyncio.current_task():
+            self._flush_task.cancel()
+        self._flush_task = None
+        if not self._buffer:
+            return
+        key, content = self._buffer_key, "".join(self._buffer)
+        self._buffer, self._buffer_size, self._buffer_key = [], 0, None
+        self._enqueue_content(key, content)
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.flush_interval)
+            self._flush_buffer()
+        except asyncio.CancelledError:
+            pass
+
+    async def send_content(self, message_id: Optional[str], owner_name: Optional[str], is_log: bool, content: str):
+        """Buffers a content delta, flushing when the window or size limit is reached."""
+        if not content:
+            return
+        key = (message_id, owner_name, is_log)
+        if self._buffer and key != self._buffer_key:
+            self._flush_buffer()
+        self._buffer_key = key
+        self._buffer.append(content)
+        self._buffer_size += len(content)
+        if self.flush_interval <= 0 or self._buffer_size >= self.flush_bytes:
+            self._flush_buffer()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def send_event(self, payload: Dict[str, Any]):
+        """Queues a non-content event after any buffered content. Never dropped."""
+        self._flush_buffer()
+        self._push(_Outbound("event", payload))
+
+    async def send_bytes(self, data: bytes):
+        """Queues a binary frame as-is after any buffered content. Never dropped."""
+        self._flush_buffer()
+        self._push(_Outbound("bytes", data))
+
+    async def flush(self):
+        self._flush_buffer()
+
+    # --- Writer side ---
+
+    def _encode(self, item: _Outbound):
+        if item.kind == "bytes":
+            return item.payload
+        if self.encoding == ENCODING_MSGPACK:
+            return msgpack.packb(compact_payload(item.payload), default=str)
+        if self.encoding == ENCODING_COMPACT:
+            return json.dumps(compact_payload(item.payload), separators=(",", ":"), default=str)
+        return json.dumps(item.payload, default=str)
+
+    async def _writer(self):
+        try:
+            while True:
+                while not self._queue:
+                    self._queue_ready.clear()
+                    await self._queue_ready.wait()
+                data = self._encode(self._queue.popleft())
+                self._sending = True
+                await self.websocket.send(data)
+                self._sending = False
+                self.frames_sent += 1
+                self.bytes_sent += len(data.encode("utf-8")) if isinstance(data, str) else len(data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The client is gone; discard what is left instead of holding it.
+            logger.info(f"Stream writer stopped with {len(self._queue)} frames queued: {e}")
+            self._closed = True
+            self._queue.clear()
+
+    async def close(self, timeout: float = 5.0):
+        """Delivers what is queued (up to `timeout` seconds) and stops the writer."""
+        self._flush_buffer()
+        if self._writer_task is not None and not self._writer_task.done():
+            deadline = asyncio.get_running_loop().time() + timeout
+            # The writer pops a frame before sending it, so wait for that one too.
+            while (self._queue or self._sending) and not self._closed and asyncio.get_running_loop().time() < deadline:
+                await asyncio.sleep(0.01)
+            self._writer_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._writer_task
+        self._closed = True
+        self._queue.clear()
+        _live_encoders.discard(self)
+
+
+_live_encoders: "weakref.WeakSet[StreamEncoder]" = weakref.WeakSet()
+
+
+def stream_metrics() -> Dict[str, Any]:
+    """Queue depth and drop counts across the open connections."""
+    encoders = list(_live_encoders)
+    return {
+        "connections": len(encoders),
+        "queued_frames": sum(e.depth for e in encoders),
+        "max_depth": max((e.max_depth for e in encoders), default=0),
+        "merged": sum(e.merged for e in encoders),
+        "dropped": sum(e.dropped for e in encoders),
+    }
+
@@ -1,13 +1,27 @@
 # supabase_client.py (Corrected and Final Version)
 
 import os
-import supabase
-from dotenv import load_dotenv
+import asyncio
 import logging
+import threading
+import concurrent.futures
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+from dotenv import load_dotenv
+from supabase import AsyncClient, AsyncClientOptions
+
+try:
+    import h2  # noqa: F401  (HTTP/2 support for httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 load_dotenv()
 
+T = TypeVar("T")
+
 # --- CRITICAL FIX: Use the SERVICE_ROLE KEY for backend operations ---
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_SERVICE_KEY") # <-- Use the service key
@@ -15,8 +29,94 @@ supabase_key = os.getenv("SUPABASE_SERVICE_KEY") # <-- Use the service key
 if not supabase_url or not supabase_key:
     raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set in your environment.")
 
-logger.info(f"Initializing Supabase client with URL: {supabase_url}")
-supabase_client = supabase.create_client(supabase_url, supabase_key)
 
-# --- REMOVED ---
-# The old, deprecated functions are removed. The client object is all that's needed.
\ No newline at end of file
+def build_http_client(max_connections: Optional[int] = None) -> httpx.AsyncClient:
+    """
+    The pooled HTTP client behind the Supabase clients. PostgREST, Storage, Auth and
+    Functions all share it, so requests reuse warm (HTTP/2 when available) connections.
+    """
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=max_connections or int(os.getenv("SUPABASE_HTTP_MAX_CONNECTIONS", "50")),
+            max_keepalive_connections=int(os.getenv("SUPABASE_HTTP_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("SUPABASE_HTTP_KEEPALIVE_EXPIRY", "30")),
+        ),
+        timeout=httpx.Timeout(
+            float(os.getenv("SUPABASE_HTTP_TIMEOUT", "30")),
+            connect=float(os.getenv("SUPABASE_HTTP_CONNECT_TIMEOUT", "5")),
+        ),
+    )
+
+
+def build_async_client(url: str, key: str, http_client: httpx.AsyncClient) -> AsyncClient:
+    return AsyncClient(url, key, options=AsyncClientOptions(httpx_client=http_client))
+
+
+class SupabaseSyncFacade:
+    """
+    Blocking access to Supabase for toolkit code that cannot be async.
+
+    Calls run on a private event loop in a worker thread, with its own async client
+    and connection pool (httpx pools are bound to the loop that uses them). `run`
+    blocks the calling thread until the result is ready; `submit` returns a future
+    immediately and suits write-backs nobody waits for. Code that runs on the server's
+    event loop should await `supabase_client` instead, since `run` would block it.
+    """
+
+    def __init__(self, url: str, key: str, max_connections: int = 10):
+        self.url = url
+        self.key = key
+        self.max_connections = max_connections
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[AsyncClient] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="supabase-sync", daemon=True).start()
+                self._http_client = build_http_client(self.max_connections)
+                self._client = build_async_client(self.url, self.key, self._http_client)
+                self._loop = loop
+            return self._loop
+
+    def submit(self, call: Callable[[AsyncClient], Awaitable[T]]) -> "concurrent.futures.Future[T]":
+        """Schedules `call(client)` on the facade's loop without waiting for it."""
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(self._invoke(call), loop)
+
+    async def _invoke(self, call: Callable[[AsyncClient], Awaitable[T]]) -> T:
+        return await call(self._client)
+
+    def run(self, call: Callable[[AsyncClient], Awaitable[T]], timeout: Optional[float] = None) -> T:
+        """Runs `call(client)` on the facade's loop and blocks until it returns."""
+        try:
+            asyncio.get_running_loop()
+            logger.warning("SupabaseSyncFacade.run was called from a running event loop; it will block that loop.")
+        except RuntimeError:
+            pass
+        return self.submit(call).result(timeout)
+
+    def close(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._http_client.aclose(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+
+
+logger.info(f"Initializing Supabase client with URL: {supabase_url} (HTTP/2: {HTTP2_AVAILABLE})")
+http_client = build_http_client()
+supabase_client = build_async_client(supabase_url, supabase_key, http_client)
+supabase_sync = SupabaseSyncFacade(supabase_url, supabase_key)
+
+
+async def close_supabase_clients():
+    """Closes the pooled connections. Called when the server shuts down."""
+    await http_client.aclose()
+    await asyncio.to_thread(supabase_sync.close)
+
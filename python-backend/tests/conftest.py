@@ -0,0 +1,25 @@
+# python-backend/tests/conftest.py
+import os
+
+import pytest
+
+from tests.support import StubServer
+
+# supabase_client refuses to import without these; tests point the clients at stubs.
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-service-key")
+
+
+@pytest.fixture
+def serve():
+    """Starts StubServers for handler classes; all are shut down after the test."""
+    servers = []
+
+    def start(handler) -> StubServer:
+        server = StubServer(handler)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
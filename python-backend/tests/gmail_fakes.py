@@ -0,0 +1,165 @@
+# python-backend/tests/gmail_fakes.py
+#
+# A stand-in for the Gmail API transport. googleapiclient builds real requests (single
+# and batch) and parses real responses; only httplib2 is replaced, by an object that
+# answers each request from an `answer(uri)` function after a simulated round trip.
+# FakeMailbox is a small mailbox with labels and a history that can expire.
+import json
+import time
+import threading
+import email.parser
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import httplib2
+from googleapiclient.discovery import build
+
+ROUND_TRIP = 0.04  # Seconds per HTTP request to the Gmail API.
+NAMES = ["alice", "bob", "carol", "dave", "erin", "frank", "grace", "heidi", "ivan", "judy"]
+TOPICS = ["Quarterly report", "Invoice", "Team offsite", "Release notes", "Security review"]
+LABELS = [
+    {"id": name, "name": name} for name in ("INBOX", "UNREAD", "STARRED", "IMPORTANT", "SENT", "SPAM", "TRASH")
+] + [{"id": "Label_1", "name": "Work/Clients"}]
+# messages.list leaves these out unless asked for them.
+HIDDEN_LABELS = {"SPAM", "TRASH"}
+BASE_DATE = 1_735_689_600_000  # 2025-01-01 UTC, in ms.
+
+Answer = Callable[[str], Tuple[int, Dict]]
+
+
+class FakeGmailHttp:
+    """httplib2.Http stand-in answering single and batch Gmail API requests with `answer`."""
+
+    BOUNDARY = "batch_fixture"
+
+    def __init__(self, answer: Answer, per_item: float = 0.0):
+        self.answer = answer
+        self.per_item = per_item  # Server time per call inside a batch.
+        self.requests = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        with self._lock:
+            self.requests += 1
+        time.sleep(ROUND_TRIP)
+        if not urlparse(uri).path.startswith("/batch"):
+            status, payload = self.answer(uri)
+            content = json.dumps(payload).encode()
+            response = httplib2.Response({"status": status, "content-type": "application/json"})
+        else:
+            content = self._batch(body, headers["content-type"])
+            response = httplib2.Response({"status": 200, "content-type": f"multipart/mixed; boundary={self.BOUNDARY}"})
+        with self._lock:
+            self.bytes += len(content)
+        return response, content
+
+    def _batch(self, body: str, content_type: str) -> bytes:
+        request = email.parser.Parser().parsestr(f"Content-Type: {content_type}\r\n\r\n{body}")
+        parts = []
+        for part in request.get_payload():
+            _, path, _ = part.get_payload().splitlines()[0].split(" ", 2)
+            time.sleep(self.per_item)
+            status, payload = self.answer(f"https://gmail.googleapis.com{path}")
+            parts.append(
+                f"--{self.BOUNDARY}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{part['Content-ID'].strip('<>')}>\r\n\r\n"
+                f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n\r\n{json.dumps(payload)}\r\n"
+            )
+        return ("".join(parts) + f"--{self.BOUNDARY}--").encode()
+
+
+def gmail_service(http: FakeGmailHttp):
+    return build("gmail", "v1", http=http, static_discovery=True)
+
+
+class FakeMailbox:
+    """
+    Messages numbered n, one an hour from BASE_DATE, from NAMES and about TOPICS, with a
+    history record for every change. Requests of all services from `service()` are counted.
+    """
+
+    def __init__(self, size: int):
+        self.messages: Dict[str, Dict] = {}
+        self.history: List[Dict] = []
+        self.history_id = 1000
+        self.expired_before = 0
+        self.email_address = "me@example.com"
+        self._https: List[FakeGmailHttp] = []
+        for n in range(size):
+            self.add(n, record=False)
+
+    @property
+    def requests(self) -> int:
+        return sum(http.requests for http in self._https)
+
+    def service(self):
+        http = FakeGmailHttp(self.answer)
+        self._https.append(http)
+        return gmail_service(http)
+
+    def add(self, n: int, record: bool = True, labels: Optional[List[str]] = None) -> str:
+        name = NAMES[n % len(NAMES)]
+        labels = labels or ["INBOX"] + ["UNREAD"] * (n % 3 == 0) + ["STARRED"] * (n % 17 == 0) + ["Label_1"] * (n % 7 == 0)
+        message = {
+            "id": f"{n:016x}", "threadId": f"{n:016x}", "labelIds": labels,
+            "snippet": f"Notes for item {n}", "internalDate": str(BASE_DATE + n * 3_600_000),
+            "payload": {"headers": [
+                {"name": "From", "value": f"{name.title()} Example <{name}@example.com>"},
+                {"name": "To", "value": "me@example.com"},
+                {"name": "Subject", "value": f"{TOPICS[n % len(TOPICS)]} #{n}"},
+                {"name": "Date", "value": "Wed, 1 Jan 2025 00:00:00 +0000"},
+            ]},
+        }
+        self.messages[message["id"]] = message
+        if record:
+            self._record({"messagesAdded": [{"message": {"id": message["id"], "labelIds": labels}}]})
+        return message["id"]
+
+    def relabel(self, message_id: str, add: List[str] = (), remove: List[str] = ()):
+        labels = self.messages[message_id]["labelIds"]
+        labels[:] = [label for label in labels if label not in remove] + [label for label in add if label not in labels]
+        record = {}
+        if add:
+            record["labelsAdded"] = [{"message": {"id": message_id, "labelIds": labels}, "labelIds": list(add)}]
+        if remove:
+            record["labelsRemoved"] = [{"message": {"id": message_id, "labelIds": labels}, "labelIds": list(remove)}]
+        self._record(record)
+
+    def delete(self, message_id: str):
+        del self.messages[message_id]
+        self._record({"messagesDeleted": [{"message": {"id": message_id}}]})
+
+    def _record(self, record: Dict):
+        self.history_id += 1
+        self.history.append({"id": str(self.history_id), **record})
+
+    def newest(self) -> List[Dict]:
+        visible = [m for m in self.messages.values() if not set(m["labelIds"]) & HIDDEN_LABELS]
+        return sorted(visible, key=lambda m: int(m["internalDate"]), reverse=True)
+
+    def answer(self, uri: str) -> Tuple[int, Dict]:
+        parsed = urlparse(uri)
+        query = parse_qs(parsed.query)
+        path = parsed.path.split("/users/me/", 1)[1]
+        if path == "profile":
+            return 200, {"historyId": str(self.history_id), "emailAddress": self.email_address}
+        if path == "labels":
+            return 200, {"labels": LABELS}
+        if path == "history":
+            start = int(query["startHistoryId"][0])
+            if start < self.expired_before:
+                return 404, {"error": {"code": 404, "message": "Requested entity was not found."}}
+            return 200, {"history": [r for r in self.history if int(r["id"]) > start], "historyId": str(self.history_id)}
+        if path == "messages":
+            offset = int(query.get("pageToken", ["0"])[0])
+            limit = int(query["maxResults"][0])
+            newest = self.newest()
+            response = {"messages": [{"id": m["id"]} for m in newest[offset:offset + limit]]}
+            if offset + limit < len(newest):
+                response["nextPageToken"] = str(offset + limit)
+            return 200, response
+        message = self.messages.get(path.rsplit("/", 1)[1])
+        if message is None:
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+        return 200, json.loads(json.dumps(message))
@@ -0,0 +1,32 @@
+# python-backend/tests/stub_browser_server.py
+#
+# A stand-in for the browser-use MCP server, run as a subprocess by the pool tests.
+# STUB_BROWSER_STARTUP_DELAY simulates the interpreter and Chromium launch.
+import os
+import json
+import time
+
+from mcp.server.fastmcp import FastMCP
+
+time.sleep(float(os.getenv("STUB_BROWSER_STARTUP_DELAY", "2.0")))
+stub = FastMCP("stub-browser")
+state = {"url": "about:blank"}
+
+
+@stub.tool()
+def browser_navigate(url: str) -> str:
+    state["url"] = url
+    return f"Navigated to {url}"
+
+
+@stub.tool()
+def browser_list_tabs() -> str:
+    return json.dumps([{"tab_id": 0, "url": state["url"]}])
+
+
+@stub.tool()
+def browser_get_state(include_screenshot: bool = False) -> str:
+    return json.dumps({"url": state["url"], "title": "Stub", "interactive_elements": [], "screenshot": None})
+
+
+stub.run()
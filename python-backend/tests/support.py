@@ -0,0 +1,59 @@
+# python-backend/tests/support.py
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Awaitable, Callable, Type
+
+
+class StubServer:
+    """A threaded HTTP server on a free local port, playing a remote service for a test."""
+
+    def __init__(self, handler: Type[BaseHTTPRequestHandler]):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    """Base for stub handlers: no request logging, JSON replies."""
+
+    def send_json(self, status: int, body: bytes, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+async def max_loop_lag(work: Callable[[], Awaitable], interval: float = 0.01) -> float:
+    """
+    The longest the event loop ran late while `work()` was awaited, measured by a
+    heartbeat that sleeps `interval` seconds at a time. Another connection served by
+    the same worker would have stalled that long.
+    """
+    lag = 0.0
+    stop = asyncio.Event()
+
+    async def heartbeat():
+        nonlocal lag
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag = max(lag, time.perf_counter() - start - interval)
+
+    beat = asyncio.create_task(heartbeat())
+    await asyncio.sleep(interval * 5)
+    try:
+        await work()
+    finally:
+        stop.set()
+        await beat
+    return lag
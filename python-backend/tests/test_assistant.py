@@ -0,0 +1,57 @@
+# python-backend/tests/test_assistant.py
+#
+# Session creation clones a cached team prototype instead of building the tree per
+# session. Needs the backend's environment (DATABASE_URL, SANDBOX_API_URL).
+import os
+import time
+
+import pytest
+
+if not os.getenv("DATABASE_URL"):
+    pytest.skip("DATABASE_URL is not set", allow_module_level=True)
+assistant = pytest.importorskip("assistant")
+
+FLAGS = dict(calculator=True, web_crawler=True, internet_search=True, coding_assistant=True, investment_assistant=True)
+ROUNDS = 10
+
+
+def members(team):
+    yield team
+    for member in getattr(team, "members", None) or []:
+        yield from members(member)
+
+
+def build(user_id: str, session_info=None):
+    return assistant.get_llm_os(user_id=user_id, session_info=session_info or {"sandbox_ids": set(), "active_sandbox_id": None}, **FLAGS)
+
+
+def seconds_per_session(build_one) -> float:
+    start = time.perf_counter()
+    for i in range(ROUNDS):
+        build_one(f"user-{i}")
+    return (time.perf_counter() - start) / ROUNDS
+
+
+def test_cached_sessions_are_faster_than_building_the_team():
+    def uncached(user_id):
+        assistant._team_prototypes.clear()
+        return build(user_id)
+
+    building = seconds_per_session(uncached)
+    build("warmup")
+    cloning = seconds_per_session(build)
+    assert cloning * 5 < building
+
+
+def test_sessions_share_toolkits_but_not_per_run_state():
+    first, second = build("alice"), build("bob")
+    assert (first.user_id, second.user_id) == ("alice", "bob")
+    for one, other in zip(members(first), members(second)):
+        assert one is not other
+        assert one.model is not other.model
+        for tool, other_tool in zip(one.tools or [], other.tools or []):
+            if isinstance(tool, assistant.SandboxTools):
+                # Each session drives its own sandbox.
+                assert tool is not other_tool
+            elif isinstance(tool, assistant.Toolkit) and not isinstance(tool, assistant.BrowserTools):
+                assert not set(map(id, tool.functions.values())) & set(map(id, other_tool.functions.values()))
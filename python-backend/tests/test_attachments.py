@@ -0,0 +1,110 @@
+# python-backend/tests/test_attachments.py
+#
+# Attachments against a storage stub that throttles each download: concurrent spooled
+# downloads versus sequential in-memory ones, then a later turn reusing the same files.
+import os
+import time
+import asyncio
+import hashlib
+import tracemalloc
+from urllib.parse import unquote
+
+import httpx
+import pytest
+
+import attachments
+from attachments import ATTACHMENT_BUCKET, AttachmentCache
+from tests.support import QuietHandler
+
+MB = 1024 * 1024
+SIZES_MB = [4, 8, 16, 24]
+FIRST_BYTE_DELAY = 0.15
+SECONDS_PER_MB = 0.02
+
+
+@pytest.fixture
+def storage(serve, monkeypatch):
+    """Supabase Storage serving random objects with ETags, about 50 MB/s per connection."""
+    monkeypatch.setattr(attachments, "SPOOL_MAX_MEMORY", MB)
+    blobs = {f"turn/file-{mb}.bin": os.urandom(MB) * mb for mb in SIZES_MB}
+    etags = {path: f'"{hashlib.md5(data).hexdigest()}"' for path, data in blobs.items()}
+
+    class Handler(QuietHandler):
+        def do_GET(self):
+            path = unquote(self.path.split(f"/{ATTACHMENT_BUCKET}/", 1)[1])
+            time.sleep(FIRST_BYTE_DELAY)
+            if self.headers.get("If-None-Match") == etags[path]:
+                self.send_response(304)
+                self.send_header("ETag", etags[path])
+                self.end_headers()
+                return
+            data = blobs[path]
+            self.send_response(200)
+            self.send_header("ETag", etags[path])
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            for offset in range(0, len(data), MB):
+                self.wfile.write(data[offset:offset + MB])
+                time.sleep(SECONDS_PER_MB)
+
+    server = serve(Handler)
+    server.storage_url = f"{server.url}/storage/v1"
+    server.blobs = blobs
+    return server
+
+
+def measure(work):
+    """Runs `work()` on a fresh loop; returns its result, wall time and peak traced memory."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = asyncio.run(work())
+        return result, time.perf_counter() - start, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def read(stored) -> bytes:
+    if stored.content is not None:
+        return stored.content
+    with open(stored.filepath, "rb") as f:
+        return f.read()
+
+
+def test_concurrent_spooled_downloads_are_faster_and_smaller(storage):
+    async def sequential_in_memory():
+        async with httpx.AsyncClient(timeout=60) as client:
+            for path in storage.blobs:
+                response = await client.get(f"{storage.storage_url}/object/authenticated/{ATTACHMENT_BUCKET}/{path}")
+                assert len(response.content) == len(storage.blobs[path])
+                del response
+
+    async def concurrent_spooled():
+        async with httpx.AsyncClient(timeout=60) as client:
+            cache = AttachmentCache(client, storage.storage_url, "stub-key")
+            await asyncio.gather(*(cache.fetch(path) for path in storage.blobs))
+            cache.close()
+
+    _, sequential_seconds, sequential_peak = measure(sequential_in_memory)
+    _, concurrent_seconds, concurrent_peak = measure(concurrent_spooled)
+    assert concurrent_seconds < sequential_seconds * 0.8
+    assert concurrent_peak * 2 < sequential_peak
+
+
+def test_a_later_turn_revalidates_instead_of_downloading(storage):
+    async def two_turns():
+        async with httpx.AsyncClient(timeout=60) as client:
+            cache = AttachmentCache(client, storage.storage_url, "stub-key")
+            first = await asyncio.gather(*(cache.fetch(path) for path in storage.blobs))
+            second = await asyncio.gather(*(cache.fetch(path) for path in storage.blobs))
+            spool_dir = cache._spool_dir
+            contents = [read(stored) for stored in second]
+            cache.close()
+            return first, second, contents, spool_dir, cache.stats
+
+    first, second, contents, spool_dir, stats = asyncio.run(two_turns())
+    assert contents == list(storage.blobs.values())
+    assert [stored.filepath for stored in first] == [stored.filepath for stored in second]
+    assert all(stored.filepath for stored in second), "attachments over SPOOL_MAX_MEMORY stay on disk"
+    assert stats["downloads"] == stats["cache_hits"] == len(storage.blobs)
+    assert not os.path.exists(spool_dir)
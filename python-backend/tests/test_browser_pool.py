@@ -0,0 +1,69 @@
+# python-backend/tests/test_browser_pool.py
+#
+# Time to a session's first browser action with and without warm servers, against a
+# stub MCP server that takes STARTUP_DELAY seconds to come up.
+import os
+import sys
+import time
+import shlex
+import asyncio
+from typing import List, Optional
+
+import pytest
+
+pytest.importorskip("mcp")
+from browser_pool import BrowserServerPool
+
+STARTUP_DELAY = 1.0
+SESSIONS = 3
+COMMAND = f"{shlex.quote(sys.executable)} {shlex.quote(os.path.join(os.path.dirname(__file__), 'stub_browser_server.py'))}"
+
+
+@pytest.fixture(autouse=True)
+def startup_delay(monkeypatch):
+    monkeypatch.setenv("STUB_BROWSER_STARTUP_DELAY", str(STARTUP_DELAY))
+
+
+async def time_sessions(pool: BrowserServerPool, servers: Optional[List[str]] = None) -> List[float]:
+    timings = []
+    for i in range(SESSIONS):
+        start = time.perf_counter()
+        lease = await pool.acquire(owner=f"session-{i}")
+        assert "Navigated" in str(await lease.call_tool("browser_navigate", url="https://example.com"))
+        timings.append(time.perf_counter() - start)
+        if servers is not None:
+            servers.append(lease.server.id)
+        await pool.release(lease)
+        # Leave time for the pool to refill between sessions, as real traffic would.
+        await asyncio.sleep(STARTUP_DELAY + 1)
+    return timings
+
+
+def test_cold_sessions_wait_for_a_server_to_start():
+    async def scenario():
+        pool = BrowserServerPool(command=COMMAND, min_warm=0, max_servers=SESSIONS)
+        try:
+            return await time_sessions(pool), dict(pool.stats)
+        finally:
+            await pool.shutdown()
+
+    timings, stats = asyncio.run(scenario())
+    assert min(timings) >= STARTUP_DELAY
+    assert stats["cold_leases"] == SESSIONS
+
+
+def test_warm_sessions_start_without_waiting():
+    async def scenario():
+        pool = BrowserServerPool(command=COMMAND, min_warm=2, max_servers=SESSIONS + 2)
+        try:
+            await pool.prewarm()
+            servers = []
+            return await time_sessions(pool, servers), dict(pool.stats), servers
+        finally:
+            await pool.shutdown()
+
+    timings, stats, servers = asyncio.run(scenario())
+    assert max(timings) < STARTUP_DELAY / 2
+    assert stats["cold_leases"] == 0
+    # Released servers are discarded, never handed to the next session.
+    assert len(set(servers)) == SESSIONS
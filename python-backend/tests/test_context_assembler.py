@@ -0,0 +1,70 @@
+# python-backend/tests/test_context_assembler.py
+#
+# Tokens for a turn that carries three earlier sessions as context, and for a later turn
+# where the same sessions are selected again.
+import json
+from typing import Any, Dict
+
+import pytest
+
+from context_assembler import ContextAssembler, ContextBudget, SessionContextState, TokenCounter
+
+
+class EstimatingCounter(TokenCounter):
+    """Four characters per token, so the tests never download a tiktoken encoding."""
+
+    def _load(self):
+        return None
+
+
+def stored_session(topic: str, turns: int) -> Dict[str, Any]:
+    interactions = []
+    nested = ""
+    for turn in range(turns):
+        # Saved user messages used to include the context block they were sent with.
+        user_input = f"Previous conversation context:\n{nested}\n\nCurrent message: How do I tune {topic}, step {turn}?"
+        answer = f"For {topic} step {turn}: " + "measure first, then change one setting at a time and compare. " * 25
+        interactions.append({"user_input": user_input, "llm_output": ""})
+        interactions.append({"user_input": "", "llm_output": answer})
+        nested = answer[:400]
+    return {"interactions": interactions}
+
+
+@pytest.fixture
+def context() -> str:
+    return json.dumps([stored_session(topic, 12) for topic in ("postgres", "uvicorn", "gemini")])
+
+
+@pytest.fixture
+def assembler() -> ContextAssembler:
+    return ContextAssembler(budget=ContextBudget(), counter=EstimatingCounter())
+
+
+def test_the_first_turn_fits_the_budget(assembler, context):
+    result = assembler.assemble(SessionContextState(), context, [])
+    assert result.tokens_sent <= ContextBudget().max_tokens < result.tokens_received
+    assert result.condensed_turns and result.dropped_turns
+    # Nested context blocks are stripped; the newest turns are kept verbatim.
+    assert "Previous conversation context" not in result.text
+    assert result.text.split("\n")[-1].startswith("Assistant: For gemini step 11:")
+
+
+def test_context_already_delivered_is_not_sent_again(assembler, context):
+    state = SessionContextState()
+    first = assembler.assemble(state, context, [])
+    state.commit(first.fingerprints)
+    history = [{"role": "user", "content": "What should I tune first?"}, {"role": "assistant", "content": "Start with the pool sizes."}]
+    second = assembler.assemble(state, context, history)
+    assert second.duplicate_turns == len(first.fingerprints)
+    # Only turns the first turn dropped to fit the budget are left to send.
+    assert not set(second.fingerprints) & set(first.fingerprints)
+    assert "For gemini step 11:" not in second.text
+    assert second.tokens_sent <= ContextBudget().max_tokens
+
+
+def test_a_failed_turn_sends_its_context_again(assembler, context):
+    state = SessionContextState()
+    first = assembler.assemble(state, context, [])
+    # Not committed: the run that carried it did not complete.
+    retry = assembler.assemble(state, context, [])
+    assert retry.text == first.text and retry.duplicate_turns == 0
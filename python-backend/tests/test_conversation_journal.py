@@ -0,0 +1,136 @@
+# python-backend/tests/test_conversation_journal.py
+#
+# Turns written per second: one upsert of the whole history per turn (what flushing on
+# every turn would cost) versus journal appends with batched flushes, and replay of a
+# crashed worker's journal. With JOURNAL_BENCH_DSN set to a local Postgres DSN the
+# upserts also go to a real table (needs psycopg2); a stub with 5 ms of round-trip
+# latency always stands in.
+import os
+import time
+import asyncio
+import datetime
+from typing import Any, Dict, List
+
+import pytest
+
+from conversation_journal import ConversationJournal
+
+SESSIONS, TURNS_PER_SESSION = 20, 10
+
+
+class Store:
+    """The stub `ai_os_sessions`: keeps the last row written per session."""
+
+    def __init__(self):
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        self.calls = 0
+
+    async def upsert(self, rows: List[Dict[str, Any]]):
+        await asyncio.sleep(0.005 + 0.0001 * len(rows))
+        self.calls += 1
+        self.rows.update((row["session_id"], row) for row in rows)
+
+
+class PostgresStore(Store):
+    def __init__(self, dsn: str):
+        super().__init__()
+        psycopg2 = pytest.importorskip("psycopg2")
+        from psycopg2.extras import Json, execute_values
+
+        self.Json, self.execute_values = Json, execute_values
+        self.pg = psycopg2.connect(dsn)
+        self.pg.autocommit = True
+        with self.pg.cursor() as cur:
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS journal_bench_sessions (session_id TEXT PRIMARY KEY, user_id TEXT, "
+                "agent_id TEXT, created_at BIGINT, updated_at BIGINT, memory JSONB, session_data JSONB)"
+            )
+            cur.execute("TRUNCATE journal_bench_sessions")
+
+    def _write(self, rows):
+        with self.pg.cursor() as cur:
+            self.execute_values(cur, (
+                "INSERT INTO journal_bench_sessions VALUES %s ON CONFLICT (session_id) DO UPDATE SET "
+                "memory = EXCLUDED.memory, session_data = EXCLUDED.session_data, updated_at = EXCLUDED.updated_at"
+            ), [(r["session_id"], r["user_id"], r["agent_id"], r["created_at"], r["updated_at"],
+                 self.Json(r["memory"]), self.Json(r["session_data"])) for r in rows])
+
+    async def upsert(self, rows: List[Dict[str, Any]]):
+        await asyncio.to_thread(self._write, rows)
+        self.calls += 1
+        self.rows.update((row["session_id"], row) for row in rows)
+
+
+@pytest.fixture(params=["stub", "postgres"])
+def store(request):
+    if request.param == "stub":
+        yield Store()
+        return
+    dsn = os.getenv("JOURNAL_BENCH_DSN")
+    if not dsn:
+        pytest.skip("JOURNAL_BENCH_DSN is not set")
+    store = PostgresStore(dsn)
+    yield store
+    store.pg.close()
+
+
+def make_turns(session: int, turn: int):
+    now = datetime.datetime.now().isoformat()
+    return [
+        {"role": "user", "content": f"Question {turn} in session {session}. " * 8, "timestamp": now},
+        {"role": "assistant", "content": f"Answer {turn} in session {session}. " * 40, "timestamp": now},
+    ]
+
+
+def test_journal_appends_outpace_per_turn_upserts(store, tmp_path):
+    async def per_turn_upserts():
+        histories: Dict[str, List[Dict[str, Any]]] = {}
+        start = time.perf_counter()
+        for turn in range(TURNS_PER_SESSION):
+            for session in range(SESSIONS):
+                sid = f"bench-{session}"
+                histories.setdefault(sid, []).extend(make_turns(session, turn))
+                await store.upsert([{
+                    "session_id": sid, "user_id": "bench", "agent_id": "AI_OS", "created_at": 0,
+                    "updated_at": int(time.time()), "memory": {"runs": histories[sid]}, "session_data": {},
+                }])
+        return time.perf_counter() - start
+
+    async def journaled():
+        journal = ConversationJournal(directory=str(tmp_path), flush_interval=0.5, flush_turns=200, upsert=store.upsert)
+        await journal.start()
+        start = time.perf_counter()
+        for turn in range(TURNS_PER_SESSION):
+            for session in range(SESSIONS):
+                journal.append_turns(f"bench-{session}", make_turns(session, turn))
+                await asyncio.sleep(0)
+        appended = time.perf_counter() - start
+        for session in range(SESSIONS):
+            journal.close_session(f"bench-{session}")
+        await journal.stop()
+        return appended, journal
+
+    upserting = asyncio.run(per_turn_upserts())
+    calls = store.calls
+    appended, journal = asyncio.run(journaled())
+    assert appended * 5 < upserting
+    # Batched: far fewer round trips, and every session ends up with its whole history.
+    assert store.calls - calls < SESSIONS * TURNS_PER_SESSION / 10
+    assert all(len(store.rows[f"bench-{s}"]["memory"]["runs"]) == 2 * TURNS_PER_SESSION for s in range(SESSIONS))
+    # Closed and flushed sessions leave nothing behind.
+    assert journal.metrics()["dirty_sessions"] == 0
+    assert journal._db.execute("SELECT COUNT(*) FROM turns").fetchone()[0] == 0
+
+
+def test_a_crashed_workers_journal_is_replayed(tmp_path):
+    store = Store()
+    crashed = ConversationJournal(directory=str(tmp_path), upsert=store.upsert)
+    crashed.path = os.path.join(str(tmp_path), "journal-999999999.db")  # A worker that no longer exists.
+    for session in range(5):
+        crashed.append_turns(f"crashed-{session}", make_turns(session, 0))
+
+    survivor = ConversationJournal(directory=str(tmp_path), upsert=store.upsert)
+    asyncio.run(survivor.replay())
+    assert sorted(store.rows) == [f"crashed-{session}" for session in range(5)]
+    assert survivor.stats["replayed_sessions"] == 5
+    assert not any(name.startswith("journal-999999999") for name in os.listdir(tmp_path))
@@ -0,0 +1,154 @@
+# python-backend/tests/test_gemini_cache.py
+#
+# Input tokens for 40 coordinator turns against a stub Gemini, with and without the
+# context cache, across renewals (TTL 3 s, renewed 2 s ahead), and the fallback to plain
+# requests for a prefix below the minimum and a model without cache support.
+import time
+import asyncio
+import datetime
+from typing import Any, Dict
+
+import pytest
+
+types = pytest.importorskip("google.genai.types")
+from gemini_cache import GeminiContextCache, _model_name
+
+MODEL = "gemini-2.5-flash"
+UNSUPPORTED_MODEL = "gemini-2.5-flash-lite-preview-06-17"
+INSTRUCTIONS = "\n".join(
+    f"- Rule {i}: delegate carefully, keep answers concise and cite the specialist used." for i in range(120)
+)
+TOOLS = [types.Tool(function_declarations=[
+    types.FunctionDeclaration(name=f"tool_{i}", description="Does one specific thing for the coordinator. " * 4)
+    for i in range(30)
+])]
+
+
+class StubCacheClient:
+    """
+    A local stand-in for `genai.Client` with the caches API and a generate_content
+    that reports usage like Gemini does. Caches expire, must reach `min_tokens`, and
+    cannot be combined with a request-level system instruction or tools.
+    """
+
+    class _Caches:
+        def __init__(self, stub: "StubCacheClient"):
+            self.stub = stub
+
+        async def create(self, model: str, config: Dict[str, Any]):
+            stub = self.stub
+            await asyncio.sleep(stub.latency)
+            if model in stub.unsupported_models:
+                raise RuntimeError(f"404 {model} does not support cached content")
+            tokens = GeminiContextCache._estimate_tokens(config.get("system_instruction"), config.get("tools"))
+            if tokens < stub.min_tokens:
+                raise RuntimeError(f"400 cached content is too small: {tokens} < {stub.min_tokens}")
+            stub.created += 1
+            name = f"cachedContents/stub-{stub.created}"
+            stub.caches[name] = {"tokens": tokens, "expires_at": time.time() + int(config["ttl"].rstrip("s"))}
+            return stub._cached_content(name)
+
+        async def update(self, name: str, config: Dict[str, Any]):
+            stub = self.stub
+            await asyncio.sleep(stub.latency)
+            cache = stub.caches.get(name)
+            if cache is None or cache["expires_at"] <= time.time():
+                raise RuntimeError(f"404 {name} not found")
+            cache["expires_at"] = time.time() + int(config["ttl"].rstrip("s"))
+            return stub._cached_content(name)
+
+        async def delete(self, name: str):
+            self.stub.caches.pop(name, None)
+
+    class _Models:
+        def __init__(self, stub: "StubCacheClient"):
+            self.stub = stub
+
+        async def generate_content(self, model: str, contents: str, config=None):
+            stub = self.stub
+            await asyncio.sleep(stub.latency)
+            prompt = len(contents) // 4
+            cached = 0
+            if config is not None and config.cached_content:
+                if config.system_instruction is not None or config.tools:
+                    raise RuntimeError("400 cached content can not be used with system_instruction or tools")
+                cache = stub.caches.get(config.cached_content)
+                if cache is None or cache["expires_at"] <= time.time():
+                    stub.expired_hits += 1
+                    raise RuntimeError(f"404 {config.cached_content} not found")
+                cached = cache["tokens"]
+            elif config is not None:
+                prompt += GeminiContextCache._estimate_tokens(config.system_instruction, config.tools)
+            return types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt + cached, cached_content_token_count=cached or None,
+            )
+
+    class _Aio:
+        def __init__(self, stub: "StubCacheClient"):
+            self.caches = StubCacheClient._Caches(stub)
+            self.models = StubCacheClient._Models(stub)
+
+    def __init__(self, min_tokens: int = 1024, latency: float = 0.005, unsupported_models=()):
+        self.min_tokens = min_tokens
+        self.latency = latency
+        self.unsupported_models = {_model_name(m) for m in unsupported_models}
+        self.caches: Dict[str, Dict[str, Any]] = {}
+        self.created = 0
+        self.expired_hits = 0
+        self.aio = StubCacheClient._Aio(self)
+
+    def _cached_content(self, name: str):
+        cache = self.caches[name]
+        return type("CachedContent", (), {
+            "name": name,
+            "expire_time": datetime.datetime.fromtimestamp(cache["expires_at"], datetime.timezone.utc),
+            "usage_metadata": type("Usage", (), {"total_token_count": cache["tokens"]})(),
+        })()
+
+
+async def run_turns(cache: GeminiContextCache, stub: StubCacheClient, model: str, system: str, turns: int, pause: float, tools=TOOLS) -> int:
+    """Coordinator turns through the cache; returns how many requests failed."""
+    await cache.start()
+    failures = 0
+    for turn in range(turns):
+        params = {"config": types.GenerateContentConfig(system_instruction=system, tools=tools, temperature=0.2)}
+        params = cache.apply(model, params)
+        try:
+            usage = await stub.aio.models.generate_content(model=model, contents=f"User turn {turn}: " + "question " * 40, **params)
+        except RuntimeError:
+            failures += 1
+            continue
+        cache.record_usage(usage)
+        await asyncio.sleep(pause)
+    await cache.stop()
+    return failures
+
+
+def test_cached_turns_send_a_fraction_of_the_input_tokens():
+    metrics = {}
+    for label, enabled in (("uncached", False), ("cached", True)):
+        stub = StubCacheClient()
+        cache = GeminiContextCache(client=stub, ttl=3, renew_before=2, enabled=enabled)
+        assert asyncio.run(run_turns(cache, stub, MODEL, INSTRUCTIONS, 40, 0.1)) == 0
+        # Renewed ahead of expiry: no turn ever referenced an expired cache.
+        assert stub.expired_hits == 0
+        metrics[label] = cache.metrics()
+    assert metrics["cached"]["caches_created"] == 1 and metrics["cached"]["caches_renewed"] >= 1
+    assert metrics["cached"]["uncached_input_tokens"] < metrics["uncached"]["input_tokens"] / 5
+
+
+def test_a_prefix_below_the_minimum_is_sent_uncached():
+    stub = StubCacheClient()
+    cache = GeminiContextCache(client=stub, ttl=3, renew_before=2)
+    assert asyncio.run(run_turns(cache, stub, MODEL, "Be brief.", 5, 0, tools=None)) == 0
+    metrics = cache.metrics()
+    assert metrics["caches_created"] == 0 and metrics["below_minimum"] == 1 and metrics["requests"] == 5
+    assert stub.created == 0
+
+
+def test_a_model_without_cache_support_falls_back():
+    stub = StubCacheClient(unsupported_models=[UNSUPPORTED_MODEL])
+    cache = GeminiContextCache(client=stub, ttl=3, renew_before=2)
+    assert asyncio.run(run_turns(cache, stub, UNSUPPORTED_MODEL, INSTRUCTIONS, 5, 0.02)) == 0
+    metrics = cache.metrics()
+    assert metrics["create_errors"] >= 1 and metrics["requests"] == 5 and metrics["caches_created"] == 0
@@ -0,0 +1,155 @@
+# python-backend/tests/test_gmail_metadata.py
+#
+# Summarising a search: one get per listed message (the N+1 pattern the tools used)
+# against one batch of metadata gets, and the same search again from the cache.
+import base64
+import time
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from gmail_metadata import MessageMetadataCache, fetch_metadata
+from tests.gmail_fakes import FakeGmailHttp, gmail_service
+
+PER_ITEM = 0.002  # Server time per message inside a batch.
+MESSAGES = 50
+EXPECTED = [f"Report #{n}" for n in range(MESSAGES)]
+
+
+def fixture_message(n: int) -> Dict:
+    body = base64.urlsafe_b64encode((f"<html><body>{'Quarterly report details. ' * 600}</body></html>").encode()).decode()
+    headers = [
+        {"name": "From", "value": f"Sender {n} <sender{n}@example.com>"},
+        {"name": "To", "value": "me@example.com"},
+        {"name": "Subject", "value": f"Report #{n}"},
+        {"name": "Date", "value": "Mon, 6 Jan 2025 09:00:00 +0000"},
+        {"name": "Received", "value": "from mail.example.com by mx.google.com; " * 3},
+        {"name": "DKIM-Signature", "value": "v=1; a=rsa-sha256; " + "b" * 400},
+    ]
+    return {
+        "id": f"18d{n:013x}", "threadId": f"18d{n:013x}", "labelIds": ["INBOX", "UNREAD"],
+        "snippet": f"Quarterly report details for #{n}", "internalDate": str(1736150400000 + n),
+        "payload": {"mimeType": "multipart/alternative", "headers": headers, "parts": [
+            {"mimeType": "text/plain", "body": {"size": len(body) // 2, "data": body[: len(body) // 2]}},
+            {"mimeType": "text/html", "body": {"size": len(body), "data": body}},
+        ]},
+    }
+
+
+class Mailbox:
+    """Answers messages.list and messages.get; `statuses` overrides the answer for an id."""
+
+    def __init__(self):
+        self.messages = {message["id"]: message for message in (fixture_message(n) for n in range(MESSAGES))}
+        self.statuses: Dict[str, int] = {}
+
+    def answer(self, uri: str):
+        parsed = urlparse(uri)
+        query = parse_qs(parsed.query)
+        if parsed.path.endswith("/messages"):
+            limit = int(query.get("maxResults", ["100"])[0])
+            return 200, {"messages": [{"id": message_id} for message_id in list(self.messages)[:limit]]}
+        message_id = parsed.path.rsplit("/", 1)[1]
+        status = self.statuses.get(message_id, 200)
+        if status != 200:
+            return status, {"error": {"code": status, "message": "fixture error"}}
+        message = self.messages[message_id]
+        if query.get("format", ["full"])[0] != "metadata":
+            return 200, message
+        wanted = {name.lower() for name in query.get("metadataHeaders", [])}
+        headers = [h for h in message["payload"]["headers"] if h["name"].lower() in wanted]
+        return 200, {"id": message["id"], "threadId": message["threadId"], "snippet": message["snippet"],
+                     "internalDate": message["internalDate"], "payload": {"headers": headers}}
+
+
+@pytest.fixture
+def mailbox():
+    return Mailbox()
+
+
+def measure(mailbox: Mailbox, search):
+    http = FakeGmailHttp(mailbox.answer, per_item=PER_ITEM)
+    service = gmail_service(http)
+    started = time.perf_counter()
+    result = search(service)
+    return result, http, time.perf_counter() - started
+
+
+def listed(service) -> List[str]:
+    response = service.users().messages().list(userId="me", maxResults=MESSAGES, q="report", fields="messages/id").execute()
+    return [message["id"] for message in response["messages"]]
+
+
+def sequential(format: str):
+    def search(service):
+        summaries = []
+        for message_id in listed(service):
+            kwargs = {"format": "metadata", "metadataHeaders": ["Subject", "From"]} if format == "metadata" else {}
+            data = service.users().messages().get(userId="me", id=message_id, **kwargs).execute()
+            summaries.append(next(h["value"] for h in data["payload"]["headers"] if h["name"] == "Subject"))
+        return summaries
+    return search
+
+
+def batched(cache: MessageMetadataCache):
+    def search(service):
+        return [m.header("Subject") for m in fetch_metadata(service, "user-1", listed(service), cache)]
+    return search
+
+
+def test_one_batch_replaces_a_request_per_message(mailbox):
+    full, full_http, full_time = measure(mailbox, sequential("full"))
+    metadata, metadata_http, _ = measure(mailbox, sequential("metadata"))
+    result, http, elapsed = measure(mailbox, batched(MessageMetadataCache()))
+    assert full == metadata == result == EXPECTED
+    assert full_http.requests == metadata_http.requests == MESSAGES + 1
+    assert http.requests == 2
+    assert elapsed < full_time / 4
+    # Headers and snippets only, not the bodies the full format carries.
+    assert http.bytes < full_http.bytes / 10
+
+
+def test_a_repeated_search_is_served_from_the_cache(mailbox):
+    cache = MessageMetadataCache()
+    measure(mailbox, batched(cache))
+    result, http, _ = measure(mailbox, batched(cache))
+    assert result == EXPECTED
+    assert http.requests == 1
+    metrics = cache.metrics()
+    assert metrics["hits"] == MESSAGES and metrics["fetched"] == MESSAGES and metrics["entries"] == MESSAGES
+
+
+def test_deleted_messages_are_skipped_and_other_errors_raised(mailbox):
+    from googleapiclient.errors import HttpError
+
+    ids = list(mailbox.messages)
+    mailbox.statuses = {ids[3]: 404, ids[7]: 410}
+    cache = MessageMetadataCache()
+    found = fetch_metadata(gmail_service(FakeGmailHttp(mailbox.answer)), "user-1", ids, cache)
+    assert [m.id for m in found] == [i for i in ids if i not in (ids[3], ids[7])]
+    assert cache.stats["failed"] == 2
+
+    mailbox.statuses = {ids[0]: 401}
+    with pytest.raises(HttpError):
+        fetch_metadata(gmail_service(FakeGmailHttp(mailbox.answer)), "user-2", ids, MessageMetadataCache())
+
+
+def test_throttled_messages_are_retried(mailbox, monkeypatch):
+    monkeypatch.setattr("gmail_metadata.random.uniform", lambda low, high: 0)
+    ids = list(mailbox.messages)
+    throttled = {ids[1], ids[2]}
+    original = mailbox.answer
+
+    def answer(uri):
+        message_id = urlparse(uri).path.rsplit("/", 1)[1]
+        if message_id in throttled:
+            throttled.discard(message_id)
+            return 429, {"error": {"code": 429, "message": "Too many concurrent requests for user"}}
+        return original(uri)
+
+    cache = MessageMetadataCache()
+    http = FakeGmailHttp(answer)
+    found = fetch_metadata(gmail_service(http), "user-1", ids, cache)
+    assert [m.id for m in found] == ids
+    assert http.requests == 2 and cache.stats["retried"] == 2
@@ -0,0 +1,39 @@
+# python-backend/tests/test_metrics.py
+#
+# /metrics is for operators only: it does not exist without METRICS_TOKEN and answers
+# only requests bearing that token.
+import asyncio
+
+import pytest
+
+pytest.importorskip("quart")
+app_module = pytest.importorskip("app")
+
+
+def get(path: str, token: str = None):
+    async def scenario():
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        response = await app_module.app.test_client().get(path, headers=headers)
+        return response.status_code, await response.get_json()
+
+    return asyncio.run(scenario())
+
+
+def test_metrics_are_off_without_a_token(monkeypatch):
+    monkeypatch.setattr(app_module, "METRICS_TOKEN", None)
+    assert get("/metrics", "anything")[0] == 404
+
+
+def test_metrics_require_the_operator_token(monkeypatch):
+    monkeypatch.setattr(app_module, "METRICS_TOKEN", "operator-secret")
+    assert get("/metrics")[0] == 401
+    assert get("/metrics", "user-jwt")[0] == 401
+    status, body = get("/metrics", "operator-secret")
+    assert status == 200 and set(body) == set(app_module.METRIC_SOURCES)
+
+
+def test_metrics_can_be_limited_to_some_sources(monkeypatch):
+    monkeypatch.setattr(app_module, "METRICS_TOKEN", "operator-secret")
+    status, body = get("/metrics?source=journal&source=usage", "operator-secret")
+    assert status == 200 and set(body) == {"journal", "usage"}
+    assert get("/metrics?source=nope", "operator-secret")[0] == 400
@@ -0,0 +1,66 @@
+# python-backend/tests/test_sandbox_client.py
+#
+# `build_archive` streams a well-formed tar of the declared length without holding
+# spooled files in memory.
+import io
+import os
+import asyncio
+import tarfile
+import tracemalloc
+
+import pytest
+
+from attachments import TurnAttachment
+from sandbox_client import SANDBOX_FILE_UID, build_archive
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def files(tmp_path):
+    spooled = tmp_path / "spooled"
+    with open(spooled, "wb") as f:
+        for _ in range(40):
+            f.write(os.urandom(MB))
+    return [
+        TurnAttachment(name="data.bin", size=os.path.getsize(spooled), filepath=str(spooled)),
+        TurnAttachment(name="notes.txt", size=5, content=b"hello"),
+        TurnAttachment(name="../notes.txt", size=3, content=b"\x00\xff\x10"),
+        TurnAttachment(name="résumé – final.pdf", size=0, content=b""),
+    ]
+
+
+def test_spooled_files_are_streamed_not_loaded(files):
+    async def stream():
+        tracemalloc.start()
+        try:
+            _, members, chunks = build_archive(files)
+            async for chunk in chunks:
+                pass  # Sent on and dropped, as an upload does.
+            return members, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    members, peak = asyncio.run(stream())
+    assert [name for name, _ in members] == ["data.bin", "notes.txt", "notes (1).txt", "résumé – final.pdf"]
+    assert peak < 4 * MB
+
+
+def test_the_archive_matches_its_declared_length_and_extracts_intact(files):
+    async def collect():
+        length, _, chunks = build_archive(files)
+        archive = io.BytesIO()
+        async for chunk in chunks:
+            archive.write(chunk)
+        return length, archive
+
+    length, archive = asyncio.run(collect())
+    assert archive.tell() == length
+    archive.seek(0)
+    with tarfile.open(fileobj=archive) as tar:
+        contents = {m.name: (m.uid, tar.extractfile(m).read()) for m in tar.getmembers()}
+    with open(files[0].filepath, "rb") as f:
+        assert contents["data.bin"] == (SANDBOX_FILE_UID, f.read())
+    assert contents["notes.txt"][1] == b"hello"
+    assert contents["notes (1).txt"][1] == b"\x00\xff\x10"
+    assert contents["résumé – final.pdf"][1] == b""
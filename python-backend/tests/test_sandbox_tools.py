@@ -0,0 +1,165 @@
+# python-backend/tests/test_sandbox_tools.py
+#
+# SandboxTools against a stub sandbox manager that streams one line per CHUNK_DELAY
+# seconds: commands must not stall other connections on the event loop, one user's
+# commands are limited to the client's per-user concurrency, and connections are reused.
+import json
+import time
+import asyncio
+import threading
+
+import pytest
+
+from sandbox_client import SandboxClient
+from sandbox_tools import SandboxTools
+from tests.support import QuietHandler, max_loop_lag
+
+CHUNK_DELAY = 0.1
+LINES = 15
+SLOW_SECONDS = CHUNK_DELAY * LINES
+
+
+@pytest.fixture
+def manager(serve):
+    """
+    The sandbox manager's HTTP API. Commands look like "<user> slow" (LINES lines) or
+    "<user> fast" (one line); the health check fails `health_failures` times first.
+    """
+    state = {"sessions": 0, "connections": 0, "running": {}, "peak": {}, "health_failures": 1}
+    lock = threading.Lock()
+
+    class Handler(QuietHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            with lock:
+                state["connections"] += 1
+
+        def do_GET(self):
+            with lock:
+                failing = state["health_failures"] > 0
+                state["health_failures"] -= 1
+            if failing:
+                self.send_json(503, json.dumps({"detail": "starting"}).encode())
+            else:
+                self.send_json(200, json.dumps({"status": "ok"}).encode())
+
+        def do_DELETE(self):
+            self.send_json(200, json.dumps({"status": "deleted"}).encode())
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path == "/sessions":
+                with lock:
+                    state["sessions"] += 1
+                    sandbox_id = f"sbx-{state['sessions']}"
+                self.send_json(200, json.dumps({"session_id": sandbox_id}).encode())
+                return
+            user, speed = body["command"].split()
+            with lock:
+                state["running"][user] = state["running"].get(user, 0) + 1
+                state["peak"][user] = max(state["peak"].get(user, 0), state["running"][user])
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def send(event):
+                line = (json.dumps(event) + "\n").encode()
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+
+            try:
+                for i in range(1 if speed == "fast" else LINES):
+                    time.sleep(CHUNK_DELAY)
+                    send({"type": "stdout", "data": f"line {i}\n"})
+                send({"type": "exit", "exit_code": 0, "timed_out": False, "truncated": False, "log_id": "stub", "duration": 0})
+                self.wfile.write(b"0\r\n\r\n")
+            finally:
+                with lock:
+                    state["running"][user] -= 1
+
+    server = serve(Handler)
+    server.state = state
+    return server
+
+
+def new_client(manager) -> SandboxClient:
+    client = SandboxClient(base_url=manager.url, per_user_concurrency=2, retry_base_delay=0.01)
+    # Building the pool loads the SSL context once per process (~0.25 s); the server
+    # pays that at startup, not inside a turn.
+    client.http
+    return client
+
+
+def test_a_blocking_tool_is_detected(manager):
+    requests = pytest.importorskip("requests")
+
+    async def blocking_command():
+        # What the synchronous tool did when awaited on the event loop.
+        url = f"{manager.url}/sessions/old-sbx/exec/stream"
+        with requests.post(url, json={"command": "old slow"}, stream=True, timeout=70) as response:
+            for _ in response.iter_lines():
+                pass
+
+    assert asyncio.run(max_loop_lag(blocking_command)) > SLOW_SECONDS * 0.8
+
+
+def test_commands_stream_off_the_loop_within_the_per_user_limit(manager):
+    finished = []
+
+    async def scenario():
+        client = new_client(manager)
+        alice = SandboxTools(session_info={"user_id": "alice"}, client=client)
+        bob = SandboxTools(session_info={"user_id": "bob"}, client=client)
+
+        async def run(tools, speed, label):
+            output = await tools.execute_shell_command(f"{tools.session_info['user_id']} {speed}")
+            assert output.endswith("Exit Code: 0"), output
+            finished.append(label)
+
+        # Three slow commands of one user (limit 2) and a quick one of another.
+        started = time.perf_counter()
+        lag = await max_loop_lag(lambda: asyncio.gather(
+            run(alice, "slow", "alice-1"), run(alice, "slow", "alice-2"), run(alice, "slow", "alice-3"),
+            run(bob, "fast", "bob"),
+        ))
+        elapsed = time.perf_counter() - started
+        await client.close()
+        return lag, elapsed, alice
+
+    lag, elapsed, alice = asyncio.run(scenario())
+    assert lag < 0.1
+    assert finished[0] == "bob"
+    assert manager.state["peak"]["alice"] == 2
+    assert 2 * SLOW_SECONDS <= elapsed < 3 * SLOW_SECONDS
+    assert alice.session_info["active_sandbox_id"] and len(alice.session_info["sandbox_ids"]) == 1
+
+
+def test_connections_are_kept_alive(manager):
+    async def scenario():
+        client = new_client(manager)
+        tools = SandboxTools(session_info={"user_id": "alice"}, client=client)
+        await tools.execute_shell_command("alice fast")
+        connections = manager.state["connections"]
+        await tools.execute_shell_command("alice fast")
+        await tools.execute_shell_command("alice fast")
+        await client.close()
+        return connections
+
+    connections = asyncio.run(scenario())
+    assert manager.state["connections"] == connections
+
+
+def test_health_is_retried_and_sessions_deleted(manager):
+    async def scenario():
+        client = new_client(manager)
+        health = await client.health()
+        deleted = await client.delete_session("sbx-1")
+        await client.close()
+        return client, health, deleted
+
+    client, health, deleted = asyncio.run(scenario())
+    assert health["status"] == "ok" and client.stats["retries"] == 1
+    assert deleted
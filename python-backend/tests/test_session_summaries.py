@@ -0,0 +1,59 @@
+# python-backend/tests/test_session_summaries.py
+#
+# Sidebar payload for a heavy user: the previous listing (session_id, created_at and the
+# full memory of the 50 latest sessions) versus a page of summaries, and revalidation of
+# a page the client already has.
+import json
+import time
+
+import pytest
+
+from session_summaries import TITLE_LENGTH, decode_cursor, encode_cursor, etag_for, etag_matches, summarize_session
+
+
+@pytest.fixture(scope="module")
+def sessions():
+    now = int(time.time())
+    sessions = []
+    for i in range(50):
+        runs = []
+        for turn in range(30):
+            runs.append({"role": "user", "content": f"Previous conversation context:\n...\n\nCurrent message: Question {turn} about topic {i}? " + "detail " * 30, "timestamp": "2025-01-01T10:00:00"})
+            runs.append({"role": "assistant", "content": "An answer with code and explanation. " * 120, "timestamp": "2025-01-01T10:00:05"})
+        sessions.append({"session_id": f"{i:08d}-aaaa-bbbb-cccc-dddddddddddd", "user_id": "u1", "created_at": now - i * 3600, "updated_at": now - i * 3600, "memory": {"runs": runs}})
+    return sessions
+
+
+def size(payload) -> int:
+    return len(json.dumps(payload).encode("utf-8"))
+
+
+def test_a_summary_page_is_a_fraction_of_the_previous_listing(sessions):
+    old_listing = [{"session_id": s["session_id"], "created_at": s["created_at"], "memory": s["memory"]} for s in sessions]
+    summaries = [{k: v for k, v in summarize_session(s).items() if k != "user_id"} for s in sessions]
+    page = {"sessions": summaries[:20], "next_cursor": encode_cursor(summaries[19]["updated_at"], summaries[19]["session_id"])}
+    assert size(summaries) * 100 < size(old_listing)
+    assert size(page) < 10_000
+
+
+def test_summaries_show_what_the_user_typed(sessions):
+    summary = summarize_session(sessions[3])
+    assert summary["title"].startswith("Question 0 about topic 3?") and len(summary["title"]) == TITLE_LENGTH
+    assert summary["turn_count"] == 60
+    assert summary["last_message_preview"].startswith("An answer with code")
+    assert summary["byte_size"] == len(json.dumps(sessions[3]["memory"], separators=(",", ":")).encode())
+
+
+def test_cursors_round_trip_and_reject_filter_syntax():
+    cursor = encode_cursor(1735725600, "00000019-aaaa-bbbb-cccc-dddddddddddd")
+    assert decode_cursor(cursor) == (1735725600, "00000019-aaaa-bbbb-cccc-dddddddddddd")
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(1, "x),user_id.neq.(u1"))
+
+
+def test_revalidating_an_unchanged_page_matches_its_etag():
+    page = {"sessions": [{"session_id": "s1", "updated_at": 1}], "next_cursor": None}
+    etag = etag_for(page)
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", {etag[2:]}', etag)
+    assert not etag_matches(etag, etag_for({**page, "next_cursor": "c"}))
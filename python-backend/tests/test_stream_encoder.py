@@ -0,0 +1,107 @@
+# python-backend/tests/test_stream_encoder.py
+#
+# Frames and bytes sent for a simulated 1,000-token answer in each framing mode, with
+# and without permessage-deflate, and how long a slow client holds up the producer.
+import json
+import time
+import asyncio
+
+import pytest
+
+from stream_encoder import ENCODING_COMPACT, ENCODING_JSON, ENCODING_MSGPACK, StreamEncoder, negotiate_encoding
+
+# A member's log stream, then the coordinator's answer.
+DELTAS = (("Research Agent", True, 300), ("Aetheria_AI", False, 1000))
+TOTAL_DELTAS = sum(count for _, _, count in DELTAS)
+
+
+class RecordingSocket:
+    def __init__(self, send_delay: float = 0.0):
+        self.send_delay = send_delay
+        self.frames = []
+
+    async def send(self, data):
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        self.frames.append(data)
+
+
+def simulate(encoding: str, flush_interval: float, send_delay: float = 0.0):
+    """Streams the deltas the way Gemini does, one every few milliseconds; returns the encoder, socket and production time."""
+
+    async def run():
+        socket = RecordingSocket(send_delay)
+        encoder = StreamEncoder(socket, encoding=encoding, flush_interval=flush_interval, flush_bytes=2048)
+        start = time.perf_counter()
+        for owner, is_log, count in DELTAS:
+            for _ in range(count):
+                await encoder.send_content("3f2b9c1e-msg", owner, is_log, "tok ")
+                await asyncio.sleep(0.002)
+        await encoder.send_event({"content": "", "done": True, "id": "3f2b9c1e-msg"})
+        produced = time.perf_counter() - start
+        await encoder.close(timeout=60)
+        return encoder, socket, produced
+
+    return asyncio.run(run())
+
+
+@pytest.fixture(scope="module")
+def per_delta():
+    return simulate(ENCODING_JSON, 0)
+
+
+@pytest.fixture(scope="module")
+def windowed():
+    return simulate(ENCODING_JSON, 0.03)
+
+
+def test_per_delta_mode_sends_every_delta(per_delta):
+    encoder, socket, _ = per_delta
+    assert encoder.frames_sent == len(socket.frames) == TOTAL_DELTAS + 1
+    assert json.loads(socket.frames[-1])["done"] is True
+
+
+def test_flush_window_coalesces_deltas(per_delta, windowed):
+    encoder, socket, _ = windowed
+    assert encoder.frames_sent * 10 < per_delta[0].frames_sent
+    assert encoder.bytes_sent * 5 < per_delta[0].bytes_sent
+    assert "".join(json.loads(frame).get("content", "") for frame in socket.frames) == "tok " * TOTAL_DELTAS
+    assert encoder.dropped == 0
+
+
+def test_compact_encodings_send_fewer_bytes(windowed):
+    compact, _, _ = simulate(ENCODING_COMPACT, 0.03)
+    assert compact.bytes_sent < windowed[0].bytes_sent * 0.8
+    encoding = negotiate_encoding(ENCODING_MSGPACK)
+    if encoding != ENCODING_MSGPACK:
+        pytest.skip("msgpack is not installed")
+    packed, _, _ = simulate(encoding, 0.03)
+    assert packed.bytes_sent < compact.bytes_sent
+
+
+def deflated_bytes(frames) -> int:
+    """Wire bytes of `frames` under permessage-deflate with context takeover, as uvicorn's websockets server sends them."""
+    from websockets.frames import Frame, Opcode
+    from websockets.extensions.permessage_deflate import PerMessageDeflate
+
+    extension = PerMessageDeflate(False, False, 15, 15)
+    total = 0
+    for data in frames:
+        opcode, data = (Opcode.TEXT, data.encode("utf-8")) if isinstance(data, str) else (Opcode.BINARY, data)
+        total += len(extension.encode(Frame(opcode, data)).data)
+    return total
+
+
+def test_permessage_deflate_shrinks_the_stream(per_delta, windowed):
+    pytest.importorskip("websockets")
+    for encoder, socket, _ in (per_delta, windowed):
+        # Keys and agent names repeat in every frame; the shared window removes them.
+        assert deflated_bytes(socket.frames) < encoder.bytes_sent / 3
+
+
+def test_a_slow_client_does_not_hold_up_the_producer(per_delta):
+    encoder, socket, produced = simulate(ENCODING_JSON, 0, send_delay=0.05)
+    # Unmerged, 1,301 frames at 50 ms each would take over a minute.
+    assert produced < per_delta[2] * 1.5
+    assert encoder.merged > 0 and encoder.frames_sent < TOTAL_DELTAS / 10
+    assert json.loads(socket.frames[-1])["done"] is True
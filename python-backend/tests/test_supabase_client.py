@@ -0,0 +1,160 @@
+# python-backend/tests/test_supabase_client.py
+#
+# Supabase access must not block the server's event loop. A stub PostgREST answers
+# after REQUEST_DELAY seconds while a heartbeat measures how late the loop runs; a
+# blocking call on the loop stalls it for the whole request.
+import json
+import time
+import asyncio
+import logging
+import importlib
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from agno.tools.function import FunctionCall
+
+from supabase_client import SupabaseSyncFacade, build_async_client, build_http_client
+from tests.support import QuietHandler, max_loop_lag
+
+REQUEST_DELAY = 0.2
+LAG_BOUND = REQUEST_DELAY / 2
+
+
+@pytest.fixture
+def postgrest(serve):
+    """A PostgREST stand-in serving `rows[service]` from user_integrations, slowly."""
+
+    class Handler(QuietHandler):
+        rows = {}
+        requests = []
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            service = query.get("service", ["eq."])[0][3:]
+            Handler.requests.append(service)
+            time.sleep(REQUEST_DELAY)
+            rows = (Handler.rows.get(service) if service else [row for rows in Handler.rows.values() for row in rows]) or []
+            if "vnd.pgrst.object" in self.headers.get("Accept", ""):
+                # .single(): PostgREST refuses anything but exactly one row.
+                if len(rows) != 1:
+                    error = {"code": "PGRST116", "message": "JSON object requested, multiple (or no) rows returned"}
+                    self.send_json(406, json.dumps(error).encode())
+                    return
+                rows = rows[0]
+            self.send_json(200, json.dumps(rows).encode())
+
+    server = serve(Handler)
+    server.handler = Handler
+    return server
+
+
+def integrations_query(client, service: str = "github"):
+    return client.from_("user_integrations").select("access_token").eq("user_id", "user-1").eq("service", service).execute()
+
+
+def test_a_blocking_client_is_detected(postgrest):
+    from supabase import create_client
+
+    sync_client = create_client(postgrest.url, "stub-key")
+
+    async def blocking_call():
+        integrations_query(sync_client)
+
+    assert asyncio.run(max_loop_lag(blocking_call)) >= REQUEST_DELAY * 0.8
+
+
+def test_async_client_does_not_block_the_loop(postgrest):
+    async def scenario():
+        http_client = build_http_client()
+        client = build_async_client(postgrest.url, "stub-key", http_client)
+        try:
+            return await max_loop_lag(lambda: asyncio.gather(*(integrations_query(client) for _ in range(10))))
+        finally:
+            await http_client.aclose()
+
+    assert asyncio.run(scenario()) < LAG_BOUND
+    assert len(postgrest.handler.requests) == 10
+
+
+TOOLKITS = [
+    ("google_email_tools", "GoogleEmailTools", "read_latest_emails", "Google account not connected"),
+    ("google_drive_tools", "GoogleDriveTools", "search_files", "Google account not connected"),
+    ("github_tools", "GitHubTools", "list_repositories", "GitHub account not connected"),
+]
+
+
+async def call_tool(toolkit, name: str, **arguments) -> str:
+    """Runs a tool the way agno's arun does for a sync entrypoint: FunctionCall.execute in a worker thread."""
+    function = toolkit.functions[name]
+    function.process_entrypoint()
+    call = FunctionCall(function=function, arguments=arguments)
+    await asyncio.to_thread(call.execute)
+    return call.result
+
+
+@pytest.mark.parametrize("module_name, class_name, tool, not_connected", TOOLKITS)
+def test_toolkits_fetch_credentials_lazily_off_the_loop(postgrest, monkeypatch, caplog, module_name, class_name, tool, not_connected):
+    if module_name == "github_tools":
+        pytest.importorskip("github")
+    module = importlib.import_module(module_name)
+    facade = SupabaseSyncFacade(postgrest.url, "stub-key")
+    monkeypatch.setattr(module, "supabase_sync", facade)
+    # Nobody has connected the service: every credentials query finds no row.
+    toolkits = [getattr(module, class_name)(f"user-{n}") for n in range(5)]
+    assert postgrest.handler.requests == [], "credentials were fetched before any tool ran"
+
+    async def use(toolkit):
+        arguments = {"query": "report"} if tool == "search_files" else {}
+        return [await call_tool(toolkit, tool, **arguments) for _ in range(2)]
+
+    async def scenario():
+        results = []
+
+        async def work():
+            results.extend(await asyncio.gather(*(use(toolkit) for toolkit in toolkits)))
+
+        return await max_loop_lag(work), results
+
+    try:
+        with caplog.at_level(logging.ERROR):
+            lag, results = asyncio.run(scenario())
+    finally:
+        facade.close()
+    assert lag < LAG_BOUND
+    assert all(not_connected in output for outputs in results for output in outputs)
+    # One query per toolkit: "not connected" is remembered for the session.
+    assert len(postgrest.handler.requests) == len(toolkits)
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+
+
+def test_app_routes_query_supabase_without_blocking_the_loop(postgrest, monkeypatch):
+    pytest.importorskip("quart")
+    app_module = pytest.importorskip("app")
+    postgrest.handler.rows = {"github": [{"service": "github"}]}
+
+    async def get_user(token):
+        return SimpleNamespace(id="user-1")
+
+    monkeypatch.setattr(app_module.token_verifier, "get_user", get_user)
+
+    async def scenario():
+        http_client = build_http_client()
+        monkeypatch.setattr(app_module, "supabase_client", build_async_client(postgrest.url, "stub-key", http_client))
+        client = app_module.app.test_client()
+        responses = []
+
+        async def work():
+            responses.extend(await asyncio.gather(*(
+                client.get("/api/integrations", headers={"Authorization": "Bearer token"}) for _ in range(10)
+            )))
+
+        try:
+            lag = await max_loop_lag(work)
+            return lag, [(response.status_code, await response.get_json()) for response in responses]
+        finally:
+            await http_client.aclose()
+
+    lag, results = asyncio.run(scenario())
+    assert lag < LAG_BOUND
+    assert results == [(200, {"integrations": ["github"]})] * 10
@@ -0,0 +1,101 @@
+# python-backend/tests/test_tool_cache.py
+#
+# 200 research-agent lookups from 20 concurrent sessions over 12 distinct queries,
+# against a stub toolkit with 150 ms of upstream latency: uncached, cached (single-flight
+# shares the first call per query), and a restarted worker reading the SQLite tier.
+import json
+import time
+import random
+import concurrent.futures
+
+import pytest
+
+from tool_cache import ToolResultCache, cache_toolkit
+
+LATENCY = 0.15
+QUERIES = [f"topic {i}" for i in range(12)]
+
+
+class StubFunction:
+    def __init__(self, entrypoint):
+        self.entrypoint = entrypoint
+
+
+class StubResearchToolkit:
+    name = "wikipedia_tools"
+
+    def __init__(self):
+        self.upstream_calls = 0
+        self.functions = {"search_wikipedia": StubFunction(self.search_wikipedia)}
+
+    def search_wikipedia(self, query: str) -> str:
+        self.upstream_calls += 1
+        time.sleep(LATENCY)
+        return json.dumps({"query": query, "content": f"Article about {query}. " * 50})
+
+
+@pytest.fixture(scope="module")
+def workload():
+    rng = random.Random(7)
+    # Whitespace variants of the same query share an entry.
+    return [rng.choice(QUERIES) + rng.choice(["", " ", "  "]) for _ in range(200)]
+
+
+@pytest.fixture
+def sqlite_path(tmp_path):
+    return str(tmp_path / "tool_cache.db")
+
+
+def run(toolkit, workload, sessions=20):
+    search = toolkit.functions["search_wikipedia"].entrypoint
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=sessions) as pool:
+        results = list(pool.map(lambda q: search(query=q), workload))
+    return time.perf_counter() - start, results
+
+
+def test_concurrent_lookups_call_upstream_once_per_query(workload, sqlite_path):
+    plain = StubResearchToolkit()
+    uncached, _ = run(plain, workload)
+    assert plain.upstream_calls == len(workload)
+
+    cache = ToolResultCache(sqlite_path=sqlite_path)
+    toolkit = cache_toolkit(StubResearchToolkit(), cache)
+    cached, results = run(toolkit, workload)
+    metrics = cache.metrics()
+    cache.close()
+    assert toolkit.upstream_calls == len(QUERIES)
+    served = sum(metrics[stat] for stat in ("hits", "stale_hits", "disk_hits", "coalesced"))
+    assert metrics["misses"] == len(QUERIES) and served == len(workload) - len(QUERIES)
+    assert [json.loads(r)["query"].strip() for r in results] == [q.strip() for q in workload]
+    assert cached * 3 < uncached
+
+
+def test_a_restarted_worker_reads_the_sqlite_tier(workload, sqlite_path):
+    cache = ToolResultCache(sqlite_path=sqlite_path)
+    run(cache_toolkit(StubResearchToolkit(), cache), workload)
+    cache.close()
+
+    restarted = ToolResultCache(sqlite_path=sqlite_path)
+    toolkit = cache_toolkit(StubResearchToolkit(), restarted)
+    run(toolkit, workload)
+    assert toolkit.upstream_calls == 0 and restarted.metrics()["disk_hits"] >= len(QUERIES)
+    restarted.close()
+
+
+def test_stale_entries_are_served_and_refreshed_behind(sqlite_path):
+    cache = ToolResultCache(sqlite_path=sqlite_path)
+    toolkit = cache_toolkit(StubResearchToolkit(), cache)
+    search = toolkit.functions["search_wikipedia"].entrypoint
+    cache.ttls["search_wikipedia"] = 0.2
+    cache.stale_factor = 100
+    search(query="topic 1")
+    time.sleep(0.25)
+
+    start = time.perf_counter()
+    search(query="topic 1")
+    served = time.perf_counter() - start
+    time.sleep(LATENCY * 2)
+    cache.close()
+    assert served < LATENCY
+    assert toolkit.upstream_calls == 2, "one call to fill the entry, one background refresh"
@@ -0,0 +1,108 @@
+# python-backend/tests/test_usage_metrics.py
+#
+# A mass disconnect of 1,000 sessions from 200 users, each reporting one run: a
+# single-row insert per session versus the aggregator's bulk flush, against a stub
+# with 5 ms of round-trip latency.
+import time
+import random
+import asyncio
+from collections import Counter
+
+import pytest
+
+from usage_metrics import UsageAggregator
+
+SESSIONS, USERS = 1000, 200
+
+
+class RequestLogs:
+    """The stub `request_logs` table."""
+
+    def __init__(self, failures: int = 0):
+        self.requests = 0
+        self.rows = []
+        self.failures = failures
+
+    async def insert(self, rows):
+        self.requests += 1
+        await asyncio.sleep(0.005 + 0.00001 * len(rows))
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("connection reset")
+        self.rows.extend(rows)
+
+
+@pytest.fixture
+def runs():
+    rng = random.Random(7)
+    return [(f"user-{rng.randrange(USERS)}", rng.randint(500, 4000), rng.randint(100, 1500)) for _ in range(SESSIONS)]
+
+
+def totals(rows):
+    summed = Counter()
+    for row in rows:
+        summed[row["user_id"], "in"] += row["input_tokens"]
+        summed[row["user_id"], "out"] += row["output_tokens"]
+    return summed
+
+
+def test_usage_is_written_in_bulk(runs):
+    per_session, aggregated = RequestLogs(), RequestLogs()
+
+    async def insert_per_session():
+        for user_id, input_tokens, output_tokens in runs:
+            await per_session.insert([{"user_id": user_id, "input_tokens": input_tokens, "output_tokens": output_tokens}])
+
+    async def aggregate():
+        aggregator = UsageAggregator(flush_interval=3600, insert=aggregated.insert)
+        await aggregator.start()
+        for user_id, input_tokens, output_tokens in runs:
+            aggregator.record(user_id, input_tokens, output_tokens)
+        await aggregator.stop()
+        return aggregator
+
+    start = time.perf_counter()
+    asyncio.run(insert_per_session())
+    inserting = time.perf_counter() - start
+    start = time.perf_counter()
+    aggregator = asyncio.run(aggregate())
+    aggregating = time.perf_counter() - start
+
+    assert aggregating * 20 < inserting
+    assert aggregated.requests == 1
+    assert aggregator.stats["rows_inserted"] == len({user_id for user_id, _, _ in runs})
+    assert totals(aggregated.rows) == totals(
+        {"user_id": user_id, "input_tokens": i, "output_tokens": o} for user_id, i, o in runs
+    )
+
+
+def test_a_failed_flush_is_retried_without_losing_usage(runs):
+    logs = RequestLogs(failures=1)
+
+    async def scenario():
+        aggregator = UsageAggregator(flush_interval=3600, insert=logs.insert)
+        for user_id, input_tokens, output_tokens in runs[:500]:
+            aggregator.record(user_id, input_tokens, output_tokens)
+        assert await aggregator.flush() == 0
+        for user_id, input_tokens, output_tokens in runs[500:]:
+            aggregator.record(user_id, input_tokens, output_tokens)
+        await aggregator.stop()
+        return aggregator
+
+    aggregator = asyncio.run(scenario())
+    assert aggregator.stats["flush_errors"] == 1
+    assert totals(logs.rows) == totals(
+        {"user_id": user_id, "input_tokens": i, "output_tokens": o} for user_id, i, o in runs
+    )
+
+
+def test_stopping_right_after_a_wake_up_returns():
+    async def scenario():
+        aggregator = UsageAggregator(flush_interval=3600, max_pending_users=5, insert=RequestLogs().insert)
+        await aggregator.start()
+        for n in range(5):
+            aggregator.record(f"user-{n}", 10, 10)
+        await asyncio.wait_for(aggregator.stop(), 5)
+        return aggregator
+
+    assert asyncio.run(scenario()).stats["rows_inserted"] == 5
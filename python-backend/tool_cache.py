@@ -0,0 +1,372 @@
+# python-backend/tool_cache.py
+
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import inspect
+import logging
+import threading
+import functools
+import concurrent.futures
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# Seconds a result stays fresh, per tool. Anything else uses the cache's default TTL.
+TOOL_TTLS: Dict[str, int] = {
+    "get_current_stock_price": 60,
+    "get_historical_stock_prices": 900,
+    "get_technical_indicators": 900,
+    "get_company_news": 900,
+    "get_analyst_recommendations": 3600,
+    "get_company_info": 3600,
+    "get_stock_fundamentals": 3600,
+    "get_income_statements": 86400,
+    "get_key_financial_ratios": 86400,
+    "get_top_hackernews_stories": 300,
+    "get_user_details": 3600,
+    "google_search": 3600,
+    "search_arxiv_and_return_articles": 21600,
+    "read_arxiv_papers": 86400,
+    "search_wikipedia": 86400,
+}
+
+# Tools in otherwise read-only toolkits that have side effects.
+UNCACHEABLE_TOOLS = {"search_wikipedia_and_update_knowledge_base"}
+
+_ERROR_PREFIXES = ("error", "could not", "failed")
+
+
+@dataclass
+class CachedResult:
+    value: Any
+    stored_at: float
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    return value
+
+
+def _cacheable(value: Any) -> bool:
+    # Toolkits report most failures as a returned message rather than an exception.
+    if value is None:
+        return False
+    if isinstance(value, str):
+        return bool(value.strip()) and not value.lstrip().lower().startswith(_ERROR_PREFIXES)
+    return True
+
+
+class _SqliteTier:
+    """Results on disk, so a restarted worker starts warm. Only JSON-serializable values are kept."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tool_results ("
+            " key TEXT PRIMARY KEY, tool TEXT NOT NULL, value TEXT NOT NULL,"
+            " stored_at REAL NOT NULL, discard_at REAL NOT NULL)"
+        )
+        self.prune()
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at, discard_at FROM tool_results WHERE key = ? AND discard_at > ?", (key, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        value, stored_at, _ = row
+        return CachedResult(value=json.loads(value), stored_at=stored_at)
+
+    def put(self, key: str, tool: str, result: CachedResult, discard_at: float):
+        try:
+            value = json.dumps(result.value)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tool_results (key, tool, value, stored_at, discard_at) VALUES (?, ?, ?, ?, ?)",
+                (key, tool, value, result.stored_at, discard_at),
+            )
+
+    def prune(self) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM tool_results WHERE discard_at <= ?", (time.time(),)).rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ToolResultCache:
+    """
+    Shared result cache for read-only toolkit calls.
+
+    Results are keyed on the tool name and its arguments (bound to the signature, with
+    whitespace in strings collapsed), so the same lookup from any session or user is
+    answered once. A result is fresh for the tool's TTL; for `stale_factor` TTLs after
+    that it is still returned immediately while one background call refreshes it. Calls
+    for a key that is already being fetched wait for that call instead of making their
+    own (single-flight). Results live in an in-memory LRU of `max_entries` and, when
+    `sqlite_path` is set, in a SQLite file that survives restarts.
+    """
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, int]] = None,
+        default_ttl: Optional[int] = None,
+        stale_factor: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        sqlite_path: Optional[str] = None,
+        refresh_workers: int = 4,
+    ):
+        self.ttls = dict(TOOL_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl if default_ttl is not None else int(os.getenv("TOOL_CACHE_DEFAULT_TTL", "900"))
+        self.stale_factor = stale_factor if stale_factor is not None else float(os.getenv("TOOL_CACHE_STALE_FACTOR", "1"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "2048"))
+        if sqlite_path is None:
+            sqlite_path = os.getenv("TOOL_CACHE_SQLITE_PATH") or None
+        self._disk = _SqliteTier(sqlite_path) if sqlite_path else None
+        self._memory: "OrderedDict[str, CachedResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self._refresher = concurrent.futures.ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="tool-cache")
+        self.stats = {
+            "hits": 0, "stale_hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0,
+            "refreshes": 0, "refresh_errors": 0, "uncacheable": 0,
+        }
+        self.tool_stats: Dict[str, Dict[str, int]] = {}
+
+    def ttl_for(self, tool: str) -> int:
+        return self.ttls.get(tool, self.default_ttl)
+
+    @staticmethod
+    def key_for(scope: str, tool: str, arguments: Dict[str, Any]) -> str:
+        return f"{scope}.{tool}:" + json.dumps(_normalize(arguments), sort_keys=True, default=str)
+
+    def _count(self, tool: str, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+            per_tool = self.tool_stats.setdefault(tool, {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0})
+            if stat in per_tool:
+                per_tool[stat] += 1
+            elif stat == "disk_hits":
+                per_tool["hits"] += 1
+
+    def _lookup(self, key: str) -> Tuple[Optional[CachedResult], str]:
+        """The cached result for `key` and the stat a fresh result counts towards."""
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                self._memory.move_to_end(key)
+                return cached, "hits"
+        if self._disk is None:
+            return None, "hits"
+        cached = self._disk.get(key)
+        if cached is not None:
+            self._remember(key, cached)
+        return cached, "disk_hits"
+
+    def _remember(self, key: str, cached: CachedResult):
+        with self._lock:
+            self._memory[key] = cached
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _store(self, key: str, tool: str, value: Any):
+        if not _cacheable(value):
+            self._count(tool, "uncacheable")
+            return
+        cached = CachedResult(value=value, stored_at=time.time())
+        self._remember(key, cached)
+        if self._disk is not None:
+            self._disk.put(key, tool, cached, cached.stored_at + self.ttl_for(tool) * (1 + self.stale_factor))
+
+    def _classify(self, tool: str, cached: Optional[CachedResult]) -> str:
+        if cached is None:
+            return "miss"
+        ttl = self.ttl_for(tool)
+        age = time.time() - cached.stored_at
+        if age < ttl:
+            return "fresh"
+        if age < ttl * (1 + self.stale_factor):
+            return "stale"
+        return "miss"
+
+    def _fetch(self, key: str, tool: str, call: Callable[[], Any]) -> Tuple[concurrent.futures.Future, bool]:
+        """The in-flight future for `key`, and whether this caller is the one running it."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = self._inflight[key] = concurrent.futures.Future()
+        try:
+            value = call()
+            self._store(key, tool, value)
+            future.set_result(value)
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return future, True
+
+    def _refresh(self, key: str, tool: str, call: Callable[[], Any]):
+        with self._lock:
+            if key in self._inflight:
+                return
+            self.stats["refreshes"] += 1
+
+        def run():
+            future, _ = self._fetch(key, tool, call)
+            if future.exception() is not None:
+                with self._lock:
+                    self.stats["refresh_errors"] += 1
+                logger.warning(f"Background refresh of {tool} failed, keeping the stale result: {future.exception()}")
+
+        self._refresher.submit(run)
+
+    def call(self, scope: str, tool: str, arguments: Dict[str, Any], call: Callable[[], Any]) -> Any:
+        """Returns the cached result of a synchronous tool call, or runs `call` for it."""
+        key = self.key_for(scope, tool, arguments)
+        cached, hit_stat = self._lookup(key)
+        state = self._classify(tool, cached)
+        if state == "fresh":
+            self._count(tool, hit_stat)
+            return cached.value
+        if state == "stale":
+            self._count(tool, "stale_hits")
+            self._refresh(key, tool, call)
+            return cached.value
+
+        future, owner = self._fetch(key, tool, call)
+        self._count(tool, "misses" if owner else "coalesced")
+        return future.result()
+
+    async def acall(self, scope: str, tool: str, arguments: Dict[str, Any], call: Callable[[], Any]) -> Any:
+        """Like `call`, for coroutine tools: `call()` returns an awaitable."""
+        key = self.key_for(scope, tool, arguments)
+        cached, hit_stat = self._lookup(key)
+        state = self._classify(tool, cached)
+        if state == "fresh":
+            self._count(tool, hit_stat)
+            return cached.value
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = concurrent.futures.Future()
+
+        async def run():
+            try:
+                value = await call()
+                self._store(key, tool, value)
+                future.set_result(value)
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+        if state == "stale":
+            self._count(tool, "stale_hits")
+            if owner:
+                with self._lock:
+                    self.stats["refreshes"] += 1
+                asyncio.create_task(self._refresh_async(tool, run, future))
+            return cached.value
+
+        self._count(tool, "misses" if owner else "coalesced")
+        if owner:
+            await run()
+        return await asyncio.wrap_future(future)
+
+    async def _refresh_async(self, tool: str, run: Callable[[], Any], future: concurrent.futures.Future):
+        await run()
+        if future.exception() is not None:
+            with self._lock:
+                self.stats["refresh_errors"] += 1
+            logger.warning(f"Background refresh of {tool} failed, keeping the stale result: {future.exception()}")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def close(self):
+        self._refresher.shutdown(wait=False)
+        if self._disk is not None:
+            self._disk.close()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = sum(self.stats[s] for s in ("hits", "stale_hits", "disk_hits", "misses", "coalesced"))
+            served = lookups - self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_ratio": round(served / lookups, 4) if lookups else None,
+                "entries": len(self._memory),
+                "inflight": len(self._inflight),
+                "sqlite": self._disk.path if self._disk else None,
+                "tools": {tool: dict(s) for tool, s in self.tool_stats.items()},
+            }
+
+
+tool_result_cache = ToolResultCache()
+
+
+def cache_toolkit(toolkit, cache: Optional[ToolResultCache] = None, exclude: Iterable[str] = ()):
+    """
+    Routes the calls of a read-only Toolkit through the result cache, in place.
+    Returns the toolkit. Tools in `exclude` and UNCACHEABLE_TOOLS are left alone.
+    """
+    cache = cache or tool_result_cache
+    skip = set(exclude) | UNCACHEABLE_TOOLS
+    for name, function in toolkit.functions.items():
+        entrypoint = function.entrypoint
+        if name in skip or entrypoint is None or inspect.isgeneratorfunction(entrypoint) or inspect.isasyncgenfunction(entrypoint):
+            continue
+        function.entrypoint = _cached_entrypoint(cache, toolkit.name, name, entrypoint)
+    return toolkit
+
+
+def _cached_entrypoint(cache: ToolResultCache, scope: str, name: str, entrypoint: Callable[..., Any]) -> Callable[..., Any]:
+    signature = inspect.signature(entrypoint)
+
+    def arguments_of(args, kwargs) -> Dict[str, Any]:
+        try:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return dict(bound.arguments)
+        except TypeError:
+            return {"args": list(args), **kwargs}
+
+    if inspect.iscoroutinefunction(entrypoint):
+        @functools.wraps(entrypoint)
+        async def cached_async(*args, **kwargs):
+            return await cache.acall(scope, name, arguments_of(args, kwargs), lambda: entrypoint(*args, **kwargs))
+        return cached_async
+
+    @functools.wraps(entrypoint)
+    def cached(*args, **kwargs):
+        return cache.call(scope, name, arguments_of(args, kwargs), lambda: entrypoint(*args, **kwargs))
+    return cached
+
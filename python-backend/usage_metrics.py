@@ -0,0 +1,137 @@
+# python-backend/usage_metrics.py
+
+import os
+import asyncio
+import datetime
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+Insert = Callable[[List[Dict[str, Any]]], Awaitable[Any]]
+
+
+async def _supabase_insert(rows: List[Dict[str, Any]]):
+    from supabase_client import supabase_client
+    await supabase_client.from_('request_logs').insert(rows).execute()
+
+
+class UsageAggregator:
+    """
+    Collects token usage per run and writes it to `request_logs` in bulk.
+
+    `record` is called after every run with that run's token deltas. Usage is summed
+    per user in memory, and the flusher inserts one row per user every
+    `flush_interval` seconds, sooner once `max_pending_users` users are waiting, and at
+    shutdown. A failed insert is merged back and retried on the next flush.
+
+    Per-user daily totals are kept by the `usage_daily` table that sql/usage_daily.sql
+    maintains from request_logs with a trigger; `daily_usage` reads it for /api/usage.
+    """
+
+    def __init__(
+        self,
+        flush_interval: Optional[float] = None,
+        max_pending_users: Optional[int] = None,
+        insert: Optional[Insert] = None,
+    ):
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.getenv("USAGE_FLUSH_SECONDS", "30"))
+        self.max_pending_users = max_pending_users if max_pending_users is not None else int(os.getenv("USAGE_FLUSH_MAX_USERS", "500"))
+        self.insert = insert or _supabase_insert
+        self._pending: Dict[str, List[int]] = {}
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats = {"runs_recorded": 0, "rows_inserted": 0, "flushes": 0, "flush_errors": 0}
+
+    def record(self, user_id: str, input_tokens: int, output_tokens: int):
+        """Adds one run's token usage for a user. Never blocks or does I/O."""
+        if input_tokens <= 0 and output_tokens <= 0:
+            return
+        totals = self._pending.setdefault(str(user_id), [0, 0])
+        totals[0] += input_tokens
+        totals[1] += output_tokens
+        self.stats["runs_recorded"] += 1
+        if len(self._pending) >= self.max_pending_users:
+            self._wake.set()
+
+    def unflushed(self, user_id: str) -> Dict[str, int]:
+        """Tokens this worker has recorded for the user but not written yet."""
+        input_tokens, output_tokens = self._pending.get(str(user_id), (0, 0))
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _merge_back(self, pending: Dict[str, List[int]]):
+        for user_id, (input_tokens, output_tokens) in pending.items():
+            totals = self._pending.setdefault(user_id, [0, 0])
+            totals[0] += input_tokens
+            totals[1] += output_tokens
+
+    async def flush(self) -> int:
+        """Inserts the coalesced usage as one row per user. Returns the number of rows written."""
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            rows = [
+                {"user_id": user_id, "input_tokens": input_tokens, "output_tokens": output_tokens}
+                for user_id, (input_tokens, output_tokens) in pending.items()
+            ]
+            try:
+                await self.insert(rows)
+            except Exception as e:
+                self.stats["flush_errors"] += 1
+                logger.error(f"Failed to write usage for {len(rows)} users, will retry: {e}")
+                self._merge_back(pending)
+                return 0
+            self.stats["flushes"] += 1
+            self.stats["rows_inserted"] += len(rows)
+            return len(rows)
+
+    async def _run_flusher(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if not self._stopping:
+                await self.flush()
+
+    async def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._run_flusher())
+
+    async def stop(self):
+        if self._flusher is not None:
+            # Returned rather than cancelled, as in ConversationJournal.stop.
+            self._stopping = True
+            self._wake.set()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+            self._stopping = False
+        await self.flush()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self.stats, "pending_users": len(self._pending)}
+
+
+async def daily_usage(user_id: str, day: Optional[datetime.date] = None) -> Dict[str, int]:
+    """A user's token totals for one UTC day (today by default), from the usage_daily rollup."""
+    from supabase_client import supabase_client
+    day = day or datetime.datetime.now(datetime.timezone.utc).date()
+    response = await supabase_client.from_('usage_daily') \
+        .select('input_tokens, output_tokens, total_tokens') \
+        .eq('user_id', str(user_id)) \
+        .eq('day', day.isoformat()) \
+        .execute()
+    if response.data:
+        return response.data[0]
+    return {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+
+usage_aggregator = UsageAggregator()
+
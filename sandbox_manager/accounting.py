@@ -0,0 +1,139 @@
+# sandbox_manager/accounting.py
+import os
+import time
+import bisect
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+# Per-user CPU-second quota over a rolling window; 0 disables it.
+CPU_QUOTA_SECONDS = float(os.getenv("SANDBOX_CPU_QUOTA_SECONDS", "0"))
+QUOTA_WINDOW = int(os.getenv("SANDBOX_QUOTA_WINDOW", "3600"))
+# Per-session totals are kept for this many most recent sessions.
+MAX_TRACKED_SESSIONS = int(os.getenv("SANDBOX_MAX_TRACKED_SESSIONS", "1000"))
+
+# Upper bounds of the histogram buckets; the last bucket is everything above.
+HISTOGRAM_BUCKETS = {
+    "wall_seconds": [0.1, 0.5, 1, 5, 10, 30, 60, 300, 900],
+    "cpu_seconds": [0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300],
+    "peak_memory_mb": [16, 32, 64, 128, 192, 224, 256],
+    "output_bytes": [1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024],
+}
+
+
+class Histogram:
+    def __init__(self, bounds: List[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def snapshot(self) -> Dict:
+        labels = [f"<={bound}" for bound in self.bounds] + [f">{self.bounds[-1]}"]
+        return {"buckets": dict(zip(labels, self.counts)), "count": self.count, "sum": round(self.total, 3)}
+
+
+def _totals() -> Dict:
+    return {"executions": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "output_bytes": 0, "max_peak_memory_bytes": 0}
+
+
+def _rounded(totals: Dict) -> Dict:
+    return {key: round(value, 3) if isinstance(value, float) else value for key, value in totals.items()}
+
+
+class UsageLedger:
+    """
+    Resource usage of sandbox executions (see execution.ResourceSampler), totalled
+    per user and per session, with histograms over all executions.
+
+    The same records back the per-user CPU quota: `quota_retry_after` tells how long
+    a user who used CPU_QUOTA_SECONDS within the last QUOTA_WINDOW seconds must wait.
+    """
+
+    def __init__(self, cpu_quota: float = CPU_QUOTA_SECONDS, window: int = QUOTA_WINDOW):
+        self.cpu_quota = cpu_quota
+        self.window = window
+        self.users: Dict[str, Dict] = {}
+        self.sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self.histograms = {name: Histogram(bounds) for name, bounds in HISTOGRAM_BUCKETS.items()}
+        self._recent_cpu: Dict[str, Deque[Tuple[float, float]]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"executions": 0, "quota_rejections": 0}
+
+    def record(self, user_id: str, session_id: Optional[str], usage: Dict):
+        now = time.time()
+        with self._lock:
+            self.stats["executions"] += 1
+            targets = [self.users.setdefault(user_id, _totals())]
+            if session_id:
+                session = self.sessions.setdefault(session_id, {**_totals(), "user_id": user_id})
+                self.sessions.move_to_end(session_id)
+                while len(self.sessions) > MAX_TRACKED_SESSIONS:
+                    self.sessions.popitem(last=False)
+                targets.append(session)
+            for totals in targets:
+                totals["executions"] += 1
+                totals["wall_seconds"] += usage["wall_seconds"]
+                totals["cpu_seconds"] += usage["cpu_seconds"] or 0.0
+                totals["output_bytes"] += usage["output_bytes"]
+                totals["max_peak_memory_bytes"] = max(totals["max_peak_memory_bytes"], usage["peak_memory_bytes"] or 0)
+
+            self.histograms["wall_seconds"].observe(usage["wall_seconds"])
+            self.histograms["output_bytes"].observe(usage["output_bytes"])
+            if usage["cpu_seconds"] is not None:
+                self.histograms["cpu_seconds"].observe(usage["cpu_seconds"])
+                self._recent_cpu.setdefault(user_id, deque()).append((now, usage["cpu_seconds"]))
+            if usage["peak_memory_bytes"] is not None:
+                self.histograms["peak_memory_mb"].observe(usage["peak_memory_bytes"] / (1024 * 1024))
+
+    def _window_cpu(self, user_id: str, now: float) -> float:
+        recent = self._recent_cpu.get(user_id)
+        if not recent:
+            return 0.0
+        while recent and recent[0][0] <= now - self.window:
+            recent.popleft()
+        return sum(cpu for _, cpu in recent)
+
+    def quota_retry_after(self, user_id: str) -> Optional[int]:
+        """Seconds until the user is back under the CPU quota, or None if they are under it."""
+        if self.cpu_quota <= 0:
+            return None
+        now = time.time()
+        with self._lock:
+            used = self._window_cpu(user_id, now)
+            if used < self.cpu_quota:
+                return None
+            self.stats["quota_rejections"] += 1
+            # The oldest records drop out of the window first.
+            for timestamp, cpu in self._recent_cpu[user_id]:
+                used -= cpu
+                if used < self.cpu_quota:
+                    return max(1, int(timestamp + self.window - now) + 1)
+        return self.window
+
+    def user_usage(self, user_id: str) -> Dict:
+        with self._lock:
+            return {
+                **_rounded(self.users.get(user_id, _totals())),
+                "window_cpu_seconds": round(self._window_cpu(user_id, time.time()), 3),
+                "cpu_quota_seconds": self.cpu_quota or None,
+            }
+
+    def metrics(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            return {
+                **self.stats,
+                "quota": {"cpu_seconds": self.cpu_quota or None, "window_seconds": self.window},
+                "histograms": {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+                "users": {
+                    user_id: {**_rounded(totals), "window_cpu_seconds": round(self._window_cpu(user_id, now), 3)}
+                    for user_id, totals in self.users.items()
+                },
+                "sessions": {session_id: _rounded(totals) for session_id, totals in self.sessions.items()},
+            }
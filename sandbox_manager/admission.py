@@ -0,0 +1,172 @@
+# sandbox_manager/admission.py
+import os
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional
+
+from accounting import Histogram
+
+# Containers doing work at once on this host: executions, one-off containers and session starts.
+MAX_RUNNING = int(os.getenv("SANDBOX_MAX_RUNNING", "8"))
+MAX_QUEUED = int(os.getenv("SANDBOX_MAX_QUEUED", "64"))
+MAX_QUEUED_PER_USER = int(os.getenv("SANDBOX_MAX_QUEUED_PER_USER", "8"))
+# Seconds a request may wait for a slot before it is turned away.
+QUEUE_DEADLINE = float(os.getenv("SANDBOX_QUEUE_DEADLINE", "30"))
+# "user:weight,..." - a user with weight 2 is admitted twice per round-robin turn.
+USER_WEIGHTS = {
+    user: int(weight)
+    for user, weight in (item.split(":", 1) for item in os.getenv("SANDBOX_USER_WEIGHTS", "").split(",") if ":" in item)
+}
+QUEUE_WAIT_BUCKETS = [0.01, 0.1, 0.5, 1, 2, 5, 10, 30]
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Waiter:
+    user_id: str
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class AdmissionController:
+    """
+    Decides when a request may start work in a container. At most `capacity` run at
+    once; the rest wait in per-user queues that are served by weighted round robin,
+    so one user's burst waits behind its own requests rather than everyone else's.
+
+    A request is turned away (`AdmissionRejected`, a 429 for the client) when the
+    queues are full, when its user already has `max_queued_per_user` waiting, or when
+    it has not been admitted within `deadline` seconds. The Retry-After estimate is
+    the queue ahead of it times the average time a slot is held, over the capacity.
+
+    Runs on the event loop; `acquire` and `release` must be called from it.
+    """
+
+    def __init__(
+        self,
+        capacity: int = MAX_RUNNING,
+        max_queued: int = MAX_QUEUED,
+        max_queued_per_user: int = MAX_QUEUED_PER_USER,
+        deadline: float = QUEUE_DEADLINE,
+        weights: Optional[Dict[str, int]] = None,
+    ):
+        self.capacity = capacity
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        self.deadline = deadline
+        self.weights = weights if weights is not None else USER_WEIGHTS
+        self.running = 0
+        self.queues: Dict[str, Deque[_Waiter]] = {}
+        self._rotation: Deque[str] = deque()  # Users with waiters, in serving order.
+        self._credits: Dict[str, int] = {}
+        self._avg_hold = 1.0
+        self.queue_wait = Histogram(QUEUE_WAIT_BUCKETS)
+        self.stats = {"admitted": 0, "queued": 0, "rejected_full": 0, "rejected_deadline": 0, "max_running": 0}
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def _retry_after(self, ahead: int) -> int:
+        return max(1, math.ceil((ahead + 1) * self._avg_hold / self.capacity))
+
+    def _grant(self, user_id: str, enqueued_at: float):
+        self.running += 1
+        self.stats["admitted"] += 1
+        self.stats["max_running"] = max(self.stats["max_running"], self.running)
+        self.queue_wait.observe(time.monotonic() - enqueued_at)
+
+    def _dispatch(self):
+        while self.running < self.capacity and self._rotation:
+            user_id = self._rotation[0]
+            queue = self.queues[user_id]
+            while queue and queue[0].future.done():
+                queue.popleft()  # Gave up waiting.
+            if not queue:
+                self._rotation.popleft()
+                self._credits.pop(user_id, None)
+                del self.queues[user_id]
+                continue
+            waiter = queue.popleft()
+            self._grant(user_id, waiter.enqueued_at)
+            waiter.future.set_result(None)
+            credits = self._credits.get(user_id, self.weights.get(user_id, 1)) - 1
+            if credits <= 0 or not queue:
+                # Turn over: this user goes to the back with a fresh allowance.
+                self._rotation.rotate(-1)
+                credits = self.weights.get(user_id, 1)
+            self._credits[user_id] = credits
+
+    def _forget(self, waiter: _Waiter):
+        queue = self.queues.get(waiter.user_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+
+    async def acquire(self, user_id: str):
+        if self.running < self.capacity and not self._rotation:
+            self._grant(user_id, time.monotonic())
+            return
+        queued = self.queued
+        if queued >= self.max_queued or len(self.queues.get(user_id, ())) >= self.max_queued_per_user:
+            self.stats["rejected_full"] += 1
+            raise AdmissionRejected("The sandbox service is at capacity.", self._retry_after(queued))
+
+        waiter = _Waiter(user_id, asyncio.get_running_loop().create_future())
+        self.queues.setdefault(user_id, deque()).append(waiter)
+        if user_id not in self._rotation:
+            self._rotation.append(user_id)
+        self.stats["queued"] += 1
+        try:
+            done, _ = await asyncio.wait({waiter.future}, timeout=self.deadline)
+        except asyncio.CancelledError:
+            # The client went away; give back a slot granted in the meantime.
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release()
+            else:
+                waiter.future.cancel()
+                self._forget(waiter)
+            raise
+        if not done:
+            waiter.future.cancel()
+            self._forget(waiter)
+            self.stats["rejected_deadline"] += 1
+            raise AdmissionRejected(
+                f"No sandbox capacity became free within {self.deadline:g} s.", self._retry_after(self.queued)
+            )
+
+    def release(self, held: Optional[float] = None):
+        self.running -= 1
+        if held is not None:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user_id: str):
+        await self.acquire(user_id)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def metrics(self) -> Dict:
+        return {
+            **self.stats,
+            "running": self.running,
+            "capacity": self.capacity,
+            "queued": self.queued,
+            "queued_per_user": {user_id: len(queue) for user_id, queue in self.queues.items()},
+            "average_hold_seconds": round(self._avg_hold, 3),
+            "queue_wait_seconds": self.queue_wait.snapshot(),
+        }
+
@@ -0,0 +1,380 @@
+# sandbox_manager/dependency_cache.py
+import io
+import os
+import re
+import json
+import time
+import shlex
+import hashlib
+import threading
+from typing import Dict, Iterable, List, Set, Tuple
+
+import docker
+
+# Sandboxes run without a network, so `pip install` resolves packages from a shared
+# wheelhouse: a named volume, mounted read-only into every container, that holds
+# wheels and a PEP 503 "simple" index over them. pip is pointed at it through its
+# environment variables, so the agent's ordinary `pip install numpy` just works.
+WHEEL_VOLUME = os.getenv("SANDBOX_WHEEL_VOLUME", "ai-os-wheelhouse")
+WHEELHOUSE_PATH = "/opt/wheelhouse"
+SEED_PACKAGES = os.getenv(
+    "SANDBOX_SEED_PACKAGES",
+    "numpy pandas matplotlib scipy requests beautifulsoup4 scikit-learn sympy pillow pyyaml",
+).split()
+# Only these are ever built into the wheelhouse or baked: the seed packages and any
+# approved by the operator. Popularity among users alone never admits a package.
+APPROVED_PACKAGES = os.getenv("SANDBOX_APPROVED_PACKAGES", "").split()
+# Approved packages installed by at least this many distinct users are baked into a
+# derived image, at most this many.
+BAKE_MIN_INSTALLS = int(os.getenv("SANDBOX_BAKE_MIN_INSTALLS", "5"))
+BAKE_MAX_PACKAGES = int(os.getenv("SANDBOX_BAKE_MAX_PACKAGES", "20"))
+BAKE_INTERVAL = int(os.getenv("SANDBOX_BAKE_INTERVAL", str(6 * 3600)))
+STATS_PATH = os.getenv("SANDBOX_DEP_STATS_PATH", "/tmp/sandbox-deps/install-counts.json")
+LABEL_PACKAGES = "ai-os.sandbox.packages"
+
+# Options of `pip install` that take a value, so the value is not read as a package.
+_PIP_VALUE_OPTIONS = {
+    "-r", "--requirement", "-c", "--constraint", "-e", "--editable", "-t", "--target",
+    "-i", "--index-url", "--extra-index-url", "-f", "--find-links", "--prefix", "--root",
+    "--platform", "--python-version", "--implementation", "--abi", "--src", "--upgrade-strategy",
+    "--progress-bar", "--cache-dir", "--log", "--timeout", "--retries", "--trusted-host",
+}
+_COMMAND_SEPARATOR = re.compile(r"&&|\|\||[;|\n]")
+_PIP = re.compile(r"^pip(3(\.\d+)?)?$")
+_REQUIREMENT_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*")
+
+# Run in the builder container: writes the simple index for the wheels in the volume.
+_INDEX_SCRIPT = """
+import os, re, sys, html, collections
+root = sys.argv[1]
+projects = collections.defaultdict(list)
+for name in sorted(os.listdir(root)):
+    if name.endswith((".whl", ".tar.gz", ".zip")):
+        project = re.sub(r"[-_.]+", "-", re.split(r"-\\d", name, 1)[0]).lower()
+        projects[project].append(name)
+os.makedirs(f"{root}/simple", exist_ok=True)
+for project, files in projects.items():
+    os.makedirs(f"{root}/simple/{project}", exist_ok=True)
+    with open(f"{root}/simple/{project}/index.html", "w") as f:
+        f.write("".join(f'<a href="../../{html.escape(n)}">{html.escape(n)}</a><br>' for n in files))
+with open(f"{root}/simple/index.html", "w") as f:
+    f.write("".join(f'<a href="{p}/">{p}</a><br>' for p in sorted(projects)))
+print(len(projects))
+"""
+
+
+def normalize(name: str) -> str:
+    """PEP 503 project name."""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def installed_packages(command: str) -> List[str]:
+    """The packages a shell command asks pip to install, e.g. `pip install -q numpy 'pandas>=2'`."""
+    packages = []
+    for segment in _COMMAND_SEPARATOR.split(command):
+        try:
+            words = shlex.split(segment)
+        except ValueError:
+            continue
+        for i, word in enumerate(words):
+            is_pip = _PIP.match(os.path.basename(word)) or (word == "-m" and i + 1 < len(words) and words[i + 1] == "pip")
+            if not is_pip or "install" not in words[i:]:
+                continue
+            args = words[words.index("install", i) + 1:]
+            skip = False
+            for arg in args:
+                if skip:
+                    skip = False
+                elif arg in _PIP_VALUE_OPTIONS:
+                    skip = True
+                elif arg.startswith("-") or "/" in arg or ":" in arg:
+                    continue
+                else:
+                    match = _REQUIREMENT_NAME.match(arg)
+                    if match:
+                        packages.append(normalize(match.group(0)))
+            break
+    return packages
+
+
+def approved(packages: Iterable[str]) -> List[str]:
+    """The packages that may be seeded or baked, normalized and sorted."""
+    allowed = {normalize(p) for p in SEED_PACKAGES + APPROVED_PACKAGES}
+    return sorted({normalize(p) for p in packages} & allowed)
+
+
+def pip_environment() -> Dict[str, str]:
+    """Environment of sandbox containers that makes pip install from the wheelhouse."""
+    return {
+        "PIP_INDEX_URL": f"file://{WHEELHOUSE_PATH}/simple",
+        "PIP_FIND_LINKS": WHEELHOUSE_PATH,
+        "PIP_DISABLE_PIP_VERSION_CHECK": "1",
+        "PIP_NO_WARN_SCRIPT_LOCATION": "1",
+    }
+
+
+def wheelhouse_mount(read_only: bool = True) -> Dict[str, Dict[str, str]]:
+    return {WHEEL_VOLUME: {"bind": WHEELHOUSE_PATH, "mode": "ro" if read_only else "rw"}}
+
+
+class DependencyCache:
+    """
+    Manages what sandbox containers can import without downloading anything:
+
+    - the wheelhouse volume, seeded with SEED_PACKAGES and the most installed packages
+      by a short-lived builder container that has network access;
+    - a derived image with the most installed packages baked in (tagged by the
+      package set), which becomes the image new containers start from;
+    - only packages in SEED_PACKAGES or SANDBOX_APPROVED_PACKAGES are ever seeded or
+      baked, so users cannot get arbitrary code into every sandbox by installing it;
+    - prewarming at startup: each image is pulled if missing and started once to
+      import its packages, so the first real session does not pay for cold layers.
+
+    Popularity is the number of distinct users whose `pip install` of a package
+    succeeded (`observe`, called after each command exits); it is kept in STATS_PATH
+    across restarts.
+    """
+
+    def __init__(self, client, base_image: str):
+        self.client = client
+        self.base_image = base_image
+        self.image = base_image
+        self.baked_packages: List[str] = []
+        self.users: Dict[str, Set[str]] = {}
+        self.wheelhouse_packages: List[str] = []
+        self._lock = threading.Lock()
+        self._baking = threading.Event()
+        self._dirty = False
+        self.last_bake = 0.0
+        self.stats = {"observed_installs": 0, "bakes": 0, "bake_failures": 0, "seeded": 0, "prewarm_seconds": {}, "import_seconds": {}}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(STATS_PATH) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        for name, users in saved.get("users", {}).items():
+            self.users[name] = set(users)
+        self.last_bake = saved.get("last_bake", 0.0)
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"users": {name: sorted(users) for name, users in self.users.items()}, "last_bake": self.last_bake}
+            self._dirty = False
+        os.makedirs(os.path.dirname(STATS_PATH), exist_ok=True)
+        tmp = f"{STATS_PATH}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, STATS_PATH)
+
+    def observe(self, user_id: str, command: str, exit_code: int):
+        """Counts the packages a finished command installed. Failed commands count for nothing."""
+        if exit_code != 0:
+            return
+        packages = installed_packages(command)
+        if not packages:
+            return
+        with self._lock:
+            for name in packages:
+                self.users.setdefault(name, set()).add(str(user_id))
+            self.stats["observed_installs"] += len(packages)
+            self._dirty = True
+
+    def _ranked(self) -> List[Tuple[str, int]]:
+        with self._lock:
+            counts = [(name, len(users)) for name, users in self.users.items()]
+        return sorted(counts, key=lambda item: (-item[1], item[0]))
+
+    def popular(self) -> List[str]:
+        """Approved packages installed by at least BAKE_MIN_INSTALLS users, at most BAKE_MAX_PACKAGES."""
+        ranked = self._ranked()
+        allowed = set(approved(name for name, _ in ranked))
+        ranked = [(name, count) for name, count in ranked if name in allowed]
+        return sorted(name for name, count in ranked[:BAKE_MAX_PACKAGES] if count >= BAKE_MIN_INSTALLS)
+
+    # --- Wheelhouse ---
+    def seed_wheelhouse(self, packages: Iterable[str]) -> List[str]:
+        """Builds wheels for the approved `packages` (and their dependencies) into the volume and re-indexes it."""
+        packages = approved(packages)
+        script = " ; ".join(
+            [f"python3 -m pip wheel -q --wheel-dir {WHEELHOUSE_PATH} {shlex.quote(p)} || echo 'could not build {p}' >&2" for p in packages]
+            + [f"python3 -c {shlex.quote(_INDEX_SCRIPT)} {WHEELHOUSE_PATH}"]
+        )
+        started = time.monotonic()
+        self.client.containers.run(
+            image=self.base_image,
+            command=["bash", "-c", script],
+            user="root",
+            volumes=wheelhouse_mount(read_only=False),
+            # Plain pip settings for the builder: it downloads from PyPI.
+            environment={"PIP_DISABLE_PIP_VERSION_CHECK": "1"},
+            remove=True,
+        )
+        self.wheelhouse_packages = self._wheelhouse_projects()
+        self.stats["seeded"] += 1
+        print(f"Seeded the wheelhouse with {len(packages)} packages in {time.monotonic() - started:.1f} s.")
+        return self.wheelhouse_packages
+
+    def _wheelhouse_projects(self) -> List[str]:
+        output = self.client.containers.run(
+            image=self.base_image,
+            command=["bash", "-c", f"ls {WHEELHOUSE_PATH}/simple 2>/dev/null | grep -v index.html || true"],
+            volumes=wheelhouse_mount(),
+            network_disabled=True,
+            remove=True,
+        )
+        return sorted(output.decode().split())
+
+    # --- Baked images ---
+    def image_tag(self, packages: List[str]) -> str:
+        digest = hashlib.sha256(" ".join(packages).encode()).hexdigest()[:12]
+        repository = self.base_image.rsplit(":", 1)[0] if ":" in self.base_image.rsplit("/", 1)[-1] else self.base_image
+        return f"{repository}-deps:{digest}"
+
+    def bake(self, packages: List[str]) -> str:
+        """Builds (or reuses) an image of the base image with the approved `packages` installed for the sandbox user."""
+        packages = approved(packages)
+        tag = self.image_tag(packages)
+        try:
+            self.client.images.get(tag)
+        except docker.errors.ImageNotFound:
+            started = time.monotonic()
+            dockerfile = "\n".join([
+                f"FROM {self.base_image}",
+                f"RUN python3 -m pip install --user --no-cache-dir {' '.join(shlex.quote(p) for p in packages)}",
+                f'LABEL {LABEL_PACKAGES}="{" ".join(packages)}"',
+            ])
+            self.client.images.build(fileobj=io.BytesIO(dockerfile.encode()), tag=tag, rm=True)
+            print(f"Baked {tag} with {len(packages)} packages in {time.monotonic() - started:.1f} s.")
+        return tag
+
+    def maybe_bake(self, force: bool = False) -> bool:
+        """Bakes the popular packages when they changed and BAKE_INTERVAL has passed. Runs at most once at a time."""
+        packages = self.popular()
+        if not packages or packages == self.baked_packages:
+            return False
+        if not force and time.time() - self.last_bake < BAKE_INTERVAL:
+            return False
+        with self._lock:
+            if self._baking.is_set():
+                return False
+            self._baking.set()
+        try:
+            tag = self.bake(packages)
+            # Wheels too, for containers of the previous image and for dependents of the baked packages.
+            self.seed_wheelhouse(set(SEED_PACKAGES) | set(packages))
+            self._use(tag, packages)
+            self.prewarm_image(tag, packages)
+            self.stats["bakes"] += 1
+            return True
+        except docker.errors.DockerException as e:
+            self.stats["bake_failures"] += 1
+            print(f"WARNING: Could not bake popular packages {packages}: {e}")
+            return False
+        finally:
+            with self._lock:
+                self.last_bake = time.time()
+                self._dirty = True
+            self._baking.clear()
+
+    def bake_in_background(self, force: bool = False):
+        threading.Thread(target=self.maybe_bake, args=(force,), name="sandbox-image-bake", daemon=True).start()
+
+    def _use(self, tag: str, packages: List[str]):
+        with self._lock:
+            self.image = tag
+            self.baked_packages = packages
+
+    def _latest_baked(self):
+        """The newest baked image of this base image, if an earlier process built one."""
+        repository = self.image_tag([]).rsplit(":", 1)[0]
+        try:
+            images = self.client.images.list(name=repository)
+        except docker.errors.DockerException:
+            return None
+        images = [image for image in images if image.labels.get(LABEL_PACKAGES) is not None]
+        if not images:
+            return None
+        newest = max(images, key=lambda image: image.attrs.get("Created", ""))
+        return newest.tags[0], newest.labels[LABEL_PACKAGES].split()
+
+    # --- Prewarming ---
+    def time_to_first_import(self, image: str, packages: List[str], install: bool = False, network: bool = False,
+                             wheelhouse: bool = True) -> float:
+        """Seconds from container start until `packages` are imported, optionally installing them first."""
+        modules = [_module_name(p) for p in packages]
+        script = f"python3 -c {shlex.quote('import ' + ', '.join(modules))}"
+        if install:
+            script = f"python3 -m pip install -q --user {' '.join(shlex.quote(p) for p in packages)} && {script}"
+        started = time.monotonic()
+        self.client.containers.run(
+            image=image,
+            command=["bash", "-c", script],
+            volumes=wheelhouse_mount() if wheelhouse else None,
+            environment=pip_environment() if wheelhouse else {"PIP_DISABLE_PIP_VERSION_CHECK": "1"},
+            network_disabled=not network,
+            remove=True,
+        )
+        return time.monotonic() - started
+
+    def prewarm_image(self, image: str, packages: List[str]):
+        started = time.monotonic()
+        try:
+            self.client.images.get(image)
+        except docker.errors.ImageNotFound:
+            self.client.images.pull(image)
+        try:
+            seconds = self.time_to_first_import(image, packages) if packages else None
+        except docker.errors.ContainerError as e:
+            print(f"WARNING: Prewarm imports failed in {image}: {e}")
+            seconds = None
+        self.stats["prewarm_seconds"][image] = round(time.monotonic() - started, 2)
+        if seconds is not None:
+            self.stats["import_seconds"][image] = round(seconds, 2)
+
+    def adopt_baked(self):
+        """Startup: new containers start from the image an earlier process baked, if any."""
+        baked = self._latest_baked()
+        if baked:
+            self._use(*baked)
+            print(f"Using baked sandbox image {self.image} ({len(self.baked_packages)} packages).")
+
+    def prewarm(self):
+        """Startup: make sure the wheelhouse has the seed packages, then warm each image."""
+        try:
+            self.wheelhouse_packages = self._wheelhouse_projects()
+            missing = {normalize(p) for p in SEED_PACKAGES} - set(self.wheelhouse_packages)
+            if missing:
+                self.seed_wheelhouse(set(SEED_PACKAGES) | set(self.baked_packages))
+            self.prewarm_image(self.base_image, [])
+            if self.image != self.base_image:
+                self.prewarm_image(self.image, self.baked_packages)
+        except docker.errors.DockerException as e:
+            print(f"WARNING: Dependency cache prewarm failed: {e}")
+
+    def metrics(self) -> Dict:
+        top = self._ranked()[:BAKE_MAX_PACKAGES]
+        return {
+            **self.stats,
+            "image": self.image,
+            "baked_packages": self.baked_packages,
+            "wheelhouse_packages": len(self.wheelhouse_packages),
+            "top_installs": dict(top),
+            "baking": self._baking.is_set(),
+        }
+
+
+# Import names of common packages whose distribution name differs.
+_MODULE_NAMES = {
+    "beautifulsoup4": "bs4", "scikit-learn": "sklearn", "pillow": "PIL", "pyyaml": "yaml",
+    "opencv-python": "cv2", "python-dateutil": "dateutil",
+}
+
+
+def _module_name(package: str) -> str:
+    return _MODULE_NAMES.get(package, package.replace("-", "_"))
+
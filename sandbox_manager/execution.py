@@ -0,0 +1,319 @@
+# sandbox_manager/execution.py
+import os
+import re
+import time
+import uuid
+import queue
+import codecs
+import threading
+from typing import Dict, Iterator, Optional
+
+# Output kept per stream: the first HEAD bytes are streamed live, after that only the
+# last TAIL bytes are kept and sent when the command ends. The full output goes to a
+# log file that GET /logs/{log_id} returns.
+OUTPUT_HEAD_BYTES = int(os.getenv("SANDBOX_OUTPUT_HEAD_BYTES", "32768"))
+OUTPUT_TAIL_BYTES = int(os.getenv("SANDBOX_OUTPUT_TAIL_BYTES", "32768"))
+LOG_DIR = os.getenv("SANDBOX_LOG_DIR", "/tmp/sandbox-logs")
+LOG_MAX_BYTES = int(os.getenv("SANDBOX_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_RETENTION = int(os.getenv("SANDBOX_LOG_RETENTION", "3600"))
+# `timeout` sends SIGTERM at the deadline and SIGKILL this many seconds later.
+KILL_GRACE = 5
+HEARTBEAT_INTERVAL = float(os.getenv("SANDBOX_HEARTBEAT_INTERVAL", "10"))
+# How often the container's memory is sampled while a command runs.
+STATS_INTERVAL = float(os.getenv("SANDBOX_STATS_INTERVAL", "0.5"))
+
+_LOG_ID = re.compile(r"^[A-Za-z0-9_-]{1,80}$")
+
+# Runs the command under `timeout` (which makes itself a process group leader) and
+# records that group's id, so one command can be cancelled without touching others
+# running in the same session. Arguments: grace, timeout, pid file, command.
+_EXEC_SCRIPT = 'timeout --kill-after="$1" "$2" /bin/bash -c "$4" & pid=$!; echo $pid > "$3"; wait $pid; status=$?; rm -f "$3"; exit $status'
+_KILL_SCRIPT = 'pid=$(cat "$1" 2>/dev/null) && kill -KILL "-$pid"; rm -f "$1"'
+
+
+class HeadTailBuffer:
+    """The first `head_limit` and last `tail_limit` bytes of a stream, and how much was dropped."""
+
+    def __init__(self, head_limit: int = OUTPUT_HEAD_BYTES, tail_limit: int = OUTPUT_TAIL_BYTES):
+        self.head_limit = head_limit
+        self.tail_limit = tail_limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def write(self, data: bytes) -> str:
+        """Adds a chunk. Returns the text of the part that falls within the head."""
+        self.total += len(data)
+        room = self.head_limit - len(self.head)
+        live = data[:room] if room > 0 else b""
+        self.head += live
+        rest = data[len(live):]
+        if rest:
+            self.tail += rest
+            if len(self.tail) > self.tail_limit:
+                del self.tail[:len(self.tail) - self.tail_limit]
+        return self._decoder.decode(live) if live else ""
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > len(self.head) + len(self.tail)
+
+    @property
+    def omitted(self) -> int:
+        return self.total - len(self.head) - len(self.tail)
+
+    def tail_text(self) -> str:
+        return bytes(self.tail).decode("utf-8", errors="replace")
+
+    def text(self) -> str:
+        head = bytes(self.head).decode("utf-8", errors="replace")
+        if self.truncated:
+            return f"{head}\n[... {self.omitted} bytes omitted ...]\n{self.tail_text()}"
+        return head + self.tail_text()
+
+
+def log_path(log_id: str) -> Optional[str]:
+    """The spilled log for `log_id`, or None if the id is malformed or the log is gone."""
+    if not _LOG_ID.match(log_id):
+        return None
+    path = os.path.join(LOG_DIR, f"{log_id}.log")
+    return path if os.path.isfile(path) else None
+
+
+def prune_logs(max_age: int = LOG_RETENTION) -> int:
+    if not os.path.isdir(LOG_DIR):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for entry in os.scandir(LOG_DIR):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+class ResourceSampler:
+    """
+    CPU time and peak memory of one execution, from the container's cgroup as Docker
+    reports it. CPU time is the growth of the container's total CPU usage over the
+    execution; peak memory is the highest usage (without reclaimable page cache)
+    seen by sampling every STATS_INTERVAL seconds, so very short spikes can be missed.
+    Both include anything else running in the container at the same time.
+    """
+
+    def __init__(self, client, container_id: str, interval: float = STATS_INTERVAL):
+        self.client = client
+        self.container_id = container_id
+        self.interval = interval
+        self.peak_memory: Optional[int] = None
+        self.memory_limit: Optional[int] = None
+        self.samples = 0
+        self._cpu_start: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> Optional[int]:
+        """Takes one sample; returns the container's total CPU time in nanoseconds."""
+        try:
+            stats = self.client.api.stats(self.container_id, stream=False, one_shot=True)
+        except Exception:
+            return None
+        memory = stats.get("memory_stats") or {}
+        if "usage" in memory:
+            details = memory.get("stats") or {}
+            # Same as `docker stats`: page cache that can be reclaimed does not count.
+            usage = memory["usage"] - details.get("inactive_file", details.get("total_inactive_file", 0))
+            self.peak_memory = max(self.peak_memory or 0, usage)
+            self.memory_limit = memory.get("limit")
+            self.samples += 1
+        return ((stats.get("cpu_stats") or {}).get("cpu_usage") or {}).get("total_usage")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._cpu_start = self._sample()
+        self._thread = threading.Thread(target=self._run, name="sandbox-stats", daemon=True)
+        self._thread.start()
+
+    def abandon(self):
+        """Ends the sampling thread without waiting for it or taking a final sample."""
+        self._stop.set()
+
+    def stop(self) -> Optional[float]:
+        """Stops sampling; returns the CPU seconds used since `start`, if Docker reported them."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+        cpu_end = self._sample()
+        if self._cpu_start is None or cpu_end is None:
+            return None
+        return max(0, cpu_end - self._cpu_start) / 1e9
+
+
+class ExecutionStream:
+    """
+    Runs one command in a container with `docker exec` and yields its output as events:
+
+        {"type": "stdout" | "stderr", "data": "..."}        live output, in arrival order
+        {"type": "truncated", "stream": ..., "head_bytes": N} once a stream outgrows its head
+        {"type": "heartbeat", "elapsed": s}                   while the command is silent
+        {"type": "tail", "stream": ..., "data": ..., "omitted_bytes": N}
+        {"type": "exit", "exit_code": ..., "timed_out": ..., "truncated": ..., "log_id": ..., "duration": s,
+         "usage": {"wall_seconds": ..., "cpu_seconds": ..., "peak_memory_bytes": ..., "memory_limit_bytes": ..., "output_bytes": ...}}
+
+    The command runs under `timeout`, which signals its whole process group at the
+    deadline. If output still has not ended KILL_GRACE seconds later (a process left
+    the group), everything in the container except its init process is killed.
+
+    If the consumer goes away before the exit event (the generator is closed, e.g. a
+    streaming client disconnected), the command's process group is killed rather than
+    left running until its timeout; `cancel` does the same from another thread.
+    """
+
+    def __init__(self, client, container, command: str, timeout: int, log_prefix: str = "exec"):
+        self.client = client
+        self.container = container
+        self.command = command
+        self.timeout = timeout
+        self.log_id = f"{log_prefix}-{uuid.uuid4().hex[:12]}"
+        self.buffers: Dict[str, HeadTailBuffer] = {"stdout": HeadTailBuffer(), "stderr": HeadTailBuffer()}
+        self.exit_code: Optional[int] = None
+        self.timed_out = False
+        self.duration = 0.0
+        self.usage: Optional[Dict] = None
+        self.pid_file = f"/tmp/.sandbox-{self.log_id}.pid"
+        self.finished = False  # The command's output has ended.
+        self._cancelled = False
+
+    def _read(self, exec_id: str, chunks: "queue.Queue"):
+        try:
+            for stdout, stderr in self.client.api.exec_start(exec_id, stream=True, demux=True):
+                if stdout:
+                    chunks.put(("stdout", stdout))
+                if stderr:
+                    chunks.put(("stderr", stderr))
+        except Exception as e:
+            chunks.put(("error", str(e).encode()))
+        finally:
+            chunks.put(None)
+
+    def _kill_all(self):
+        try:
+            self.container.exec_run(["kill", "-KILL", "-1"])
+        except Exception as e:
+            print(f"WARNING: Could not kill runaway processes in {self.container.id[:12]}: {e}")
+
+    def cancel(self):
+        """Kills the command's process group if it is still running. Safe to call twice."""
+        if self.finished or self._cancelled:
+            return
+        self._cancelled = True
+        try:
+            self.container.exec_run(["/bin/sh", "-c", _KILL_SCRIPT, "sh", self.pid_file])
+        except Exception as e:
+            print(f"WARNING: Could not cancel {self.log_id} in {self.container.id[:12]}: {e}")
+
+    def events(self) -> Iterator[Dict]:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        exec_id = self.client.api.exec_create(
+            self.container.id,
+            ["/bin/sh", "-c", _EXEC_SCRIPT, "sh", str(KILL_GRACE), str(self.timeout), self.pid_file, self.command],
+            stdout=True, stderr=True,
+        )["Id"]
+        chunks: "queue.Queue" = queue.Queue()
+        sampler = ResourceSampler(self.client, self.container.id)
+        sampler.start()
+        try:
+            started = time.monotonic()
+            threading.Thread(target=self._read, args=(exec_id, chunks), daemon=True).start()
+
+            # A few seconds past `timeout`'s own SIGKILL.
+            deadline = started + self.timeout + KILL_GRACE + 2
+            killed_at = None
+            logged = 0
+            with open(os.path.join(LOG_DIR, f"{self.log_id}.log"), "wb") as log:
+                while True:
+                    now = time.monotonic()
+                    if killed_at is None and now >= deadline:
+                        self._kill_all()
+                        killed_at = now
+                        self.timed_out = True
+                    if killed_at is not None and now - killed_at > KILL_GRACE:
+                        break  # The reader is stuck; give up on it.
+                    wait = HEARTBEAT_INTERVAL if killed_at is None else KILL_GRACE
+                    try:
+                        item = chunks.get(timeout=max(0.1, min(wait, deadline - now if killed_at is None else wait)))
+                    except queue.Empty:
+                        yield {"type": "heartbeat", "elapsed": round(time.monotonic() - started, 1)}
+                        continue
+                    if item is None:
+                        self.finished = True
+                        break
+                    stream, data = item
+                    if stream == "error":
+                        stream = "stderr"
+                        data = b"[sandbox] output stream failed: " + data + b"\n"
+                    if logged < LOG_MAX_BYTES:
+                        log.write(data[:LOG_MAX_BYTES - logged])
+                        logged += min(len(data), LOG_MAX_BYTES - logged)
+                    buffer = self.buffers[stream]
+                    was_truncating = len(buffer.head) >= buffer.head_limit
+                    live = buffer.write(data)
+                    if live:
+                        yield {"type": stream, "data": live}
+                    if not was_truncating and len(buffer.head) >= buffer.head_limit and buffer.total > buffer.head_limit:
+                        yield {"type": "truncated", "stream": stream, "head_bytes": buffer.head_limit}
+
+            self.duration = time.monotonic() - started
+            cpu_seconds = sampler.stop()
+            self.usage = {
+                "wall_seconds": round(self.duration, 3),
+                "cpu_seconds": round(cpu_seconds, 3) if cpu_seconds is not None else None,
+                "peak_memory_bytes": sampler.peak_memory,
+                "memory_limit_bytes": sampler.memory_limit,
+                "output_bytes": sum(buffer.total for buffer in self.buffers.values()),
+            }
+            try:
+                self.exit_code = self.client.api.exec_inspect(exec_id).get("ExitCode")
+            except Exception:
+                self.exit_code = None
+            if self.exit_code is None:
+                self.exit_code = -1
+            # 124: `timeout` stopped it with SIGTERM; 137: it had to use SIGKILL.
+            if self.exit_code == 124 or (self.exit_code == 137 and self.duration >= self.timeout):
+                self.timed_out = True
+
+            for stream, buffer in self.buffers.items():
+                if buffer.tail:
+                    yield {"type": "tail", "stream": stream, "data": buffer.tail_text(), "omitted_bytes": buffer.omitted}
+            yield {
+                "type": "exit",
+                "exit_code": self.exit_code,
+                "timed_out": self.timed_out,
+                "truncated": self.truncated,
+                "log_id": self.log_id,
+                "duration": round(self.duration, 3),
+                "usage": self.usage,
+            }
+        finally:
+            sampler.abandon()  # A no-op after `stop`; otherwise the thread would poll forever.
+            if not self.finished:
+                # Closed before the command ended: nobody is reading, so stop it now. The
+                # generator may be finalized on an event loop, so don't block on the exec.
+                threading.Thread(target=self.cancel, daemon=True).start()
+
+    @property
+    def truncated(self) -> bool:
+        return any(buffer.truncated for buffer in self.buffers.values())
+
+    def run(self) -> "ExecutionStream":
+        """Runs the command to completion without streaming."""
+        for _ in self.events():
+            pass
+        return self
@@ -1,19 +1,77 @@
 # sandbox_manager/main.py
 import os
+import time
+import uuid
+import contextlib
+import socket
+import posixpath
+import tempfile
+import threading
+import weakref
+import json
 import docker
-from fastapi import FastAPI, HTTPException
+from collections import deque
+from dataclasses import dataclass, field
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Deque, Dict, Optional
+
+from execution import ExecutionStream, log_path, prune_logs
+from dependency_cache import DependencyCache, pip_environment, wheelhouse_mount
+from accounting import UsageLedger
+from admission import AdmissionController, AdmissionRejected
+
+# --- Configuration ---
+# The name of the sandbox image you pushed to Docker Hub
+# IMPORTANT: Store this in an environment variable in production
+SANDBOX_IMAGE = os.getenv("SANDBOX_IMAGE", "your-dockerhub-username/sandbox-image:latest")
+POOL_SIZE = int(os.getenv("SANDBOX_POOL_SIZE", "2"))
+IDLE_TIMEOUT = int(os.getenv("SANDBOX_IDLE_TIMEOUT", "900"))        # Seconds without an exec before a session is reaped
+MAX_LIFETIME = int(os.getenv("SANDBOX_MAX_LIFETIME", "3600"))       # Seconds a session may live at all
+REAP_INTERVAL = int(os.getenv("SANDBOX_REAP_INTERVAL", "30"))
+MAX_EXEC_TIMEOUT = int(os.getenv("SANDBOX_MAX_EXEC_TIMEOUT", "1800"))
+# Containers are labelled with the manager that owns them, so a restarted manager can
+# find and remove the ones its previous process left behind.
+MANAGER_ID = os.getenv("SANDBOX_MANAGER_ID", socket.gethostname())
+LABEL_MANAGED = "ai-os.sandbox"
+LABEL_MANAGER = "ai-os.sandbox.manager"
+# Relative archive paths are resolved against the sandbox user's home directory.
+SANDBOX_WORKDIR = os.getenv("SANDBOX_WORKDIR", "/home/sandboxuser")
+MAX_ARCHIVE_BYTES = int(os.getenv("SANDBOX_MAX_ARCHIVE_BYTES", str(512 * 1024 * 1024)))
+# Uploads are spooled in memory up to this size, then to a temporary file.
+ARCHIVE_SPOOL_MEMORY = 8 * 1024 * 1024
+ARCHIVE_CHUNK_SIZE = 256 * 1024
 
 # --- Pydantic Models for API Data Validation ---
 class ExecutionRequest(BaseModel):
     command: str = Field(..., description="The shell command to execute in the sandbox.")
-    timeout: int = Field(60, description="Timeout in seconds for the command execution.")
+    timeout: int = Field(60, ge=1, le=MAX_EXEC_TIMEOUT, description="Timeout in seconds for the command execution.")
+    user_id: Optional[str] = Field(None, description="User to account a one-off /execute to; sessions use their own user.")
+
+class ResourceUsage(BaseModel):
+    wall_seconds: float
+    cpu_seconds: Optional[float] = None
+    peak_memory_bytes: Optional[int] = None
+    memory_limit_bytes: Optional[int] = None
+    output_bytes: int
 
 class ExecutionResponse(BaseModel):
     stdout: str
     stderr: str
     exit_code: int
+    timed_out: bool = False
+    truncated: bool = False
+    log_id: Optional[str] = None
+    usage: Optional[ResourceUsage] = None
+
+class SessionRequest(BaseModel):
+    user_id: Optional[str] = Field(None, description="User the session's executions are accounted to.")
+
+class SessionResponse(BaseModel):
+    session_id: str
+    created_at: float
 
 # --- FastAPI Application ---
 app = FastAPI()
@@ -26,53 +84,543 @@ except docker.errors.DockerException as e:
     print(f"FATAL: Could not connect to Docker daemon. {e}")
     docker_client = None
 
+
+@dataclass
+class SandboxSession:
+    session_id: str
+    container: "docker.models.containers.Container"
+    user_id: str = "anonymous"
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    running: int = 0  # Commands in progress; a session is never idle while one runs.
+
+
+class SandboxRegistry:
+    """
+    Owns the sandbox containers: a pool of pre-started idle ones, and the ones bound to
+    sessions. A session takes a container from the pool (or starts one if the pool is
+    empty) and keeps it until it is deleted, idles for IDLE_TIMEOUT or reaches
+    MAX_LIFETIME, so files and installed packages survive between commands.
+
+    Containers start from the dependency cache's current image (the base image, or
+    one with popular packages baked in) with the wheelhouse mounted; pooled
+    containers of a superseded image are discarded instead of handed out.
+    """
+
+    def __init__(self, client, pool_size: int = POOL_SIZE):
+        self.client = client
+        self.pool_size = pool_size
+        self.dependencies = DependencyCache(client, SANDBOX_IMAGE)
+        self.sessions: Dict[str, SandboxSession] = {}
+        self.pool: Deque = deque()
+        # Ids of every container we started and have not removed, wherever it is
+        # (pool, session, a one-off /execute, or in between).
+        self._owned = set()
+        self._starting = 0  # Containers being created and not yet in _owned.
+        self._lock = threading.Lock()
+        self._refilling = threading.Event()
+        self._stop = threading.Event()
+        self.stats = {"created": 0, "from_pool": 0, "cold_starts": 0, "reaped_idle": 0, "reaped_expired": 0, "orphans_removed": 0}
+
+    def _start_container(self):
+        # Created, registered as ours, then started. The reaper removes labelled
+        # containers it does not know, so it holds off while a creation is in flight.
+        with self._lock:
+            self._starting += 1
+        try:
+            container = self.client.containers.create(
+                image=self.dependencies.image,
+                command=["sleep", "infinity"],
+                labels={LABEL_MANAGED: "1", LABEL_MANAGER: MANAGER_ID},
+                # pip installs from the read-only wheelhouse, since there is no network.
+                volumes=wheelhouse_mount(),
+                environment=pip_environment(),
+                # --- SECURITY: Resource Limits ---
+                mem_limit="256m",       # Max memory the container can use
+                cpu_shares=512,         # Relative CPU weight (default is 1024)
+                network_disabled=True,  # Disable networking for untrusted code
+            )
+            with self._lock:
+                self._owned.add(container.id)
+        finally:
+            with self._lock:
+                self._starting -= 1
+        try:
+            container.start()
+        except Exception:
+            self.remove(container)
+            raise
+        self.stats["created"] += 1
+        return container
+
+    def remove(self, container):
+        with self._lock:
+            self._owned.discard(container.id)
+        try:
+            container.remove(force=True)
+        except docker.errors.NotFound:
+            pass
+        except Exception as e:
+            print(f"WARNING: Failed to remove sandbox container {container.id[:12]}: {e}")
+
+    def _take_warm(self):
+        while True:
+            with self._lock:
+                if not self.pool:
+                    return None
+                container = self.pool.popleft()
+            try:
+                container.reload()
+                if container.status == "running" and container.attrs["Config"]["Image"] == self.dependencies.image:
+                    return container
+            except docker.errors.NotFound:
+                continue
+            self.remove(container)
+
+    def refill_pool(self):
+        """Tops the pool up to `pool_size`. Only one refill runs at a time."""
+        if self._refilling.is_set():
+            return
+        self._refilling.set()
+        try:
+            while not self._stop.is_set():
+                with self._lock:
+                    if len(self.pool) >= self.pool_size:
+                        return
+                container = self._start_container()
+                with self._lock:
+                    self.pool.append(container)
+        except Exception as e:
+            print(f"WARNING: Failed to pre-start a sandbox container: {e}")
+        finally:
+            self._refilling.clear()
+
+    def _refill_in_background(self):
+        threading.Thread(target=self.refill_pool, name="sandbox-pool-refill", daemon=True).start()
+
+    def acquire(self):
+        """A running container for one-off or session use, warm from the pool if possible."""
+        container = self._take_warm()
+        if container is not None:
+            self.stats["from_pool"] += 1
+        else:
+            self.stats["cold_starts"] += 1
+            container = self._start_container()
+        self._refill_in_background()
+        return container
+
+    def create_session(self, user_id: str = "anonymous") -> SandboxSession:
+        session = SandboxSession(session_id=uuid.uuid4().hex, container=self.acquire(), user_id=user_id)
+        with self._lock:
+            self.sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id: str) -> Optional[SandboxSession]:
+        with self._lock:
+            return self.sessions.get(session_id)
+
+    def delete_session(self, session_id: str) -> bool:
+        with self._lock:
+            session = self.sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self.remove(session.container)
+        return True
+
+    def reap(self):
+        """Removes idle and expired sessions, and containers of ours that nothing tracks."""
+        now = time.time()
+        with self._lock:
+            idle = [s for s in self.sessions.values() if now - s.last_used > IDLE_TIMEOUT and not s.running]
+            expired = [s for s in self.sessions.values() if now - s.created_at > MAX_LIFETIME and s not in idle]
+            for session in idle + expired:
+                self.sessions.pop(session.session_id, None)
+        for session in idle + expired:
+            self.remove(session.container)
+        self.stats["reaped_idle"] += len(idle)
+        self.stats["reaped_expired"] += len(expired)
+        self.remove_orphans()
+        prune_logs()
+
+    def remove_orphans(self) -> int:
+        labelled = self.client.containers.list(all=True, filters={"label": [f"{LABEL_MANAGED}=1", f"{LABEL_MANAGER}={MANAGER_ID}"]})
+        with self._lock:
+            if self._starting:
+                # One of the listed containers may be ours but not registered yet; next round.
+                return 0
+            orphans = [c for c in labelled if c.id not in self._owned]
+        for container in orphans:
+            self.remove(container)
+        self.stats["orphans_removed"] += len(orphans)
+        return len(orphans)
+
+    def _run_reaper(self):
+        while not self._stop.wait(REAP_INTERVAL):
+            try:
+                self.reap()
+                self.refill_pool()
+                self.dependencies.save()
+                self.dependencies.bake_in_background()
+            except Exception as e:
+                print(f"WARNING: Sandbox reaper failed: {e}")
+
+    def start(self):
+        # Anything labelled with our id is left over from a previous process.
+        removed = self.remove_orphans()
+        if removed:
+            print(f"Removed {removed} orphaned sandbox containers.")
+        self.dependencies.adopt_baked()
+        self._refill_in_background()
+        threading.Thread(target=self.dependencies.prewarm, name="sandbox-prewarm", daemon=True).start()
+        threading.Thread(target=self._run_reaper, name="sandbox-reaper", daemon=True).start()
+
+    def shutdown(self):
+        self._stop.set()
+        self.dependencies.save()
+        with self._lock:
+            containers = [s.container for s in self.sessions.values()] + list(self.pool)
+            self.sessions.clear()
+            self.pool.clear()
+        for container in containers:
+            self.remove(container)
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                **self.stats, "sessions": len(self.sessions), "pool": len(self.pool), "pool_size": self.pool_size,
+                "image": self.dependencies.image,
+            }
+
+
+registry = SandboxRegistry(docker_client) if docker_client else None
+ledger = UsageLedger()
+# Container work is admitted here, on the event loop, before a worker thread is taken.
+admission = AdmissionController()
+
+
+def _require_registry() -> SandboxRegistry:
+    if not registry:
+        raise HTTPException(status_code=500, detail="Docker client is not available.")
+    return registry
+
+
+def _execution(container, request: ExecutionRequest, log_prefix: str) -> ExecutionStream:
+    return ExecutionStream(registry.client, container, request.command, request.timeout, log_prefix=log_prefix)
+
+
+def _response(execution: ExecutionStream) -> ExecutionResponse:
+    return ExecutionResponse(
+        stdout=execution.buffers["stdout"].text(),
+        stderr=execution.buffers["stderr"].text(),
+        exit_code=execution.exit_code,
+        timed_out=execution.timed_out,
+        truncated=execution.truncated,
+        log_id=execution.log_id,
+        usage=execution.usage,
+    )
+
+
+def _check_quota(user_id: str):
+    retry_after = ledger.quota_retry_after(user_id)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=429,
+            detail=f"CPU quota of {ledger.cpu_quota:g} s per {ledger.window} s used up; retry in {retry_after} s.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+async def _admit(user_id: str) -> float:
+    """Waits for an admission slot; returns when it was granted. Turns rejections into 429s."""
+    try:
+        await admission.acquire(user_id)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
+    return time.monotonic()
+
+
+@contextlib.asynccontextmanager
+async def _admitted(user_id: str):
+    admitted_at = await _admit(user_id)
+    try:
+        yield
+    finally:
+        admission.release(time.monotonic() - admitted_at)
+
+
+def _account(user_id: str, session_id: Optional[str], execution: ExecutionStream):
+    if execution.usage is not None:
+        ledger.record(user_id, session_id, execution.usage)
+    # Only installs that succeeded count towards what gets baked.
+    if execution.exit_code is not None and not execution.timed_out:
+        registry.dependencies.observe(user_id, execution.command, execution.exit_code)
+
+
+def _session_for_exec(session_id: str) -> SandboxSession:
+    session = _require_registry().get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Sandbox session '{session_id}' not found.")
+    return session
+
+
+def _container_path(path: str) -> str:
+    resolved = posixpath.normpath(posixpath.join(SANDBOX_WORKDIR, path))
+    if not resolved.startswith("/"):
+        raise HTTPException(status_code=400, detail=f"Invalid sandbox path '{path}'.")
+    return resolved
+
+
+class _SessionInUse:
+    """Keeps a session from being reaped as idle while a transfer runs."""
+
+    def __init__(self, session: SandboxSession):
+        self.session = session
+
+    def __enter__(self):
+        self.session.running += 1
+        self.session.last_used = time.time()
+        return self.session
+
+    def __exit__(self, *exc):
+        self.session.running -= 1
+        self.session.last_used = time.time()
+
+
+@app.on_event("startup")
+def start_registry():
+    if registry:
+        registry.start()
+
+@app.on_event("shutdown")
+def stop_registry():
+    if registry:
+        registry.shutdown()
+
 # --- API Endpoints ---
 @app.get("/health")
 def health_check():
     """Simple health check to ensure the service is running."""
-    return {"status": "ok"}
+    return {"status": "ok", **(registry.metrics() if registry else {}), "admission": admission.metrics()}
 
-@app.post("/execute", response_model=ExecutionResponse)
-def execute_command(request: ExecutionRequest):
+@app.post("/sessions", response_model=SessionResponse)
+async def create_session(request: Optional[SessionRequest] = None):
     """
-    Executes a command in a new, isolated Docker container.
+    Starts a sandbox session backed by its own container, taken from the warm pool.
     """
-    if not docker_client:
-        raise HTTPException(status_code=500, detail="Docker client is not available.")
+    user_id = (request and request.user_id) or "anonymous"
+    registry = _require_registry()
+    try:
+        async with _admitted(user_id):
+            session = await run_in_threadpool(registry.create_session, user_id)
+    except docker.errors.ImageNotFound:
+        raise HTTPException(status_code=500, detail=f"Sandbox image '{SANDBOX_IMAGE}' not found.")
+    except docker.errors.DockerException as e:
+        raise HTTPException(status_code=500, detail=f"Could not start a sandbox: {str(e)}")
+    return SessionResponse(session_id=session.session_id, created_at=session.created_at)
+
+@app.post("/sessions/{session_id}/exec", response_model=ExecutionResponse)
+async def exec_in_session(session_id: str, request: ExecutionRequest):
+    """
+    Executes a command in the session's container with `docker exec`. Files and
+    installed packages persist between commands of the same session.
+    """
+    session = _session_for_exec(session_id)
+    _check_quota(session.user_id)
+    async with _admitted(session.user_id):
+        session.running += 1
+        session.last_used = time.time()
+        execution = _execution(session.container, request, session_id)
+        try:
+            return _response(await run_in_threadpool(execution.run))
+        except docker.errors.NotFound:
+            registry.delete_session(session_id)
+            raise HTTPException(status_code=404, detail=f"Sandbox session '{session_id}' is gone.")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+        finally:
+            session.running -= 1
+            session.last_used = time.time()
+            _account(session.user_id, session_id, execution)
 
-    # The name of the sandbox image you pushed to Docker Hub
-    # IMPORTANT: Store this in an environment variable in production
-    sandbox_image = os.getenv("SANDBOX_IMAGE", "your-dockerhub-username/sandbox-image:latest")
+@app.post("/sessions/{session_id}/exec/stream")
+async def stream_exec_in_session(session_id: str, request: ExecutionRequest):
+    """
+    Like /exec, but streams the output as newline-delimited JSON events while the
+    command runs (see execution.ExecutionStream): stdout and stderr chunks, heartbeats
+    while it is silent, the retained tail of oversized output, and a final exit event.
+    """
+    session = _session_for_exec(session_id)
+    _check_quota(session.user_id)
+    # Admitted before the response starts, so a rejection is still a plain 429.
+    admitted_at = await _admit(session.user_id)
+    execution = _execution(session.container, request, session_id)
 
-    try:
-        # Run the command in a new container.
-        # This is a blocking call that waits for the container to finish.
-        container = docker_client.containers.run(
-            image=sandbox_image,
-            command=f"/bin/bash -c '{request.command}'",
-            detach=False,  # Run in the foreground and wait for completion
-            remove=True,   # Automatically remove the container when it exits
-            # --- SECURITY: Resource Limits ---
-            mem_limit="256m",       # Max memory the container can use
-            cpu_shares=512,         # Relative CPU weight (default is 1024)
-            network_disabled=True,  # Disable networking for untrusted code
-        )
+    def events():
+        session.running += 1
+        session.last_used = time.time()
+        try:
+            for event in execution.events():
+                yield json.dumps(event) + "\n"
+        except docker.errors.NotFound:
+            registry.delete_session(session_id)
+            yield json.dumps({"type": "error", "detail": f"Sandbox session '{session_id}' is gone."}) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": f"An unexpected error occurred: {str(e)}"}) + "\n"
+        finally:
+            session.running -= 1
+            session.last_used = time.time()
+            _account(session.user_id, session_id, execution)
 
-        # The result is returned as bytes, so we decode it
-        stdout = container.decode('utf-8')
-        stderr = "" # Stderr is captured by the exception below if command fails
-        exit_code = 0
-
-    except docker.errors.ContainerError as e:
-        # This error is raised if the command in the container exits with a non-zero status
-        stdout = e.container.logs(stdout=True).decode('utf-8')
-        stderr = e.container.logs(stderr=True).decode('utf-8')
-        exit_code = e.exit_status
-    
-    except docker.errors.ImageNotFound:
-        raise HTTPException(status_code=500, detail=f"Sandbox image '{sandbox_image}' not found.")
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+    async def body():
+        try:
+            async for line in iterate_in_threadpool(events()):
+                yield line
+        finally:
+            release()
+            if not execution.finished:
+                # The client went away mid-command. Stopping it blocks on an exec, so not here.
+                threading.Thread(target=execution.cancel, daemon=True).start()
 
-    return ExecutionResponse(stdout=stdout, stderr=stderr, exit_code=exit_code)
\ No newline at end of file
+    stream = body()
+    # Released once: when the body ends, or when it is collected without having started
+    # (the client left before the first chunk, or the response failed to start).
+    release = weakref.finalize(stream, lambda: admission.release(time.monotonic() - admitted_at))
+    return StreamingResponse(stream, media_type="application/x-ndjson")
+
+@app.put("/sessions/{session_id}/archive")
+async def put_archive(session_id: str, request: Request, path: str = Query(".", description="Directory to extract into; created if missing.")):
+    """
+    Extracts a tar archive (the request body) into a directory of the session's
+    container, so many files arrive in one request. The body is spooled while it is
+    received and streamed to Docker's `put_archive`; it may not exceed
+    SANDBOX_MAX_ARCHIVE_BYTES.
+    """
+    session = _session_for_exec(session_id)
+    target = _container_path(path)
+    declared = int(request.headers.get("content-length") or 0)
+    if declared > MAX_ARCHIVE_BYTES:
+        raise HTTPException(status_code=413, detail=f"Archives are limited to {MAX_ARCHIVE_BYTES} bytes.")
+
+    with _SessionInUse(session), tempfile.SpooledTemporaryFile(max_size=ARCHIVE_SPOOL_MEMORY) as spool:
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > MAX_ARCHIVE_BYTES:
+                raise HTTPException(status_code=413, detail=f"Archives are limited to {MAX_ARCHIVE_BYTES} bytes.")
+            await run_in_threadpool(spool.write, chunk)
+        spool.seek(0)
+
+        def extract():
+            # Created as the sandbox user, so the extracted files can be changed by commands.
+            exit_code, output = session.container.exec_run(["mkdir", "-p", target])
+            if exit_code != 0:
+                raise HTTPException(status_code=400, detail=f"Could not create '{target}': {output.decode(errors='replace').strip()}")
+            if not session.container.put_archive(target, spool):
+                raise HTTPException(status_code=500, detail=f"Docker rejected the archive for '{target}'.")
+
+        try:
+            await run_in_threadpool(extract)
+        except docker.errors.NotFound:
+            registry.delete_session(session_id)
+            raise HTTPException(status_code=404, detail=f"Sandbox session '{session_id}' is gone.")
+        except docker.errors.APIError as e:
+            raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+    return {"status": "extracted", "path": target, "bytes": received}
+
+@app.get("/sessions/{session_id}/archive")
+def get_archive(session_id: str, path: str = Query(..., description="File or directory to download.")):
+    """
+    Streams a file or directory of the session's container as a tar archive, straight
+    from Docker's `get_archive`. The X-Archive-Stat header carries Docker's stat of
+    the path as JSON.
+    """
+    session = _session_for_exec(session_id)
+    target = _container_path(path)
+    with _SessionInUse(session):
+        try:
+            chunks, stat = session.container.get_archive(target, chunk_size=ARCHIVE_CHUNK_SIZE)
+        except docker.errors.NotFound:
+            try:
+                session.container.reload()
+            except docker.errors.NotFound:
+                registry.delete_session(session_id)
+                raise HTTPException(status_code=404, detail=f"Sandbox session '{session_id}' is gone.")
+            raise HTTPException(status_code=404, detail=f"'{target}' does not exist in the sandbox.")
+        except docker.errors.APIError as e:
+            raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+    def body():
+        with _SessionInUse(session):
+            yield from chunks
+
+    return StreamingResponse(body(), media_type="application/x-tar", headers={"X-Archive-Stat": json.dumps(stat)})
+
+@app.get("/metrics")
+def usage_metrics():
+    """
+    Resource usage of executions: histograms of wall time, CPU time, peak memory and
+    output size, and totals per user and per recent session. "admission" has the
+    queue: running and queued requests, rejections and a histogram of queue wait.
+    """
+    return {**ledger.metrics(), "admission": admission.metrics()}
+
+@app.get("/users/{user_id}/usage")
+def user_usage(user_id: str):
+    """A user's totals and CPU seconds used within the quota window."""
+    return ledger.user_usage(user_id)
+
+@app.get("/dependencies")
+def dependency_metrics():
+    """Installing users per package, the baked image and its packages, and prewarm timings."""
+    return _require_registry().dependencies.metrics()
+
+@app.post("/dependencies/bake", status_code=202)
+def bake_dependencies():
+    """Bakes the currently popular packages into a new image now, in the background."""
+    dependencies = _require_registry().dependencies
+    packages = dependencies.popular()
+    if not packages:
+        raise HTTPException(status_code=409, detail="No approved package has been installed by enough users to bake.")
+    dependencies.bake_in_background(force=True)
+    return {"status": "baking", "packages": packages}
+
+@app.get("/logs/{log_id}")
+def get_log(log_id: str):
+    """The full output of an execution, kept for SANDBOX_LOG_RETENTION seconds."""
+    path = log_path(log_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Log '{log_id}' not found.")
+    return FileResponse(path, media_type="text/plain; charset=utf-8")
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    """Removes a session and its container."""
+    if not _require_registry().delete_session(session_id):
+        raise HTTPException(status_code=404, detail=f"Sandbox session '{session_id}' not found.")
+    return {"status": "deleted", "session_id": session_id}
+
+@app.post("/execute", response_model=ExecutionResponse)
+async def execute_command(request: ExecutionRequest):
+    """
+    Executes a command in a fresh, isolated container that is discarded afterwards.
+    The container comes from the warm pool, so the command does not wait for it to start.
+    Requests wait their turn in the admission queue (429 with Retry-After when it is full).
+    """
+    user_id = request.user_id or "anonymous"
+    _check_quota(user_id)
+    registry = _require_registry()
+    async with _admitted(user_id):
+        try:
+            container = await run_in_threadpool(registry.acquire)
+        except docker.errors.ImageNotFound:
+            raise HTTPException(status_code=500, detail=f"Sandbox image '{SANDBOX_IMAGE}' not found.")
+        except docker.errors.DockerException as e:
+            raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+        execution = _execution(container, request, "oneoff")
+        try:
+            return _response(await run_in_threadpool(execution.run))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+        finally:
+            await run_in_threadpool(registry.remove, container)
+            _account(user_id, None, execution)
@@ -0,0 +1,23 @@
+# sandbox_manager/tests/conftest.py
+import pytest
+
+from tests.fake_docker import FakeDockerClient
+
+
+@pytest.fixture(scope="session")
+def docker_client():
+    """A client for the local Docker daemon; tests that need one are skipped without it."""
+    docker = pytest.importorskip("docker")
+    try:
+        client = docker.from_env()
+        client.ping()
+    except Exception as e:
+        pytest.skip(f"no Docker daemon: {e}")
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def fake_docker():
+    """An in-memory Docker client; see tests/fake_docker.py."""
+    return FakeDockerClient()
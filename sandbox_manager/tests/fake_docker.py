@@ -0,0 +1,107 @@
+# sandbox_manager/tests/fake_docker.py
+import re
+import time
+import uuid
+import itertools
+import threading
+from typing import Dict, List, Optional
+
+
+class FakeContainer:
+    def __init__(self, client: "FakeDockerClient", image: str, labels: Optional[Dict] = None):
+        self.client = client
+        self.id = uuid.uuid4().hex
+        self.status = "running"
+        self.labels = labels or {}
+        self.attrs = {"Config": {"Image": image}}
+
+    def reload(self):
+        if self.id not in self.client.containers.by_id:
+            raise FakeNotFound(self.id)
+
+    def start(self):
+        self.status = "running"
+
+    def exec_run(self, cmd, **kwargs):
+        return 0, b""
+
+    def remove(self, force: bool = False):
+        self.client.containers.by_id.pop(self.id, None)
+
+
+class FakeNotFound(Exception):
+    pass
+
+
+class _Containers:
+    def __init__(self, client: "FakeDockerClient"):
+        self.client = client
+        self.by_id: Dict[str, FakeContainer] = {}
+
+    def run(self, image: str, command=None, detach: bool = False, labels=None, **kwargs):
+        time.sleep(self.client.start_delay)
+        container = FakeContainer(self.client, image, labels)
+        self.by_id[container.id] = container
+        return container
+
+    def create(self, image: str, command=None, labels=None, **kwargs):
+        container = FakeContainer(self.client, image, labels)
+        container.status = "created"
+        self.by_id[container.id] = container
+        return container
+
+    def list(self, all: bool = False, filters=None) -> List[FakeContainer]:
+        return list(self.by_id.values())
+
+
+class _Api:
+    def __init__(self, client: "FakeDockerClient"):
+        self.client = client
+        self.execs: Dict[str, Dict] = {}
+        self._cpu = itertools.count(step=10_000_000)
+
+    def exec_create(self, container_id: str, cmd, **kwargs) -> Dict:
+        exec_id = uuid.uuid4().hex
+        self.execs[exec_id] = {"container": container_id, "command": cmd[-1]}
+        return {"Id": exec_id}
+
+    def exec_start(self, exec_id: str, stream: bool = True, demux: bool = True):
+        command = self.execs[exec_id]["command"]
+        with self.client._lock:
+            self.client.running += 1
+            self.client.max_running = max(self.client.max_running, self.client.running)
+        try:
+            match = re.search(r"sleep ([\d.]+)", command)
+            time.sleep(float(match.group(1)) if match else 0)
+            yield (f"{command}\n".encode(), None)
+        finally:
+            with self.client._lock:
+                self.client.running -= 1
+                self.client.executed.append(command)
+
+    def exec_inspect(self, exec_id: str) -> Dict:
+        return {"ExitCode": 0}
+
+    def stats(self, container_id: str, stream: bool = False, one_shot: bool = True) -> Dict:
+        return {
+            "cpu_stats": {"cpu_usage": {"total_usage": next(self._cpu)}},
+            "memory_stats": {"usage": 32 * 1024 * 1024, "limit": 256 * 1024 * 1024, "stats": {}},
+        }
+
+
+class FakeDockerClient:
+    """
+    The parts of the Docker SDK the manager uses, in memory. Commands containing
+    `sleep N` take N seconds; nothing else takes time except `start_delay` per
+    container. Records how many execs ran at once (`max_running`) and in what
+    order they finished (`executed`), for deterministic load tests.
+    """
+
+    def __init__(self, start_delay: float = 0.0):
+        self.start_delay = start_delay
+        self.containers = _Containers(self)
+        self.api = _Api(self)
+        self.running = 0
+        self.max_running = 0
+        self.executed: List[str] = []
+        self._lock = threading.Lock()
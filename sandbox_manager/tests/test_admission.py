@@ -0,0 +1,88 @@
+# sandbox_manager/tests/test_admission.py
+#
+# Deterministic load tests against the fake Docker client: one user bursts a dozen
+# commands while two others send a couple each.
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import pytest
+
+import execution
+from admission import AdmissionController, AdmissionRejected
+from execution import ExecutionStream
+
+JOB = "sleep 0.2"
+JOB_SECONDS = 0.2
+
+
+@pytest.fixture(autouse=True)
+def log_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(execution, "LOG_DIR", str(tmp_path))
+
+
+def load(controller: Optional[AdmissionController], client, burst: int = 12):
+    """Alice sends `burst` commands at once, Bob and Carol two each just after. Returns admission order, waits and rejections."""
+    order, waits, rejected = [], {}, []
+
+    async def request(user_id: str, delay: float):
+        await asyncio.sleep(delay)
+        started = time.monotonic()
+
+        async def work():
+            order.append(user_id)
+            waits.setdefault(user_id, []).append(time.monotonic() - started)
+            container = await asyncio.to_thread(client.containers.run, "sandbox", detach=True)
+            await asyncio.to_thread(ExecutionStream(client, container, JOB, 30).run)
+            container.remove()
+
+        try:
+            if controller is None:
+                await work()
+            else:
+                async with controller.slot(user_id):
+                    await work()
+        except AdmissionRejected as e:
+            rejected.append((user_id, e.retry_after))
+
+    async def run():
+        # Like FastAPI's threadpool for sync endpoints: big enough not to be the limit.
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=40))
+        requests = [request("alice", 0) for _ in range(burst)]
+        requests += [request(user, 0.01) for user in ("bob", "carol") for _ in range(2)]
+        await asyncio.gather(*requests)
+
+    asyncio.run(run())
+    return order, waits, rejected
+
+
+def test_without_admission_control_everything_runs_at_once(fake_docker):
+    load(None, fake_docker)
+    assert fake_docker.max_running == 16
+
+
+def test_a_burst_waits_behind_its_own_requests(fake_docker):
+    controller = AdmissionController(capacity=3, max_queued=32, max_queued_per_user=8, deadline=10)
+    order, waits, rejected = load(controller, fake_docker)
+    assert fake_docker.max_running <= 3
+    # Bob and Carol are served within the next round-robin turns, not after Alice's burst.
+    assert order[:9] == ["alice"] * 4 + ["bob", "carol", "alice", "bob", "carol"]
+    assert max(waits["bob"] + waits["carol"]) < 3 * JOB_SECONDS
+    # Three of Alice's twelve run at once, eight may wait, the twelfth is turned away.
+    assert rejected and all(user == "alice" and retry >= 1 for user, retry in rejected)
+    assert controller.metrics()["queue_wait_seconds"]
+
+
+def test_weighted_users_are_admitted_more_per_turn(fake_docker):
+    controller = AdmissionController(capacity=3, max_queued=32, max_queued_per_user=8, deadline=10, weights={"bob": 2})
+    order, _, _ = load(controller, fake_docker, burst=6)
+    # After the three that start at once: one of Alice's, then Bob's two in one turn, then Carol.
+    assert order[3:7] == ["alice", "bob", "bob", "carol"]
+
+
+def test_requests_past_the_deadline_are_turned_away(fake_docker):
+    controller = AdmissionController(capacity=1, max_queued=32, max_queued_per_user=32, deadline=0.5)
+    _, _, rejected = load(controller, fake_docker, burst=6)
+    assert controller.stats["rejected_deadline"] == len(rejected) > 0
+    assert controller.running == 0 and controller.queued == 0
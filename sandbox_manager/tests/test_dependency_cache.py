@@ -0,0 +1,59 @@
+# sandbox_manager/tests/test_dependency_cache.py
+#
+# Which installs count towards the baked image, and time to first import of common
+# packages in three setups: a plain container that downloads them from PyPI, a
+# network-less container installing from the wheelhouse, and the baked image.
+import os
+
+import pytest
+
+pytest.importorskip("docker")
+import dependency_cache
+from dependency_cache import DependencyCache, installed_packages
+
+PACKAGES = ["numpy", "pandas", "requests", "matplotlib"]
+
+
+@pytest.fixture(autouse=True)
+def stats_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(dependency_cache, "STATS_PATH", str(tmp_path / "install-counts.json"))
+
+
+@pytest.mark.parametrize("command, packages", [
+    ("pip install -q numpy 'pandas>=2'", ["numpy", "pandas"]),
+    ("cd /work && python3 -m pip install --user -r reqs.txt Scikit_Learn", ["scikit-learn"]),
+    ("pip3 install -i https://example.org/simple ./local.whl git+https://x/y.git", []),
+    ("pip install requests; pip3 install numpy", ["requests", "numpy"]),
+])
+def test_installed_packages_are_read_from_commands(command, packages):
+    assert installed_packages(command) == packages
+
+
+def test_only_approved_packages_installed_by_enough_users_are_baked(monkeypatch):
+    monkeypatch.setattr(dependency_cache, "BAKE_MIN_INSTALLS", 3)
+    monkeypatch.setattr(dependency_cache, "APPROVED_PACKAGES", ["polars"])
+    cache = DependencyCache(client=None, base_image="sandbox:latest")
+    for user in range(3):
+        cache.observe(f"user-{user}", "pip install polars numpy", 0)
+        cache.observe(f"user-{user}", "pip install totally-not-malware", 0)
+    # One user installing again, or a failed install, adds nothing.
+    cache.observe("user-0", "pip install pandas", 0)
+    cache.observe("user-0", "pip install pandas", 0)
+    cache.observe("user-1", "pip install pandas", 1)
+    assert "numpy" in dependency_cache.SEED_PACKAGES
+    assert cache.popular() == ["numpy", "polars"]
+
+    cache.save()
+    assert DependencyCache(client=None, base_image="sandbox:latest").popular() == ["numpy", "polars"]
+
+
+def test_baked_images_import_without_installing(docker_client):
+    base = os.getenv("SANDBOX_IMAGE", "your-dockerhub-username/sandbox-image:latest")
+    cache = DependencyCache(docker_client, base)
+    cache.seed_wheelhouse(PACKAGES)
+    baked = cache.bake(PACKAGES)
+    for package in PACKAGES:
+        cold = cache.time_to_first_import(base, [package], install=True, network=True, wheelhouse=False)
+        warm = cache.time_to_first_import(base, [package], install=True)
+        ready = cache.time_to_first_import(baked, [package])
+        assert ready < warm and ready < cold, (package, cold, warm, ready)